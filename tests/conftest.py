@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -33,6 +35,22 @@ assert any(app in INSTALLED_APPS for app in ['posts.apps.PostsConfig', 'posts'])
     'Пожалуйста зарегистрируйте приложение в `settings.INSTALLED_APPS`'
 )
 
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_cache():
+    # Свой файл кеша на запуск: cache.clear() не трогает кеш сайта.
+    from core.testing import isolated_caches
+    with isolated_caches():
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Общий кеш страниц переживает очистку базы между тестами.
+    from django.core.cache import cache
+    cache.clear()
+
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
@@ -0,0 +1,20 @@
+"""SQLite для шардов постов (posts.shards).
+
+В шарде нет таблиц пользователей и групп, на которые ссылаются посты,
+поэтому таблицы создаются без внешних ключей. Основная база их
+сохраняет: ссылки проверяются там, где живут обе таблицы.
+"""
+from django.db.backends.sqlite3 import base, features, schema
+
+
+class DatabaseFeatures(features.DatabaseFeatures):
+    supports_foreign_keys = False
+
+
+class DatabaseSchemaEditor(schema.DatabaseSchemaEditor):
+    sql_create_inline_fk = None
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    features_class = DatabaseFeatures
+    SchemaEditorClass = DatabaseSchemaEditor
@@ -0,0 +1,239 @@
+"""Общий для всех процессов хоста кеш в файле SQLite.
+
+LocMemCache живёт внутри процесса: у каждого воркера свой кеш, свои
+промахи и своя копия версий, и сброс версии в одном воркере не виден
+остальным. Этот бэкенд хранит записи в одном файле SQLite в режиме
+WAL: читатели не блокируют писателя, а все воркеры видят одни и те же
+ключи. Целые числа хранятся как INTEGER, и incr() увеличивает их
+в транзакции записи, атомарно между процессами. Лишние записи вытесняются
+по времени последнего чтения (LRU), просроченные — по expires.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Время чтения обновляется не чаще раза в минуту, чтобы get()
+# не превращался в запись на каждом обращении.
+ACCESS_RESOLUTION = 60
+# Как часто (в записях на процесс) проверять размер кеша.
+CULL_EVERY = 100
+# Лимит переменных в одном запросе у старых сборок SQLite.
+MAX_PARAMS = 900
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+    'expires REAL, accessed REAL NOT NULL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+ALIVE = '(expires IS NULL OR expires > ?)'
+
+
+class SQLiteCache(BaseCache):
+    """Кеш Django поверх файла SQLite в режиме WAL.
+
+    LOCATION — путь к файлу базы. OPTIONS: MAX_ENTRIES и CULL_FREQUENCY
+    как у встроенных бэкендов, BUSY_TIMEOUT — сколько секунд ждать
+    блокировку записи другого процесса.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # Соединение своё у каждого потока и процесса: после fork
+        # унаследованное соединение SQLite использовать нельзя.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            local.db, local.pid, local.writes = db, os.getpid(), 0
+        return local.db
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _keys(self, keys, version):
+        key_map = {}
+        for key in keys:
+            made = self.make_key(key, version=version)
+            self.validate_key(made)
+            key_map[made] = key
+        return key_map
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        key_map = self._keys(keys, version)
+        made = list(key_map)
+        now = time.time()
+        result, stale = {}, []
+        for start in range(0, len(made), MAX_PARAMS):
+            batch = made[start:start + MAX_PARAMS]
+            rows = self._db.execute(
+                'SELECT key, value, accessed FROM cache WHERE key IN '
+                f'({", ".join("?" * len(batch))}) AND {ALIVE}',
+                (*batch, now),
+            )
+            for made_key, value, accessed in rows:
+                result[key_map[made_key]] = self._decode(value)
+                if accessed < now - ACCESS_RESOLUTION:
+                    stale.append(made_key)
+        if stale:
+            self._db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                ((now, made_key) for made_key in stale),
+            )
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        key_map = self._keys(data, version)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                (
+                    (made, self._encode(data[key]), expires, now)
+                    for made, key in key_map.items()
+                ),
+            )
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        self._wrote(len(key_map))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        now = time.time()
+        # Просроченная запись считается отсутствующей и перезаписывается.
+        changed = self._db.execute(
+            'INSERT INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (made, self._encode(value), self.get_backend_timeout(timeout),
+             now, now),
+        ).rowcount
+        self._wrote(changed)
+        return changed == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        return self._db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {ALIVE}',
+            (self.get_backend_timeout(timeout), made, time.time()),
+        ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {ALIVE}',
+                (made, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            if not isinstance(row[0], int):
+                raise TypeError('Значение не целое число: %r' % key)
+            db.execute(
+                'UPDATE cache SET value = value + ? WHERE key = ?',
+                (delta, made),
+            )
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return row[0] + delta
+
+    def has_key(self, key, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        return self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (made, time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        made = list(self._keys(keys, version))
+        for start in range(0, len(made), MAX_PARAMS):
+            batch = made[start:start + MAX_PARAMS]
+            self._db.execute(
+                'DELETE FROM cache WHERE key IN '
+                f'({", ".join("?" * len(batch))})',
+                batch,
+            )
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _wrote(self, count):
+        local = self._local
+        local.writes += count
+        if local.writes >= CULL_EVERY:
+            local.writes = 0
+            self._cull()
+
+    def _cull(self):
+        db = self._db
+        db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (time.time(),),
+        )
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+        # Как и встроенные бэкенды, освобождаем место с запасом:
+        # удаляем 1/CULL_FREQUENCY записей, давно не читавшихся.
+        excess = count - self._max_entries
+        db.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY accessed LIMIT ?)',
+            (excess + self._max_entries // self._cull_frequency,),
+        )
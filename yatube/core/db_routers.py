@@ -0,0 +1,105 @@
+"""Чтение с реплик, запись в основную базу.
+
+Запросы на чтение расходятся по случайной реплике из
+DATABASE_REPLICAS, запись и всё внутри транзакции идёт в 'default'.
+Реплика может отставать, поэтому после записи запрос до конца
+читает из основной базы, а PrimaryPinMiddleware ставит cookie,
+и следующие REPLICA_STICKY_SECONDS секунд запросы этого
+пользователя тоже читают из неё: свой новый пост или комментарий
+он видит сразу.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def start(pinned=False):
+    """Начинает учёт записей (на время запроса); вернёт токен для
+    finish()."""
+    return _state.set(RoutingState(pinned))
+
+
+def finish(token):
+    _state.reset(token)
+
+
+def wrote():
+    state = _state.get()
+    return state is not None and state.wrote
+
+
+def pinned():
+    """Читает ли текущий запрос из основной базы."""
+    state = _state.get()
+    return state is not None and state.pinned
+
+
+@contextmanager
+def use_primary():
+    """Все чтения внутри блока идут в основную базу.
+
+    Блоки можно вкладывать: на выходе восстанавливается прежнее
+    состояние, но запись внутри блока закрепляет запрос за основной
+    базой и после него.
+    """
+    state = _state.get()
+    if state is None:
+        token = start(pinned=True)
+        try:
+            yield
+        finally:
+            finish(token)
+        return
+    previous = state.pinned
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = previous or state.wrote
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Транзакция должна видеть свои же изменения.
+            return DEFAULT_DB_ALIAS
+        aliases = replicas()
+        if not aliases:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            # Реплики получают схему копией основной базы.
+            return False
+        return None
@@ -0,0 +1,59 @@
+"""Персональные вставки в общие закешированные страницы.
+
+Общая копия страницы одинакова для всех посетителей, а всё, что
+зависит от пользователя, выносится в «дыры»: при рендере для кеша
+тег {% hole %} оставляет на своём месте метку, и перед отдачей метки
+заменяются шаблонами, отрисованными для текущего запроса.
+"""
+import json
+import re
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+PUNCH_ATTR = '_punch_holes'
+MARKER = '<!--hole:{}-->'
+MARKER_RE = re.compile(r'<!--hole:(\[.*?\])-->')
+
+_registry = {}
+
+
+def register(name, template_name):
+    """Регистрирует дыру: шаблон и функцию контекста (request, **kwargs).
+
+    Аргументы дыры попадают в метку на закешированной странице,
+    поэтому это должны быть простые значения, а не объекты моделей.
+    """
+    def decorator(func):
+        _registry[name] = (template_name, func)
+        return func
+    return decorator
+
+
+def render(request, name, kwargs):
+    template_name, func = _registry[name]
+    return render_to_string(
+        template_name, func(request, **kwargs), request=request
+    )
+
+
+def punch(request, name, kwargs):
+    """Метка для общей копии страницы или сразу готовый фрагмент."""
+    if getattr(request, PUNCH_ATTR, False):
+        return mark_safe(
+            MARKER.format(json.dumps([name, kwargs], sort_keys=True))
+        )
+    return mark_safe(render(request, name, kwargs))
+
+
+def fill(request, content):
+    """Заменяет метки дыр фрагментами для текущего запроса."""
+    def replace(match):
+        name, kwargs = json.loads(match.group(1))
+        return render(request, name, kwargs)
+    return MARKER_RE.sub(replace, content)
+
+
+@register('header', 'includes/header.html')
+def header(request):
+    return {}
@@ -0,0 +1,189 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import sqlite
+from posts.models import Comment, Group, Post
+
+READ_SQL = (
+    'SELECT id, text, pub_date, author_id, group_id FROM posts_post '
+    'WHERE group_id = ? ORDER BY pub_date DESC, id DESC LIMIT 11'
+)
+WRITE_SQL = (
+    'INSERT INTO posts_comment (text, post_id, author_id, created) '
+    "VALUES ('Комментарий', ?, ?, datetime('now'))"
+)
+COUNT_SQL = (
+    'UPDATE posts_post SET comment_count = comment_count + 1 WHERE id = ?'
+)
+
+
+class Worker(threading.Thread):
+    def __init__(self, path, profile, deadline, write, options, seed):
+        super().__init__()
+        self.path = path
+        self.profile = profile
+        self.deadline = deadline
+        self.write = write
+        self.options = options
+        self.random = random.Random(seed)
+        self.timings = []
+        self.errors = 0
+
+    def connect(self):
+        # Таймаут модуля sqlite3 по умолчанию, как у Django без OPTIONS.
+        db = sqlite3.connect(self.path, isolation_level=None)
+        if self.profile is not None:
+            sqlite.apply_pragmas(db, self.profile)
+        return db
+
+    def run(self):
+        persistent = self.profile is not None
+        db = self.connect() if persistent else None
+        while time.perf_counter() < self.deadline:
+            started = time.perf_counter()
+            current = db or self.connect()
+            try:
+                self.operation(current)
+            except sqlite3.OperationalError:
+                # database is locked: запрос пользователя упал бы с 500.
+                self.errors += 1
+                if current.in_transaction:
+                    current.execute('ROLLBACK')
+            else:
+                self.timings.append(time.perf_counter() - started)
+            finally:
+                if not persistent:
+                    current.close()
+        if db is not None:
+            db.close()
+
+    def operation(self, db):
+        if not self.write:
+            db.execute(
+                READ_SQL,
+                (self.random.randint(1, self.options['groups']),),
+            ).fetchall()
+            return
+        post = self.random.randint(1, self.options['posts'])
+        db.execute('BEGIN IMMEDIATE')
+        db.execute(WRITE_SQL, (post, 1))
+        db.execute(COUNT_SQL, (post,))
+        db.execute('COMMIT')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite при одновременных '
+        'чтениях и записях с настройками по умолчанию и с SQLITE_PRAGMAS '
+        'и долгими соединениями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument(
+            '--seconds', type=float, default=5,
+            help='Длительность каждого замера.',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            self.populate(path, options)
+            # До: настройки SQLite и Django по умолчанию — журнал отката
+            # и новое соединение на каждый запрос.
+            for title, profile in (
+                ('до', None),
+                ('после', sqlite.pragmas()),
+            ):
+                # Режим журнала хранится в файле базы.
+                journal = (profile or {}).get('journal_mode', 'delete')
+                with closing(sqlite3.connect(path)) as db:
+                    sqlite.apply_pragmas(db, {'journal_mode': journal})
+                self.report(title, self.measure(path, profile, options))
+
+    def populate(self, path, options):
+        with connection.schema_editor(collect_sql=True) as editor:
+            for model in (Group, Post, Comment):
+                editor.create_model(model)
+        rng = random.Random(options['seed'])
+        with closing(sqlite3.connect(path)) as db:
+            for sql in editor.collected_sql:
+                db.execute(sql)
+            db.executemany(
+                'INSERT INTO posts_group (id, title, slug, description) '
+                'VALUES (?, ?, ?, ?)',
+                (
+                    (pk, f'Группа {pk}', f'group-{pk}', '')
+                    for pk in range(1, options['groups'] + 1)
+                ),
+            )
+            db.executemany(
+                'INSERT INTO posts_post (id, text, pub_date, author_id, '
+                'group_id, image, comment_count, image_format) '
+                "VALUES (?, ?, datetime('2020-01-01', ? || ' minutes'), "
+                "?, ?, '', 0, '')",
+                (
+                    (
+                        pk, f'Пост {pk}', pk, rng.randint(1, 1000),
+                        rng.randint(1, options['groups']),
+                    )
+                    for pk in range(1, options['posts'] + 1)
+                ),
+            )
+            db.execute('ANALYZE')
+            db.commit()
+
+    def measure(self, path, profile, options):
+        deadline = time.perf_counter() + options['seconds']
+        workers = [
+            Worker(
+                path, profile, deadline, write, options,
+                options['seed'] + number,
+            )
+            for number, write in enumerate(
+                [False] * options['readers'] + [True] * options['writers'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        results = {}
+        for kind, write in (('чтения', False), ('записи', True)):
+            group = [worker for worker in workers if worker.write == write]
+            timings = [t for worker in group for t in worker.timings]
+            results[kind] = (
+                len(timings) / options['seconds'],
+                _percentile(timings, 0.5),
+                _percentile(timings, 0.95),
+                sum(worker.errors for worker in group),
+            )
+        return results
+
+    def report(self, title, results):
+        self.stdout.write(f'\n{title}')
+        for kind, (rate, median, p95, errors) in results.items():
+            self.stdout.write(
+                f'  {kind}: {rate:.0f} оп/с, медиана {median * 1000:.2f} мс, '
+                f'p95 {p95 * 1000:.2f} мс, ошибок блокировки: {errors}'
+            )
+
+
+def _percentile(timings, fraction):
+    if not timings:
+        return 0
+    if len(timings) < 2:
+        return timings[0]
+    return statistics.quantiles(timings, n=100)[int(fraction * 100) - 1]
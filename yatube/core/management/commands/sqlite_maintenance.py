@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.template.defaultfilters import filesizeformat
+
+from core import sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        'Обслуживание базы SQLite: статистика планировщика (ANALYZE), '
+        'возврат свободных страниц (incremental_vacuum) и сброс WAL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--analysis-limit', type=int, default=1000,
+            help='Сколько строк индекса смотрит ANALYZE (0 — все).',
+        )
+        parser.add_argument(
+            '--vacuum-pages', type=int, default=0,
+            help='Сколько страниц освободить за проход (0 — все).',
+        )
+        parser.add_argument(
+            '--enable-incremental-vacuum', action='store_true',
+            help='Один раз перевести базу в auto_vacuum=INCREMENTAL '
+                 '(полный VACUUM, запись на это время заблокирована).',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые N секунд (0 — один раз).',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда обслуживает только базы SQLite.')
+        if options['enable_incremental_vacuum']:
+            with connection.cursor() as cursor:
+                sqlite.enable_incremental_vacuum(cursor)
+            self.stdout.write('Включён auto_vacuum=INCREMENTAL.')
+        while True:
+            self.run(connection, options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def run(self, connection, options):
+        started = time.monotonic()
+        with connection.cursor() as cursor:
+            before = sqlite.stats(cursor)
+            sqlite.analyze(cursor, options['analysis_limit'])
+            vacuumed = sqlite.incremental_vacuum(
+                cursor, options['vacuum_pages'])
+            sqlite.checkpoint(cursor)
+            after = sqlite.stats(cursor)
+        if not vacuumed and before['free']:
+            self.stderr.write(
+                'auto_vacuum выключен, свободное место не освобождено: '
+                'запустите с --enable-incremental-vacuum.'
+            )
+        self.stdout.write(
+            f'База: {filesizeformat(after["size"])}, '
+            f'освобождено: {filesizeformat(before["size"] - after["size"])}, '
+            f'за {time.monotonic() - started:.2f} с'
+        )
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import db_routers
+
+
+def copy_sqlite(source, target):
+    """Согласованный снимок базы source в файл target.
+
+    Снимок пишется во временный файл и подменяет target атомарно:
+    открытые соединения дочитывают старую копию, новые видят новую.
+    Режим WAL копируется вместе с заголовком базы, поэтому снимок
+    переводится в журнал отката: WAL-файл рядом с target остался бы
+    от предыдущей копии.
+    """
+    temp = f'{target}.sync'
+    with closing(sqlite3.connect(source)) as src, \
+            closing(sqlite3.connect(temp)) as dst:
+        src.backup(dst)
+        dst.execute('PRAGMA journal_mode = DELETE')
+    os.replace(temp, target)
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплики из DATABASE_REPLICAS '
+        '(для проверки чтения с реплик на своей машине).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять копирование каждые N секунд (0 — один раз).',
+        )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Копировать можно только базу SQLite.')
+        aliases = db_routers.replicas()
+        if not aliases:
+            raise CommandError('DATABASE_REPLICAS пуст: задайте DB_REPLICAS.')
+        while True:
+            started = time.monotonic()
+            for alias in aliases:
+                copy_sqlite(
+                    primary['NAME'], connections[alias].settings_dict['NAME'])
+            self.stdout.write(
+                f'Реплик обновлено: {len(aliases)} '
+                f'за {time.monotonic() - started:.2f} с'
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,114 @@
+"""Отдача файлов из MEDIA_ROOT.
+
+static() из Django работает только при DEBUG и не знает ни Range, ни
+долгого кеширования. Здесь файл отдаётся с ETag и Last-Modified,
+с поддержкой одного диапазона байтов (видео и докачка) и с вечным
+Cache-Control для файлов, чьё имя — хеш содержимого: оригиналы
+постов, миниатюры sorl и варианты /img/ никогда не меняются под тем
+же именем.
+
+С MEDIA_SENDFILE = 'x-accel-redirect' (nginx) или 'x-sendfile'
+(Apache, lighttpd) Python только проверяет запрос и ставит заголовки,
+а сам файл — вместе с диапазонами — отдаёт прокси.
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.utils.http import http_date, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+# Хеш в имени файла или каталога: sha256 у оригиналов, md5 у sorl;
+# варианты /img/ (resized/) и миниатюры sorl (cache/) лежат под
+# префиксами и строятся из неизменных оригиналов.
+HASHED_NAME_RE = re.compile(
+    r'^(resized|cache)/|(^|/)[0-9a-f]{32,}\.\w+(/|$)')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MAX_AGE = 60 * 60
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def cache_control(path):
+    if HASHED_NAME_RE.search(path):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={MAX_AGE}'
+
+
+def content_type(path):
+    guessed, encoding = mimetypes.guess_type(path)
+    if encoding:
+        # Сжатый файл отдаём как есть, а не как распакованный.
+        return 'application/octet-stream'
+    return guessed or 'application/octet-stream'
+
+
+def parse_range(header, size):
+    """(начало, конец включительно) из заголовка Range.
+
+    None — заголовка нет или он не разобран, в том числе начало
+    больше конца (отдаём файл целиком, как и при нескольких
+    диапазонах); ValueError — начало за пределами файла (416).
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-500: последние 500 байт.
+        length = int(last)
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and start > int(last):
+        return None
+    if start >= size:
+        raise ValueError(header)
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def range_applies(request, stat):
+    """Range учитывается, только если If-Range совпадает с файлом."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/"')):
+        return if_range == etag(stat)
+    modified = parse_http_date_safe(if_range)
+    return modified is not None and int(stat.st_mtime) <= modified
+
+
+def file_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile_mode():
+    return getattr(settings, 'MEDIA_SENDFILE', None)
+
+
+def sendfile_headers(path, full_path):
+    """Заголовок, которым прокси забирает отдачу файла себе."""
+    mode = sendfile_mode()
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        return {'X-Accel-Redirect': prefix + quote(path)}
+    if mode == 'x-sendfile':
+        return {'X-Sendfile': full_path}
+    raise ValueError(f'Неизвестный MEDIA_SENDFILE: {mode}')
+
+
+def last_modified(stat):
+    return http_date(stat.st_mtime)
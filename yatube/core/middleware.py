@@ -0,0 +1,33 @@
+from django.conf import settings
+
+from . import db_routers
+
+STICKY_COOKIE = 'use_primary'
+STICKY_SECONDS = 10
+
+
+class PrimaryPinMiddleware:
+    """Держит чтения пользователя на основной базе после его записи.
+
+    Должен стоять выше SessionMiddleware, чтобы учитывались и записи
+    сессии при входе на сайт.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = db_routers.start(pinned=STICKY_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if db_routers.wrote():
+                response.set_cookie(
+                    STICKY_COOKIE, '1',
+                    max_age=getattr(
+                        settings, 'REPLICA_STICKY_SECONDS', STICKY_SECONDS),
+                    httponly=True,
+                    samesite='Lax',
+                )
+        finally:
+            db_routers.finish(token)
+        return response
@@ -0,0 +1,172 @@
+"""Картинки нужного размера по подписанной ссылке.
+
+Размер задаётся в адресе: /img/<подпись>/<ШxВ>/<путь в MEDIA_ROOT>.
+Вариант строится при первом запросе, кладётся на диск рядом
+с другими вариантами того же файла (resized/<путь>/<ШxВ>.webp)
+и дальше отдаётся оттуда файлом; по пути варианта сборщик мусора
+(gc_media) узнаёт исходный файл. Подпись ставит только сервер
+(resized_url), поэтому посторонний не может заказать произвольные
+размеры и забить диск вариантами.
+
+Одновременные промахи по одному ключу строят вариант один раз:
+потоки процесса ждут общую блокировку ключа, процессы — flock
+на файле блокировки рядом с вариантом, который после построения
+удаляется.
+"""
+import fcntl
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare
+from PIL import Image, ImageOps
+
+GEOMETRY_RE = re.compile(r'^(\d+)x(\d+)$')
+MAX_SIDE = 2000
+# Источник адресуется по содержимому и не меняется, так что вариант
+# можно кешировать в браузере навсегда.
+CACHE_MAX_AGE = 365 * 24 * 60 * 60
+OPTIONS = {'format': 'WEBP', 'quality': 80}
+
+signer = Signer(salt='core.resize')
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def parse_geometry(geometry):
+    """(ширина, высота) из строки «ШxВ» или None, если размер
+    не разобрать или он больше RESIZED_IMAGE_MAX_SIDE."""
+    match = GEOMETRY_RE.match(geometry)
+    if not match:
+        return None
+    size = tuple(int(side) for side in match.groups())
+    max_side = getattr(settings, 'RESIZED_IMAGE_MAX_SIDE', MAX_SIDE)
+    if not all(0 < side <= max_side for side in size):
+        return None
+    return size
+
+
+def sign(geometry, name):
+    return signer.signature(f'{geometry}/{name}')
+
+
+def check_signature(signature, geometry, name):
+    return constant_time_compare(signature, sign(geometry, name))
+
+
+def resized_url(name, geometry):
+    """Подписанная ссылка на вариант файла name размера geometry."""
+    if parse_geometry(geometry) is None:
+        raise ValueError(f'Недопустимый размер: {geometry}')
+    return reverse(
+        'core:resized_image', args=[sign(geometry, name), geometry, name])
+
+
+def cache_root():
+    return getattr(
+        settings, 'RESIZED_IMAGE_ROOT',
+        os.path.join(settings.MEDIA_ROOT, 'resized'),
+    )
+
+
+def cache_path(geometry, name):
+    # Исходные имена уже разложены по каталогам хранилища (core.storage).
+    return safe_join(cache_root(), name, f'{geometry}.webp')
+
+
+def source_name(path):
+    """Исходный файл для пути варианта (или его блокировки)
+    относительно cache_root()."""
+    return os.path.dirname(path).replace(os.sep, '/')
+
+
+@contextmanager
+def key_lock(path):
+    """Блокировка одного ключа для потоков и процессов."""
+    with _locks_guard:
+        lock, users = _locks.get(path, (threading.Lock(), 0))
+        _locks[path] = (lock, users + 1)
+    try:
+        with lock, file_lock(path + '.lock'):
+            yield
+    finally:
+        with _locks_guard:
+            lock, users = _locks[path]
+            if users == 1:
+                del _locks[path]
+            else:
+                _locks[path] = (lock, users - 1)
+
+
+@contextmanager
+def file_lock(lock_path):
+    """flock на файле блокировки, который удаляется после работы.
+
+    Файл удаляется под блокировкой, поэтому ждавший процесс может
+    получить её на уже удалённом файле: тогда он открывает файл заново.
+    """
+    while True:
+        lock_file = open(lock_path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.path.samestat(
+                    os.stat(lock_path), os.fstat(lock_file.fileno())):
+                break
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+        lock_file.close()
+
+
+def get_or_create(geometry, name):
+    """Путь к готовому варианту; при промахе вариант строится.
+
+    Бросает FileNotFoundError, если исходного файла нет, и ValueError,
+    если его не декодировать как картинку или она больше предела
+    Pillow (Image.MAX_IMAGE_PIXELS).
+    """
+    path = cache_path(geometry, name)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with key_lock(path):
+        # Пока ждали блокировку, вариант мог построить другой запрос.
+        if not os.path.exists(path):
+            render(name, parse_geometry(geometry), path)
+    return path
+
+
+def render(name, size, path):
+    with default_storage.open(name) as source:
+        try:
+            with Image.open(source) as image:
+                image = ImageOps.exif_transpose(image)
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'A' in image.getbands()
+                                          else 'RGB')
+                resized = ImageOps.fit(image, size, Image.LANCZOS)
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError) as error:
+            raise ValueError(f'Не удалось декодировать {name}') from error
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix='.resize-')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            resized.save(temp_file, **OPTIONS)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
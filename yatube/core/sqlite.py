@@ -0,0 +1,101 @@
+"""Настройка соединений SQLite под боевую нагрузку и обслуживание базы.
+
+Каждое новое соединение получает прагмы из SQLITE_PRAGMAS: журнал
+WAL (читатели не ждут писателя), synchronous=NORMAL (в WAL не теряет
+целостность, только последние транзакции при отключении питания),
+ожидание чужой блокировки вместо немедленной ошибки, кеш страниц и
+отображение файла в память. Соединения живут CONN_MAX_AGE секунд,
+так что прагмы выполняются один раз на соединение, а не на запрос.
+
+Реплики — снимки, которые sync_replicas подменяет целиком. Снимок
+переводится в журнал отката, а режим журнала у соединений реплик
+не трогается: рядом со снимком не остаётся WAL-файла, который
+относился бы к предыдущей копии.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from . import db_routers
+
+# Прагмы, которые меняют файл базы, а не только соединение.
+WRITER_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+def pragmas(alias=DEFAULT_DB_ALIAS):
+    values = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if alias in db_routers.replicas():
+        for name in WRITER_PRAGMAS:
+            values.pop(name, None)
+        values['query_only'] = 'on'
+    return values
+
+
+def apply_pragmas(cursor, values):
+    for name, value in values.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: прагмы для соединений SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas(connection.alias))
+
+
+def _pragma(cursor, name):
+    cursor.execute(f'PRAGMA {name}')
+    return cursor.fetchone()[0]
+
+
+def stats(cursor):
+    """Размер базы и свободные страницы, байты."""
+    page_size = _pragma(cursor, 'page_size')
+    return {
+        'size': _pragma(cursor, 'page_count') * page_size,
+        'free': _pragma(cursor, 'freelist_count') * page_size,
+    }
+
+
+def analyze(cursor, limit=0):
+    """Обновляет статистику планировщика.
+
+    С limit > 0 ANALYZE смотрит не больше limit строк каждого индекса:
+    статистика приблизительная, но на большой базе обход занимает
+    миллисекунды вместо минут.
+    """
+    cursor.execute(f'PRAGMA analysis_limit = {int(limit)}')
+    cursor.execute('ANALYZE')
+    cursor.execute('PRAGMA optimize')
+
+
+def incremental_vacuum(cursor, pages=0):
+    """Возвращает свободные страницы файловой системе.
+
+    Работает только при auto_vacuum=INCREMENTAL; иначе возвращает
+    False и ничего не делает. pages=0 освобождает все.
+    """
+    if _pragma(cursor, 'auto_vacuum') != 2:
+        return False
+    # execute() модуля sqlite3 делает один шаг запроса, а прагма
+    # освобождает по странице за шаг: до конца её доводит только
+    # executescript().
+    cursor.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+    return True
+
+
+def enable_incremental_vacuum(cursor):
+    """Переводит базу в auto_vacuum=INCREMENTAL.
+
+    Требует полного VACUUM: база переписывается целиком, и всё это
+    время запись в неё заблокирована.
+    """
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    cursor.execute('VACUUM')
+
+
+def checkpoint(cursor):
+    """Переносит WAL в основной файл и обрезает журнал."""
+    if _pragma(cursor, 'journal_mode') == 'wal':
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        cursor.fetchall()
@@ -0,0 +1,97 @@
+"""Хранилище файлов с именами по содержимому.
+
+Имя файла — SHA-256 его содержимого, разложенный по вложенным
+каталогам (posts/ab/cd/abcd….jpg), поэтому один каталог не разрастается
+до миллионов записей, а повторная загрузка той же картинки получает
+то же имя и не занимает места. Учёт ссылок на общие файлы ведёт
+приложение (posts.blobs): само хранилище не знает, кто на файл
+ссылается.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_NAME = 'sha256'
+# Два уровня каталогов по два символа: 65536 листьев.
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+def content_hash(content):
+    """Хеш содержимого файла, прочитанного по частям.
+
+    Обработчик загрузки может посчитать хеш, пока файл приходит
+    по сети, и положить его в content.content_hash — тогда файл
+    не читается второй раз.
+    """
+    digest = getattr(content, 'content_hash', None)
+    if digest:
+        return digest
+    hasher = hashlib.new(HASH_NAME)
+    content.seek(0)
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def sharded_name(directory, digest, extension):
+    shards = [
+        digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+        for level in range(SHARD_LEVELS)
+    ]
+    return '/'.join(
+        part for part in (directory, *shards, digest + extension) if part
+    )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        """Имя, под которым save() сохранит content."""
+        directory, filename = os.path.split(name)
+        return sharded_name(
+            directory.replace('\\', '/'),
+            content_hash(content),
+            os.path.splitext(filename)[1].lower(),
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        try:
+            # Тот же файл уже лежит на диске. Обновляем время изменения:
+            # сборщик мусора не трогает свежие файлы, и старый файл
+            # доживёт до фиксации новой ссылки на него.
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            return self._save(name, content)
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл рядом и атомарно переименовываем:
+        # параллельная загрузка того же содержимого просто заменит
+        # файл идентичным.
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
@@ -0,0 +1,13 @@
+from django import template
+
+from core import resize
+
+register = template.Library()
+
+
+@register.simple_tag
+def resized_url(image, geometry):
+    """Подписанная ссылка на вариант картинки: {% resized_url post.image
+    '960x339' %}. Размер задаётся в шаблоне, вариант строится
+    при первом запросе."""
+    return resize.resized_url(getattr(image, 'name', image), geometry)
@@ -0,0 +1,46 @@
+"""Окружение тестов: общий кеш во временном файле.
+
+Тесты чистят кеш (cache.clear()), а файл из CACHES делят все процессы
+хоста. Без подмены тесты стирали бы кеш работающего сайта,
+а параллельные запуски мешали бы друг другу.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+SQLITE_CACHE = 'core.cache_backends.SQLiteCache'
+
+
+@contextmanager
+def isolated_caches():
+    """Кеши на core.cache_backends.SQLiteCache — в файлах своего
+    временного каталога."""
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    caches = {
+        alias: {
+            **config,
+            'LOCATION': os.path.join(directory, f'{alias}.sqlite3'),
+        } if config['BACKEND'] == SQLITE_CACHE else config
+        for alias, config in settings.CACHES.items()
+    }
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = isolated_caches()
+        self._caches.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
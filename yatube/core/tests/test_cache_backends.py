@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from ..cache_backends import SQLiteCache
+
+
+def make_cache(path, **options):
+    return SQLiteCache(path, {'OPTIONS': options})
+
+
+def bump(path, times):
+    cache = make_cache(path)
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = make_cache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_set_many(self):
+        """Значения любых типов читаются пачкой."""
+        self.cache.set_many({'a': 1, 'b': {'x': [1, 2]}, 'c': 'текст'})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c', 'd']),
+            {'a': 1, 'b': {'x': [1, 2]}, 'c': 'текст'},
+        )
+        self.cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_add_and_expiry(self):
+        """Просроченная запись не читается и уступает место add()."""
+        self.cache.set('key', 'old', 1)
+        self.assertFalse(self.cache.add('key', 'new'))
+        self.cache.touch('key', -1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr(self):
+        self.cache.set('counter', 10)
+        self.assertEqual(self.cache.incr('counter', 5), 15)
+        self.assertEqual(self.cache.decr('counter'), 14)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_processes_share_entries(self):
+        """Воркеры видят общие записи, а incr не теряет обновлений."""
+        self.cache.set('counter', 0, None)
+        context = get_context('fork')
+        workers = [
+            context.Process(target=bump, args=(self.path, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_least_recently_used_are_culled(self):
+        """Сверх MAX_ENTRIES вытесняются давно не читавшиеся записи."""
+        cache = make_cache(self.path, MAX_ENTRIES=100, CULL_FREQUENCY=4)
+        cache.set('hot', 'value')
+        cache._db.execute(
+            'UPDATE cache SET accessed = ?', (time.time() + 3600,))
+        cache.set_many({f'cold{i}': i for i in range(150)})
+        self.assertEqual(cache.get('hot'), 'value')
+        count = cache._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        self.assertLessEqual(count, 100)
+
+
+class TestCacheTests(SimpleTestCase):
+    def test_tests_use_temporary_cache_file(self):
+        """Тесты не трогают файл кеша из настроек проекта."""
+        location = caches['default']._path
+        self.assertNotEqual(
+            location, os.path.join(settings.BASE_DIR, 'cache.sqlite3'))
+        self.assertTrue(location.startswith(tempfile.gettempdir()))
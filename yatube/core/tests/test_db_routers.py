@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from posts.models import Post, User
+
+from .. import db_routers
+from ..management.commands.sync_replicas import copy_sqlite
+from ..middleware import STICKY_COOKIE, PrimaryPinMiddleware
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = db_routers.ReplicaRouter()
+
+    def test_reads_go_to_replica_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+
+    def test_reads_after_write_stay_on_primary(self):
+        token = db_routers.start()
+        try:
+            self.assertEqual(self.router.db_for_read(Post), 'replica')
+            self.router.db_for_write(Post)
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+            self.assertTrue(db_routers.wrote())
+        finally:
+            db_routers.finish(token)
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+
+    def test_use_primary(self):
+        with db_routers.use_primary():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_nested_use_primary_keeps_outer_state(self):
+        token = db_routers.start()
+        try:
+            with db_routers.use_primary():
+                with db_routers.use_primary():
+                    pass
+                self.assertEqual(self.router.db_for_read(Post), 'default')
+            self.assertEqual(self.router.db_for_read(Post), 'replica')
+            with db_routers.use_primary():
+                self.router.db_for_write(Post)
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+        finally:
+            db_routers.finish(token)
+
+    def test_sticky_cookie(self):
+        """После записи cookie держит следующие чтения на основной базе."""
+        factory = RequestFactory()
+        reads = []
+
+        def write_view(request):
+            self.router.db_for_write(Post)
+            return HttpResponse()
+
+        def read_view(request):
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = PrimaryPinMiddleware(write_view)(factory.post('/'))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        request = factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        response = PrimaryPinMiddleware(read_view)(request)
+        PrimaryPinMiddleware(read_view)(factory.get('/'))
+        self.assertEqual(reads, ['default', 'replica'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+
+class StickyAfterCommentTests(TestCase):
+    def test_comment_sets_sticky_cookie(self):
+        user = User.objects.create_user(username='TestUser')
+        post = Post.objects.create(author=user, text='Пост')
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('posts_app:add_comment', args=[post.pk]),
+            {'text': 'Комментарий'},
+        )
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+
+class CopySQLiteTests(SimpleTestCase):
+    def test_snapshot_replaces_replica(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'primary.sqlite3')
+            target = os.path.join(directory, 'replica.sqlite3')
+            with closing(sqlite3.connect(source)) as db:
+                db.execute('PRAGMA journal_mode = WAL')
+                db.execute('CREATE TABLE post (text TEXT)')
+                db.execute("INSERT INTO post VALUES ('пост')")
+                db.commit()
+            copy_sqlite(source, target)
+            with closing(sqlite3.connect(target)) as db:
+                rows = db.execute('SELECT text FROM post').fetchall()
+                journal = db.execute('PRAGMA journal_mode').fetchone()[0]
+            self.assertEqual(rows, [('пост',)])
+            self.assertEqual(journal, 'delete')
+            self.assertFalse(os.path.exists(target + '-wal'))
+            self.assertFalse(os.path.exists(target + '.sync'))
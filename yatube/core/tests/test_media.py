@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import media
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+HASHED = 'posts/ab/cd/' + 'abcd' * 16 + '.jpg'
+CONTENT = b'0123456789'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, MEDIA_URL='/media/')
+class ServeMediaTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in (HASHED, 'about/logo.png', 'posts/.upload-tmp'):
+            path = os.path.join(TEMP_MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, name, **headers):
+        return self.client.get('/media/' + name, **headers)
+
+    def test_full_response_with_validators(self):
+        response = self.get(HASHED)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(response['Last-Modified'])
+        cached = self.get(HASHED, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_unhashed_name_not_immutable(self):
+        response = self.get('about/logo.png')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_derived_images_immutable(self):
+        """Варианты /img/ и миниатюры sorl не меняются под тем же именем."""
+        names = [
+            'resized/' + HASHED + '/960x339.webp',
+            'cache/ab/cd/thumbnail.jpg',
+        ]
+        for name in names:
+            with self.subTest(name=name):
+                self.assertIn('immutable', media.cache_control(name))
+        self.assertNotIn('immutable', media.cache_control('about/cache/a.png'))
+
+    def test_ranges(self):
+        cases = {
+            'bytes=2-5': (b'2345', 'bytes 2-5/10'),
+            'bytes=-3': (b'789', 'bytes 7-9/10'),
+            'bytes=8-': (b'89', 'bytes 8-9/10'),
+        }
+        for header, (body, content_range) in cases.items():
+            with self.subTest(header=header):
+                response = self.get(HASHED, HTTP_RANGE=header)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.PARTIAL_CONTENT)
+                self.assertEqual(b''.join(response.streaming_content), body)
+                self.assertEqual(response['Content-Range'], content_range)
+        response = self.get(HASHED, HTTP_RANGE='bytes=10-')
+        self.assertEqual(
+            response.status_code, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        # Начало больше конца — некорректный заголовок, он игнорируется.
+        for header in ('bytes=5-1', 'bytes=12-3'):
+            with self.subTest(header=header):
+                response = self.get(HASHED, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_if_range_mismatch_returns_whole_file(self):
+        response = self.get(
+            HASHED, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    @override_settings(
+        MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_PREFIX='/internal/')
+    def test_sendfile_offload(self):
+        """Тело отдаёт прокси: ответ воркера пустой."""
+        response = self.get(HASHED, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['X-Accel-Redirect'], '/internal/' + HASHED)
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+    def test_hidden_and_outside_files_not_served(self):
+        for name in ('posts/.upload-tmp', '../etc/passwd', 'posts/'):
+            with self.subTest(name=name):
+                self.assertEqual(
+                    self.get(name).status_code, HTTPStatus.NOT_FOUND)
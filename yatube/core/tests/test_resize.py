@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from .. import resize
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def jpeg(size=(400, 200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'green').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ResizedImageTests(SimpleTestCase):
+    def setUp(self):
+        self.name = default_storage.save(
+            'posts/photo.jpg', ContentFile(jpeg()))
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_signed_url_served_from_disk_cache(self):
+        url = resize.resized_url(self.name, '120x60')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        content = b''.join(response.streaming_content)
+        with Image.open(BytesIO(content)) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (120, 60)))
+        with mock.patch.object(resize, 'render') as render:
+            self.assertEqual(self.client.get(url).status_code, HTTPStatus.OK)
+        render.assert_not_called()
+
+    def test_unsigned_and_oversized_rejected(self):
+        urls = [
+            resize.resized_url(self.name, '120x60').replace(
+                '120x60', '121x60'),
+            f'/img/{resize.sign("5000x10", self.name)}/5000x10/{self.name}',
+            resize.resized_url('posts/missing.jpg', '120x60'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.client.get(url).status_code, HTTPStatus.NOT_FOUND)
+        with self.assertRaises(ValueError):
+            resize.resized_url(self.name, '5000x10')
+
+    def test_undecodable_and_oversized_sources_are_bad_requests(self):
+        broken = default_storage.save(
+            'posts/broken.jpg', ContentFile(b'not an image'))
+        response = self.client.get(resize.resized_url(broken, '80x40'))
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        # Картинка вдвое больше предела Pillow — «бомба распаковки».
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            response = self.client.get(resize.resized_url(self.name, '80x40'))
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_lock_file_is_removed(self):
+        path = resize.get_or_create('80x40', self.name)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['80x40.webp'])
+
+    def test_concurrent_misses_render_once(self):
+        calls = []
+        original = resize.render
+
+        def slow_render(*args):
+            calls.append(args)
+            time.sleep(0.1)
+            original(*args)
+
+        with mock.patch.object(resize, 'render', slow_render):
+            threads = [
+                threading.Thread(
+                    target=resize.get_or_create, args=('80x40', self.name))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_template_tag(self):
+        rendered = Template(
+            "{% load resized %}{% resized_url name '320x160' %}"
+        ).render(Context({'name': self.name}))
+        self.assertEqual(rendered, resize.resized_url(self.name, '320x160'))
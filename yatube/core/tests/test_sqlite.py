@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .. import sqlite
+
+
+class ConnectionPragmasTests(TestCase):
+    def test_new_connections_get_pragmas(self):
+        with connection.cursor() as cursor:
+            for name, value in (
+                ('busy_timeout', 5000),
+                ('cache_size', -16000),
+                # NORMAL
+                ('synchronous', 1),
+            ):
+                with self.subTest(name=name):
+                    cursor.execute(f'PRAGMA {name}')
+                    self.assertEqual(cursor.fetchone()[0], value)
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_replicas_keep_journal_mode(self):
+        values = sqlite.pragmas('replica')
+        self.assertNotIn('journal_mode', values)
+        self.assertEqual(values['query_only'], 'on')
+        self.assertEqual(sqlite.pragmas()['journal_mode'], 'wal')
+
+
+class MaintenanceTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+        with closing(sqlite3.connect(self.path)) as db:
+            sqlite.apply_pragmas(db, sqlite.pragmas())
+            db.execute('CREATE TABLE post (text TEXT)')
+            db.executemany(
+                'INSERT INTO post VALUES (?)',
+                (('x' * 1000,) for _ in range(500)),
+            )
+            db.commit()
+            db.execute('DELETE FROM post')
+            db.commit()
+
+    def test_incremental_vacuum_needs_auto_vacuum(self):
+        with closing(sqlite3.connect(self.path)) as db:
+            cursor = db.cursor()
+            self.assertFalse(sqlite.incremental_vacuum(cursor))
+            free = sqlite.stats(cursor)['free']
+            self.assertGreater(free, 0)
+            sqlite.enable_incremental_vacuum(cursor)
+            db.execute(
+                'INSERT INTO post VALUES (?)', ('x' * 100_000,))
+            db.commit()
+            db.execute('DELETE FROM post')
+            db.commit()
+            self.assertGreater(sqlite.stats(cursor)['free'], 0)
+            self.assertTrue(sqlite.incremental_vacuum(cursor))
+            self.assertEqual(sqlite.stats(cursor)['free'], 0)
+
+    def test_analyze_and_checkpoint(self):
+        with closing(sqlite3.connect(self.path)) as db:
+            db.execute('CREATE INDEX post_text ON post (text)')
+            db.execute("INSERT INTO post VALUES ('пост')")
+            db.commit()
+            cursor = db.cursor()
+            sqlite.analyze(cursor, limit=100)
+            sqlite.checkpoint(cursor)
+            stat = db.execute('SELECT tbl FROM sqlite_stat1').fetchall()
+            self.assertEqual(os.path.getsize(self.path + '-wal'), 0)
+        self.assertIn(('post',), stat)
+
+
+class MaintenanceCommandTests(TestCase):
+    def test_reports_size(self):
+        out = StringIO()
+        call_command('sqlite_maintenance', stdout=out, stderr=StringIO())
+        self.assertIn('База:', out.getvalue())
+
+
+class BenchmarkSQLiteTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_reports_both_profiles(self):
+        out = StringIO()
+        call_command(
+            'benchmark_sqlite', posts=100, groups=5, readers=1, writers=1,
+            seconds=0.2, stdout=out,
+        )
+        blocks = out.getvalue().strip().split('\n\n')
+        self.assertEqual(len(blocks), 2)
+        for block in blocks:
+            with self.subTest(block=block.splitlines()[0]):
+                self.assertIn('чтения:', block)
+                self.assertIn('записи:', block)
@@ -0,0 +1,40 @@
+import hashlib
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+
+from ..storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_name_is_sharded_content_hash(self):
+        """Имя файла — хеш содержимого в двух уровнях каталогов."""
+        digest = hashlib.sha256(b'picture').hexdigest()
+        name = self.storage.save('posts/photo.JPG', ContentFile(b'picture'))
+        self.assertEqual(
+            name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        with self.storage.open(name) as saved:
+            self.assertEqual(saved.read(), b'picture')
+
+    def test_identical_uploads_share_file(self):
+        """Повторная загрузка того же файла не создаёт копию."""
+        first = self.storage.save('posts/a.png', ContentFile(b'same'))
+        second = self.storage.save('posts/b.png', ContentFile(b'same'))
+        other = self.storage.save('posts/c.png', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_precomputed_hash_is_used(self):
+        content = ContentFile(b'streamed')
+        content.content_hash = 'f' * 64
+        name = self.storage.save('posts/a.png', content)
+        self.assertEqual(name, f'posts/ff/ff/{"f" * 64}.png')
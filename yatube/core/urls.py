@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path(
+        '<str:signature>/<str:geometry>/<path:name>',
+        views.resized_image,
+        name='resized_image',
+    ),
+]
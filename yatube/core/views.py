@@ -1,6 +1,16 @@
+import os
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from . import media, resize
 
 
 def csrf_failure(request, reason=''):
@@ -23,3 +33,85 @@ def server_error(request):
         status=HTTPStatus.INTERNAL_SERVER_ERROR
     )
 
+
+@require_safe
+def resized_image(request, signature, geometry, name):
+    """Вариант картинки из дискового кеша; промах строится один раз."""
+    if (resize.parse_geometry(geometry) is None
+            or not resize.check_signature(signature, geometry, name)):
+        raise Http404
+    try:
+        path = resize.get_or_create(geometry, name)
+    except (SuspiciousFileOperation, FileNotFoundError):
+        raise Http404
+    except ValueError:
+        # Файл есть, но это не картинка или она слишком велика.
+        return HttpResponse(status=HTTPStatus.BAD_REQUEST)
+    # FileResponse отдаёт файл через wsgi.file_wrapper (sendfile),
+    # без копирования в память процесса.
+    response = FileResponse(open(path, 'rb'), content_type='image/webp')
+    response['Cache-Control'] = (
+        f'public, max-age={resize.CACHE_MAX_AGE}, immutable')
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Файл из MEDIA_ROOT с валидаторами, Range и долгим кешем."""
+    if any(part.startswith('.') for part in path.split('/')):
+        # Временные файлы загрузок и блокировки не отдаются.
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    headers = {
+        'ETag': media.etag(stat),
+        'Last-Modified': media.last_modified(stat),
+        'Cache-Control': media.cache_control(path),
+    }
+    response = get_conditional_response(
+        request, etag=headers['ETag'], last_modified=int(stat.st_mtime))
+    if response is None:
+        response = _media_response(request, path, full_path, stat)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def _media_response(request, path, full_path, stat):
+    content_type = media.content_type(path)
+    if media.sendfile_mode():
+        # Тело и диапазоны отдаёт прокси, воркер только ставит заголовки.
+        response = HttpResponse(content_type=content_type)
+        for header, value in media.sendfile_headers(path, full_path).items():
+            response[header] = value
+        return response
+    byte_range = None
+    if media.range_applies(request, stat):
+        try:
+            byte_range = media.parse_range(
+                request.META.get('HTTP_RANGE'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(
+                status=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+    if byte_range is None:
+        response = FileResponse(
+            open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            media.file_range(open(full_path, 'rb'), start, length),
+            status=HTTPStatus.PARTIAL_CONTENT,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    return response
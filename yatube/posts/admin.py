@@ -1,9 +1,121 @@
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import ValidationError
 
+from . import search, shards
 from .models import Post, Group, Comment, Follow
+from .paginators import AdminPaginator, PostAdminPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class FullTextSearchMixin:
+    """Поиск в админке по полнотекстовому индексу вместо LIKE."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.matching(queryset, search_term), False
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Список, который строится за постоянное число запросов.
+
+    Связанные объекты приходят через list_select_related, общее число
+    строк — из счётчика или оценки (AdminPaginator), а варианты
+    внешних ключей из list_editable читаются один раз на список,
+    а не на каждую строку.
+    """
+    paginator = AdminPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # ChangeList не применяет list_select_related, если менеджер
+        # модели уже вызвал select_related() (как CommentManager).
+        queryset = super().get_queryset(request)
+        if self.list_select_related:
+            queryset = queryset.select_related(*self.list_select_related)
+        return queryset
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if formfield is not None and db_field.name in self.list_editable:
+            # Формы строк копируют поле вместе с готовым списком.
+            formfield.choices = list(iter(formfield.choices))
+        return formfield
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Список записей одного шарда: ChangeList работает с одним
+    QuerySet, а выборка из нескольких баз им не является."""
+    title = 'шард'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shards.aliases()]
+
+    def value(self):
+        value = super().value()
+        return value if value in shards.aliases() else shards.aliases()[0]
+
+    def choices(self, changelist):
+        # Варианта «все» нет: список всегда из одного шарда.
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == alias,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: alias}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        return queryset.using(self.value())
+
+
+class ShardedChoiceField(forms.ModelChoiceField):
+    """Выбор записи из шардов (пост комментария) по её id."""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = shards.first(
+            self.queryset, **{self.to_field_name or 'pk': value})
+        if obj is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice')
+        return obj
+
+
+class ShardedAdmin(ScalableAdmin):
+    """Админка модели из шардов (posts.shards): список по одному
+    шарду, объект и связанные записи ищутся во всех."""
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if shards.enabled():
+            return (ShardListFilter, *list_filter)
+        return list_filter
+
+    def get_object(self, request, object_id, from_field=None):
+        if not shards.enabled():
+            return super().get_object(request, object_id, from_field)
+        field = (
+            self.model._meta.pk if from_field is None
+            else self.model._meta.get_field(from_field)
+        )
+        try:
+            object_id = field.to_python(object_id)
+        except ValidationError:
+            return None
+        return shards.first(
+            self.get_queryset(request), **{field.name: object_id})
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if shards.is_sharded(db_field.related_model):
+            kwargs.setdefault('form_class', ShardedChoiceField)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class PostAdmin(FullTextSearchMixin, ShardedAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,8 +124,11 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    autocomplete_fields = ('author',)
+    paginator = PostAdminPaginator
     empty_value_display = '-пусто-'
 
 
@@ -24,12 +139,27 @@ class GroupAdmin(admin.ModelAdmin):
         'description',
 
     )
-    search_fields = ('text',)
+    search_fields = ('title', 'slug')
     list_filter = ('title',)
     empty_value_display = '-пусто-'
 
 
+class CommentAdmin(FullTextSearchMixin, ShardedAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    search_fields = ('text',)
+    raw_id_fields = ('post',)
+    autocomplete_fields = ('author',)
+    empty_value_display = '-пусто-'
+
+
+class FollowAdmin(ScalableAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
-admin.site.register(Follow)
-admin.site.register(Comment)
+admin.site.register(Follow, FollowAdmin)
+admin.site.register(Comment, CommentAdmin)
@@ -0,0 +1,179 @@
+"""Архив старых постов.
+
+Почти все чтения касаются свежих постов, поэтому посты старше
+POST_ARCHIVE_AFTER_DAYS дней вместе с комментариями переносятся
+из posts_post в ArchivedPost и ArchivedComment (команда
+archive_posts). Текст там сжат, а индекс один — для профиля автора,
+так что горячая таблица и её индексы не растут вместе с историей.
+Архив лежит в той же базе (шарде), что и посты автора.
+
+Главная, группы, подписки и поиск показывают только горячие посты.
+Страница поста и профиль автора читают архив, когда поста нет
+в горячей таблице: оттуда пост возвращается обычным Post
+с archived=True. Шаблоны его не отличают, но править
+и комментировать такой пост нельзя.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count
+from django.http import Http404
+from django.utils import timezone
+
+from . import caching, counters, shards
+from .models import (ArchivedComment, ArchivedPost, Comment, Post,
+                     TimelineEntry)
+
+RESTORED = {ArchivedPost: Post, ArchivedComment: Comment}
+
+
+def archive_after():
+    return getattr(settings, 'POST_ARCHIVE_AFTER_DAYS', 365)
+
+
+def cutoff(days=None):
+    """Посты старше этого момента уходят в архив."""
+    if days is None:
+        days = archive_after()
+    return timezone.now() - timedelta(days=days)
+
+
+def stale(before, using=None):
+    return Post._base_manager.using(using or DEFAULT_DB_ALIAS).filter(
+        pub_date__lt=before)
+
+
+def archive_older(before, using=None, batch_size=500):
+    """Переносит в архив посты базы using старше before пачками
+    и возвращает их число."""
+    archived = 0
+    while True:
+        ids = list(
+            stale(before, using).order_by('pub_date', 'pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return archived
+        archived += archive(ids, using)
+
+
+def archive(ids, using=None):
+    """Переносит посты ids с комментариями в архив той же базы.
+
+    Строки удаляются без сигналов: файлы картинок остаются за
+    архивом, а счётчик постов автора учитывает архив и не меняется.
+    Счётчики лент, из которых пост ушёл, уменьшаются здесь.
+    """
+    using = using or DEFAULT_DB_ALIAS
+    with transaction.atomic(using=using):
+        posts = list(Post._base_manager.using(using).filter(pk__in=ids))
+        comments = Comment._base_manager.using(using).filter(post_id__in=ids)
+        ArchivedPost._base_manager.using(using).bulk_create(
+            [_convert(post, ArchivedPost) for post in posts])
+        ArchivedComment._base_manager.using(using).bulk_create(
+            [_convert(comment, ArchivedComment) for comment in comments])
+        # Ленты, из которых уходят посты: столько записей и удаляется.
+        readers = dict(
+            TimelineEntry._base_manager.using(using).filter(post_id__in=ids)
+            .order_by().values('user_id').annotate(entries=Count('pk'))
+            .values_list('user_id', 'entries')
+        )
+        for model, lookup in (
+            (TimelineEntry, 'post_id__in'),
+            (Comment, 'post_id__in'),
+            (Post, 'pk__in'),
+        ):
+            queryset = model._base_manager.using(using).filter(
+                **{lookup: ids})
+            queryset._raw_delete(using)
+    _forget(posts, readers)
+    return len(posts)
+
+
+def _convert(obj, model):
+    """Объект model с теми же значениями полей, что у obj."""
+    converted = model(**{
+        field.attname: getattr(obj, field.attname)
+        for field in model._meta.concrete_fields
+        if field.attname != 'compressed_text'
+    })
+    if model in RESTORED:
+        converted.text = obj.text
+    return converted
+
+
+def _forget(posts, readers):
+    """Уменьшает счётчики после переноса posts в архив; readers —
+    {пользователь: удалено записей его ленты}."""
+    if not posts:
+        return
+    deltas = Counter({counters.POSTS: len(posts)})
+    deltas.update(
+        counters.group_key(post.group_id) for post in posts
+        if post.group_id is not None
+    )
+    for user_id, entries in readers.items():
+        deltas[counters.feed_key(user_id)] += entries
+    keys_by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        keys_by_delta[delta].append(key)
+    for delta, keys in keys_by_delta.items():
+        counters.incr(keys, -delta)
+    caching.bump(*{
+        scope for post in posts for scope in caching.post_scopes(post)
+    })
+
+
+def restore(row):
+    """Строка архива в виде Post или Comment; остальное как есть."""
+    model = RESTORED.get(type(row))
+    if model is None:
+        return row
+    obj = _convert(row, model)
+    obj._state.adding = False
+    obj._state.db = row._state.db
+    obj.archived = True
+    for field in model._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        source = type(row)._meta.get_field(field.name)
+        if source.related_model is not field.related_model:
+            continue
+        if source.is_cached(row):
+            field.set_cached_value(obj, source.get_cached_value(row))
+    return obj
+
+
+def get_post_or_404(post_id):
+    """Пост из горячей таблицы, а если его там нет — из архива."""
+    post = shards.first(Post.objects.all(), pk=post_id)
+    if post is None:
+        post = shards.first(ArchivedPost.objects.all(), pk=post_id)
+        if post is None:
+            raise Http404('Пост не найден.')
+        post = restore(post)
+    return post
+
+
+def comments(post):
+    """Комментарии к посту, горячему или из архива."""
+    if not post.archived:
+        return shards.scatter(post.comments.all(), author_id=post.author_id)
+    return shards.Scatter(
+        shards.each(
+            ArchivedComment.objects.filter(post_id=post.pk),
+            author_id=post.author_id,
+        ),
+        convert=restore,
+    )
+
+
+def with_archive(queryset, author_id):
+    """Посты автора из queryset вместе с его архивом как одна лента."""
+    archived = ArchivedPost.objects.filter(author_id=author_id)
+    return shards.Scatter(
+        shards.each(queryset, author_id) + shards.each(archived, author_id),
+        convert=restore,
+    )
@@ -0,0 +1,193 @@
+"""Учёт ссылок постов на файлы в хранилище по содержимому.
+
+Одинаковые загрузки получают один файл (core.storage), поэтому удалять
+его вместе с постом нельзя: сначала уменьшаем счётчик ссылок и стираем
+файл с миниатюрами, только когда ссылок не осталось.
+
+Файлы, которые счётчики упустили (загруженные до них, оставшиеся
+от упавших запросов), находит сборщик мусора: команда gc_media.
+"""
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import shards
+from .models import ArchivedPost, MediaBlob, Post, image_storage
+
+CHUNK_SIZE = 2000
+
+
+def retain(name):
+    if not name:
+        return
+    if MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1):
+        return
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(name=name, refs=1)
+    except IntegrityError:
+        MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+
+
+def retain_upload(field_file):
+    """Берёт ссылку на файл новой загрузки до сохранения модели.
+
+    Хранилище отдаёт уже лежащий на диске файл с тем же содержимым,
+    поэтому ссылка должна появиться раньше: иначе purge успеет стереть
+    файл между проверкой в хранилище и retain. Возвращает имя файла
+    или '', если загрузки нет.
+    """
+    if not field_file or field_file._committed:
+        return ''
+    content = field_file.file
+    if not hasattr(content, 'chunks'):
+        content = File(content, field_file.name)
+    name = field_file.storage.content_name(
+        field_file.field.generate_filename(
+            field_file.instance, field_file.name),
+        content,
+    )
+    retain(name)
+    return name
+
+
+def release(name):
+    if not name:
+        return
+    MediaBlob.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1
+    )
+    if MediaBlob.objects.filter(name=name, refs=0).exists():
+        transaction.on_commit(lambda: purge(name))
+
+
+def purge(name):
+    """Удаляет файл и его миниатюры, если на него снова не сослались.
+
+    Строка без ссылок удаляется условным DELETE, который держит
+    блокировку до конца транзакции: retain того же файла ждёт, пока
+    файл не стёрт, а потом заводит строку заново, и хранилище
+    записывает файл ещё раз.
+    """
+    with transaction.atomic():
+        deleted, _ = MediaBlob.objects.filter(name=name, refs=0).delete()
+        if deleted:
+            default.kvstore.delete(ImageFile(name, image_storage))
+            image_storage.delete(name)
+
+
+def _batches(iterable):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, CHUNK_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def referenced(names):
+    """Те из имён оригиналов names, на которые ссылаются MediaBlob,
+    посты или архив.
+
+    Сначала проверяется MediaBlob (уникальный индекс по имени), посты
+    и архив — только для остальных имён: обычно это файлы, загруженные
+    до учёта ссылок, и настоящие сироты.
+    """
+    names = set(names)
+    found = set(
+        MediaBlob.objects.filter(name__in=names, refs__gt=0)
+        .values_list('name', flat=True)
+    )
+    rest = names - found
+    for model in (Post, ArchivedPost):
+        if not rest:
+            break
+        for queryset in shards.each(model.objects.filter(
+                image__in=rest).values_list('image', flat=True)):
+            found.update(queryset)
+        rest = names - found
+    return found
+
+
+def _kv_rows(identity, keys=None):
+    rows = KVStoreModel.objects.filter(
+        key__startswith=add_prefix('', identity))
+    if keys is not None:
+        rows = rows.filter(key__in=[add_prefix(key, identity) for key in keys])
+    return rows.values_list('key', 'value').iterator(chunk_size=CHUNK_SIZE)
+
+
+def _kv_names(rows):
+    return {del_prefix(key): json.loads(value)['name'] for key, value in rows}
+
+
+def kv_orphans():
+    """Ключи хранилища sorl, оставшиеся от удалённых оригиналов,
+    и имена миниатюр живых оригиналов.
+
+    Записи читаются и проверяются пачками по CHUNK_SIZE, в памяти
+    остаются только ключи и имена миниатюр живых оригиналов.
+    """
+    dead, thumbnail_keys = [], set()
+    for rows in _batches(_kv_rows('thumbnails')):
+        sources = _kv_names(_kv_rows(
+            'image', [del_prefix(key) for key, _ in rows]))
+        live = referenced(sources.values())
+        for key, value in rows:
+            if sources.get(del_prefix(key)) in live:
+                thumbnail_keys.update(json.loads(value))
+            else:
+                dead.append(key)
+    live_thumbnails = set()
+    for rows in _batches(_kv_rows('image')):
+        names = _kv_names(rows)
+        for key in names.keys() & thumbnail_keys:
+            live_thumbnails.add(names.pop(key))
+        live = referenced(names.values())
+        dead.extend(
+            add_prefix(key) for key, name in names.items()
+            if name not in live
+        )
+    return dead, live_thumbnails
+
+
+def orphan_files(storage, directory, is_live, min_age, source=None):
+    """(имя, размер) файлов каталога хранилища без живого источника.
+
+    is_live(имена) возвращает живые из переданных имён источников
+    и вызывается на пачку файлов; source(имя) — имя источника файла,
+    по умолчанию сам файл. Файлы моложе min_age секунд пропускаются:
+    их может сейчас сохранять запрос, чья транзакция ещё
+    не зафиксирована.
+    """
+    source = source or (lambda name: name)
+    for batch in _batches(_old_files(storage, directory, min_age)):
+        live = is_live({source(name) for name, _ in batch})
+        for name, size in batch:
+            if source(name) not in live:
+                yield name, size
+
+
+def _old_files(storage, directory, min_age):
+    cutoff = time.time() - min_age
+    root = storage.path(directory)
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime <= cutoff:
+                name = os.path.relpath(path, storage.location).replace(
+                    os.sep, '/')
+                yield name, stat.st_size
@@ -0,0 +1,245 @@
+"""Версии содержимого для ключей кеша.
+
+Каждая лента (scope) имеет номер версии, который входит в ключ её
+закешированных страниц. Сигналы записи поднимают версию, и старые
+записи кеша просто перестают находиться, поэтому их можно хранить
+часами. Номер начинается с текущего времени в миллисекундах, чтобы
+после вытеснения версии из кеша не вернуться к старому номеру.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from core import db_routers, holes
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 4
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+PAGE_CACHE_TIMEOUT = 60 * 60 * 4
+VERSION_PREFIX = 'version:'
+FRAGMENT_PREFIX = 'fragment:'
+BUMPED_PREFIX = 'bumped:'
+PAGE_PREFIX = 'page:'
+
+GLOBAL = 'global'
+INDEX = 'index'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(user_id):
+    return f'author:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def user_scope(user_id):
+    """Имя и адрес профиля пользователя, а не лента его постов."""
+    return f'user:{user_id}'
+
+
+def group_info_scope(group_id):
+    """Название и адрес группы, а не лента её постов."""
+    return f'group-info:{group_id}'
+
+
+def follows_scope(user_id):
+    """Подписки и подписчики пользователя."""
+    return f'follows:{user_id}'
+
+
+def comments_scope(post_id):
+    return f'comments:{post_id}'
+
+
+def _initial():
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    """Текущие версии областей одним запросом к кешу."""
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial(), None)
+            versions[key] = cache.get(key)
+    return {
+        scope: versions[VERSION_PREFIX + scope] for scope in scopes
+    }
+
+
+def version_key(*scopes):
+    """Строка версий для ключа кеша; меняется при любом bump()."""
+    versions = get_versions((GLOBAL,) + scopes)
+    return '|'.join(f'{scope}={version}' for scope, version in
+                    versions.items())
+
+
+def bump(*scopes):
+    for scope in scopes:
+        key = VERSION_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial(), None)
+    if db_routers.replicas():
+        # Пока реплики могут не знать о правке, страницы этих областей,
+        # собранные с реплики, в общий кеш не попадают.
+        cache.set_many(
+            {BUMPED_PREFIX + scope: True for scope in scopes},
+            settings.REPLICA_STICKY_SECONDS,
+        )
+
+
+def settled(versions):
+    """Можно ли положить в общий кеш страницу, собранную с реплики.
+
+    Версии не должны измениться за время рендера, и ни одна из них
+    не должна подниматься последние REPLICA_STICKY_SECONDS секунд:
+    иначе реплика могла отдать старые данные под новой версией.
+    """
+    if get_versions(versions) != versions:
+        return False
+    return not cache.get_many([BUMPED_PREFIX + scope for scope in versions])
+
+
+def feed_context(*scopes):
+    """Контекст для {% cache %} вокруг ленты в шаблоне."""
+    return {
+        'feed_cache_timeout': FEED_CACHE_TIMEOUT,
+        'feed_version': version_key(*scopes),
+    }
+
+
+def post_scopes(post, group_ids=()):
+    scopes = [INDEX, author_scope(post.author_id)]
+    for group_id in {post.group_id, *group_ids}:
+        if group_id is not None:
+            scopes.append(group_scope(group_id))
+    return scopes
+
+
+def fragment_scopes(post):
+    scopes = [post_scope(post.pk), user_scope(post.author_id)]
+    if post.group_id is not None:
+        scopes.append(group_info_scope(post.group_id))
+    return scopes
+
+
+def render_fragments(posts, template_name, prepare=None, **context):
+    """HTML постов по шаблону; готовые фрагменты берутся из кеша.
+
+    Версии всех постов страницы и сами фрагменты читаются двумя
+    запросами к кешу, шаблон рендерится только для промахов.
+    prepare(posts) вызывается один раз со списком постов, которые
+    придётся рендерить, — например, чтобы загрузить для них данные
+    пачкой.
+    """
+    posts = list(posts)
+    scopes = {post.pk: fragment_scopes(post) for post in posts}
+    versions = get_versions(
+        list(dict.fromkeys(s for group in scopes.values() for s in group))
+    )
+    variant = ','.join(f'{name}={context[name]}' for name in sorted(context))
+    keys = {
+        post.pk: FRAGMENT_PREFIX + '|'.join(
+            [template_name, variant] + [
+                f'{scope}={versions[scope]}' for scope in scopes[post.pk]
+            ]
+        )
+        for post in posts
+    }
+    cached = cache.get_many(keys.values())
+    if prepare is not None:
+        prepare([post for post in posts if keys[post.pk] not in cached])
+    missing = {}
+    fragments = []
+    for post in posts:
+        key = keys[post.pk]
+        if key not in cached:
+            cached[key] = missing[key] = render_to_string(
+                template_name, {'post': post, **context}
+            )
+        fragments.append(cached[key])
+    if missing:
+        cache.set_many(missing, FRAGMENT_CACHE_TIMEOUT)
+    return fragments
+
+
+def depends_on(request, *scopes):
+    """Отмечает области, от которых зависит общая копия страницы.
+
+    Версии читаются сразу, до рендера, чтобы правка во время рендера
+    не попала в кеш под уже новой версией.
+    """
+    versions = getattr(request, '_page_versions', None)
+    if versions is not None:
+        versions.update(get_versions(scopes))
+
+
+def shared_page(view):
+    """Общий для всех посетителей кеш страницы с персональными дырами.
+
+    Анонимам отдаётся готовый ответ без вызова представления
+    и шаблонов. Вошедшим пользователям — та же копия, в которой
+    заново рендерятся только дыры ({% hole %}). Запись живёт,
+    пока не изменилась ни одна из версий, отмеченных depends_on().
+
+    Промах рендерится там же, куда идут остальные чтения запроса:
+    с реплики, а после своей записи — из основной базы. Копию
+    с реплики кладём в кеш, только если её версии устоялись
+    (settled()), иначе отстающая реплика записала бы старую страницу
+    под уже поднятой версией, и та жила бы до следующей правки.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        key = PAGE_PREFIX + hashlib.md5(
+            request.get_full_path().encode()
+        ).hexdigest()
+        entry = cache.get(key)
+        if entry is not None and (
+                get_versions(entry['versions']) == entry['versions']):
+            return _cached_response(request, key, entry)
+        request._page_versions = get_versions([GLOBAL])
+        setattr(request, holes.PUNCH_ATTR, True)
+        response = view(request, *args, **kwargs)
+        setattr(request, holes.PUNCH_ATTR, False)
+        if response.status_code != 200 or response.streaming:
+            return response
+        entry = {
+            'versions': request._page_versions,
+            'content_type': response['Content-Type'],
+            'content': response.content.decode(response.charset),
+        }
+        content = holes.fill(request, entry['content'])
+        if not request.user.is_authenticated:
+            entry['anonymous'] = content
+        if (db_routers.pinned() or not db_routers.replicas()
+                or settled(entry['versions'])):
+            cache.set(key, entry, PAGE_CACHE_TIMEOUT)
+        response.content = content
+        return response
+    return wrapper
+
+
+def _cached_response(request, key, entry):
+    if request.user.is_authenticated:
+        content = holes.fill(request, entry['content'])
+    else:
+        content = entry.get('anonymous')
+        if content is None:
+            content = entry['anonymous'] = holes.fill(
+                request, entry['content'])
+            cache.set(key, entry, PAGE_CACHE_TIMEOUT)
+    return HttpResponse(content, content_type=entry['content_type'])
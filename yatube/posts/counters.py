@@ -0,0 +1,120 @@
+"""Поддерживаемые счётчики для пагинации и страниц без COUNT(*).
+
+Счётчик заводится лениво: при первом чтении значение считается
+обычным COUNT и сохраняется, дальше его двигают сигналы записи
+(posts.signals). Изменения отсутствующих счётчиков пропускаются,
+а расхождения исправляет команда reconcile_counters.
+Число комментариев хранится прямо в Post.comment_count.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Counter, Follow, Post, TimelineEntry
+
+POSTS = 'posts'
+GROUP = 'group'
+AUTHOR = 'author'
+FEED = 'feed'
+FOLLOWERS = 'followers'
+FOLLOWING = 'following'
+# Не счётчик строк, а последовательность идентификаторов (posts.shards).
+SEQUENCE = 'sequence'
+
+
+def group_key(group_id):
+    return f'{GROUP}:{group_id}'
+
+
+def author_key(user_id):
+    return f'{AUTHOR}:{user_id}'
+
+
+def feed_key(user_id):
+    return f'{FEED}:{user_id}'
+
+
+def followers_key(user_id):
+    return f'{FOLLOWERS}:{user_id}'
+
+
+def following_key(user_id):
+    return f'{FOLLOWING}:{user_id}'
+
+
+def sequence_key(table):
+    return f'{SEQUENCE}:{table}'
+
+
+def queryset_for(key):
+    """Выборка, число строк которой хранит счётчик."""
+    from .shards import scatter
+    kind, _, pk = key.partition(':')
+    if kind == POSTS:
+        return scatter(Post.objects.all())
+    if kind == GROUP:
+        return scatter(Post.objects.filter(group_id=pk))
+    if kind == AUTHOR:
+        from .archive import with_archive
+        return with_archive(Post.objects.filter(author_id=pk), pk)
+    if kind == FEED:
+        # Только записи ленты: посты популярных авторов
+        # досчитывает FollowFeed.total.
+        return scatter(TimelineEntry.objects.filter(user_id=pk))
+    if kind == FOLLOWERS:
+        return Follow.objects.filter(author_id=pk)
+    if kind == FOLLOWING:
+        return Follow.objects.filter(user_id=pk)
+    raise ValueError(f'Неизвестный счётчик: {key}')
+
+
+def get(key):
+    try:
+        return Counter.objects.values_list('value', flat=True).get(key=key)
+    except Counter.DoesNotExist:
+        pass
+    value = queryset_for(key).count()
+    try:
+        with transaction.atomic():
+            Counter.objects.create(key=key, value=value)
+    except IntegrityError:
+        pass
+    return value
+
+
+def get_many(keys):
+    values = dict(
+        Counter.objects.filter(key__in=keys).values_list('key', 'value')
+    )
+    for key in keys:
+        if key not in values:
+            values[key] = get(key)
+    return values
+
+
+def incr(keys, delta=1):
+    if delta:
+        Counter.objects.filter(key__in=keys).update(
+            value=F('value') + delta
+        )
+
+
+def post_keys(post):
+    """Счётчики, которые меняет пост. Ленты подписчиков двигает
+    posts.timeline по фактически записанным строкам."""
+    keys = [POSTS, author_key(post.author_id)]
+    if post.group_id is not None:
+        keys.append(group_key(post.group_id))
+    return keys
+
+
+def user_keys(user_id):
+    return [
+        author_key(user_id),
+        feed_key(user_id),
+        followers_key(user_id),
+        following_key(user_id),
+    ]
+
+
+def drop(keys):
+    Counter.objects.filter(key__in=keys).delete()
@@ -2,12 +2,14 @@ from django.forms import ModelForm
 from django import forms
 
 from .models import Comment, Post
+from .uploads import PostImageField
 
 
 class PostForm(ModelForm):
     class Meta:
         model = Post
         fields = ("text", "group", 'image')
+        field_classes = {'image': PostImageField}
 
 
 class CommentForm(forms.ModelForm):
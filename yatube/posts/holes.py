@@ -0,0 +1,31 @@
+from core import holes
+
+from .forms import CommentForm
+from .models import Follow
+
+
+@holes.register('switcher', 'posts/includes/switcher.html')
+def switcher(request, index=False, follow=False):
+    return {'index': index, 'follow': follow}
+
+
+@holes.register('follow_button', 'posts/includes/follow_button.html')
+def follow_button(request, author_id, username):
+    following = request.user.is_authenticated and Follow.objects.filter(
+        author_id=author_id,
+        user=request.user
+    ).exists()
+    return {
+        'author_id': author_id,
+        'username': username,
+        'following': following,
+    }
+
+
+@holes.register('post_actions', 'posts/includes/post_actions.html')
+def post_actions(request, post_id, author_id):
+    return {
+        'post_id': post_id,
+        'is_author': request.user.pk == author_id,
+        'form': CommentForm(),
+    }
@@ -0,0 +1,52 @@
+"""Размеры и формат картинок постов без полного декодирования."""
+from PIL import Image
+
+METADATA_FIELDS = ('image_width', 'image_height', 'image_size', 'image_format')
+
+
+def read_metadata(image):
+    """Ширина, высота, размер в байтах и формат файла картинки.
+
+    Pillow читает только заголовок: пиксели не декодируются. Если
+    заголовок не разобрать, размеры остаются пустыми. Файл, открытый
+    здесь, здесь же и закрывается; уже открытый перематывается
+    в начало.
+    """
+    width = height = size = None
+    image_format = ''
+    opened_here = image.closed
+    image.open('rb')
+    try:
+        size = image.size
+        with Image.open(image) as opened:
+            width, height = opened.size
+            image_format = opened.format or ''
+    except (OSError, ValueError, Image.DecompressionBombError):
+        pass
+    finally:
+        if opened_here:
+            image.close()
+        else:
+            image.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': size,
+        'image_format': image_format,
+    }
+
+
+def empty_metadata():
+    return {
+        'image_width': None,
+        'image_height': None,
+        'image_size': None,
+        'image_format': '',
+    }
+
+
+def fill_metadata(post):
+    """Записывает в пост размеры его картинки (или сбрасывает их)."""
+    metadata = read_metadata(post.image) if post.image else empty_metadata()
+    for field, value in metadata.items():
+        setattr(post, field, value)
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import archive, shards
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты старше --days дней вместе с комментариями '
+        'в архив (posts.archive), чтобы горячая таблица постов и её '
+        'индексы не росли вместе с историей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Возраст поста для архива, по умолчанию '
+                 'POST_ARCHIVE_AFTER_DAYS (365).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов переносить за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Повторять перенос каждые N секунд (0 — один проход).',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать посты для архива.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            before = archive.cutoff(options['days'])
+            if options['dry_run']:
+                total = sum(
+                    archive.stale(before, database).count()
+                    for database in shards.databases()
+                )
+                self.stdout.write(f'Будет перенесено в архив постов: {total}')
+                return
+            total = sum(
+                archive.archive_older(
+                    before, database, options['batch_size'])
+                for database in shards.databases()
+            )
+            self.stdout.write(f'Перенесено в архив постов: {total}')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from posts import images, shards
+from posts.models import ArchivedPost, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры, объём и формат картинок у постов '
+        '(и постов в архиве), сохранённых до появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов обрабатывать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        filled = missing = 0
+        for model in (Post, ArchivedPost):
+            for database in shards.databases():
+                done, lost = self.backfill(
+                    model, database, options['batch_size'])
+                filled += done
+                missing += lost
+        self.stdout.write(f'Заполнено постов: {filled}')
+        if missing:
+            self.stdout.write(f'Без файла: {missing}')
+
+    def backfill(self, model, database, batch_size):
+        filled = missing = 0
+        last_pk = 0
+        posts = model.objects.using(database)
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_pk, image_width__isnull=True)
+                .exclude(image='').order_by('pk')
+                .select_related(None).only('pk', 'image')[:batch_size]
+            )
+            if not batch:
+                return filled, missing
+            for post in batch:
+                try:
+                    images.fill_metadata(post)
+                except FileNotFoundError:
+                    self.stderr.write(f'Нет файла {post.image.name}')
+                    missing += 1
+                    continue
+                filled += 1
+            posts.bulk_update(batch, images.METADATA_FIELDS)
+            last_pk = batch[-1].pk
@@ -0,0 +1,271 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.models import Comment, Follow, Group, Post
+
+# Индексы схемы до миграции 0013: только одиночные внешние ключи.
+BASELINE_INDEXES = (
+    ('posts_post', 'author_id'),
+    ('posts_post', 'group_id'),
+    ('posts_comment', 'post_id'),
+    ('posts_comment', 'author_id'),
+    ('posts_follow', 'user_id'),
+    ('posts_follow', 'author_id'),
+)
+
+START = datetime(2020, 1, 1)
+FEED_COLUMNS = 'id, text, pub_date, author_id, group_id, image'
+QUERIES = (
+    (
+        'главная, первая страница',
+        f'SELECT {FEED_COLUMNS} FROM posts_post '
+        'ORDER BY pub_date DESC, id DESC LIMIT 11',
+        lambda data: (),
+    ),
+    (
+        'главная, курсор в середине ленты',
+        f'SELECT {FEED_COLUMNS} FROM posts_post '
+        'WHERE pub_date <= ? AND (pub_date < ? OR id < ?) '
+        'ORDER BY pub_date DESC, id DESC LIMIT 11',
+        lambda data: data.cursor(),
+    ),
+    (
+        'профиль автора',
+        f'SELECT {FEED_COLUMNS} FROM posts_post WHERE author_id = ? '
+        'ORDER BY pub_date DESC, id DESC LIMIT 11',
+        lambda data: (data.author(),),
+    ),
+    (
+        'страница группы',
+        f'SELECT {FEED_COLUMNS} FROM posts_post WHERE group_id = ? '
+        'ORDER BY pub_date DESC, id DESC LIMIT 11',
+        lambda data: (data.group(),),
+    ),
+    (
+        'комментарии поста',
+        'SELECT id, text, author_id, created FROM posts_comment '
+        'WHERE post_id = ? ORDER BY created DESC',
+        lambda data: (data.post(),),
+    ),
+    (
+        'подписчики автора',
+        'SELECT user_id FROM posts_follow WHERE author_id = ?',
+        lambda data: (data.author(),),
+    ),
+    (
+        'проверка подписки',
+        'SELECT 1 FROM posts_follow WHERE user_id = ? AND author_id = ? '
+        'LIMIT 1',
+        lambda data: (data.author(), data.author()),
+    ),
+)
+
+
+class Dataset:
+    """Случайные параметры запросов в пределах сгенерированных данных."""
+
+    def __init__(self, posts, authors, groups, seed):
+        self.posts = posts
+        self.authors = authors
+        self.groups = groups
+        self.random = random.Random(seed)
+
+    def author(self):
+        return self.random.randint(1, self.authors)
+
+    def group(self):
+        return self.random.randint(1, self.groups)
+
+    def post(self):
+        return self.random.randint(1, self.posts)
+
+    def cursor(self):
+        pk = self.random.randint(self.posts // 4, self.posts * 3 // 4)
+        date = pub_date(pk)
+        return date, date, pk
+
+
+def pub_date(pk):
+    return str(START + timedelta(seconds=pk * 30))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает планы и время запросов лент на синтетической базе '
+        'SQLite до и после составных индексов из миграции 0013.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2_000_000)
+        parser.add_argument('--authors', type=int, default=20_000)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--comments', type=int, default=2_000_000)
+        parser.add_argument('--follows', type=int, default=400_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--path',
+            help='Файл базы; по умолчанию временный и удаляется.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        temporary = path is None
+        if temporary:
+            fd, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+        db = sqlite3.connect(path)
+        try:
+            tables, indexes = self.schema()
+            for statement in tables:
+                db.execute(statement)
+            self.populate(db, options)
+            results = {}
+            for stage, statements in (
+                ('до', self.baseline_indexes()),
+                ('после', indexes),
+            ):
+                self.reindex(db, statements)
+                results[stage] = self.measure(db, options)
+            self.report(results)
+        finally:
+            db.close()
+            if temporary:
+                os.remove(path)
+
+    def schema(self):
+        """DDL таблиц и индексов текущих моделей без выполнения."""
+        with connection.schema_editor(collect_sql=True) as editor:
+            for model in (Group, Post, Comment, Follow):
+                editor.create_model(model)
+        tables = [
+            sql for sql in editor.collected_sql
+            if sql.startswith('CREATE TABLE')
+        ]
+        indexes = [
+            sql for sql in editor.collected_sql
+            if sql.startswith('CREATE INDEX')
+        ]
+        return tables, indexes
+
+    def baseline_indexes(self):
+        return [
+            f'CREATE INDEX "baseline_{table}_{column}" '
+            f'ON "{table}" ("{column}")'
+            for table, column in BASELINE_INDEXES
+        ]
+
+    def reindex(self, db, statements):
+        names = [
+            row[0] for row in db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' "
+                "AND sql IS NOT NULL"
+            )
+        ]
+        for name in names:
+            db.execute(f'DROP INDEX "{name}"')
+        started = time.perf_counter()
+        for statement in statements:
+            db.execute(statement)
+        db.execute('ANALYZE')
+        db.commit()
+        self.stdout.write(
+            f'Индексы построены за {time.perf_counter() - started:.1f} с'
+        )
+
+    def populate(self, db, options):
+        rng = random.Random(options['seed'])
+        posts = options['posts']
+        started = time.perf_counter()
+        db.executemany(
+            'INSERT INTO posts_group (id, title, slug, description) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                (pk, f'Группа {pk}', f'group-{pk}', '')
+                for pk in range(1, options['groups'] + 1)
+            ),
+        )
+        db.executemany(
+            'INSERT INTO posts_post (id, text, pub_date, author_id, '
+            'group_id, image, comment_count, image_format) '
+            "VALUES (?, ?, ?, ?, ?, ?, 0, '')",
+            (
+                (
+                    pk,
+                    f'Пост {pk}',
+                    pub_date(pk),
+                    rng.randint(1, options['authors']),
+                    rng.randint(1, options['groups'])
+                    if rng.random() < 0.7 else None,
+                    '',
+                )
+                for pk in range(1, posts + 1)
+            ),
+        )
+        db.executemany(
+            'INSERT INTO posts_comment (text, post_id, author_id, created) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                (
+                    'Комментарий',
+                    post_id,
+                    rng.randint(1, options['authors']),
+                    pub_date(post_id + rng.randint(1, 1000)),
+                )
+                for post_id in (
+                    rng.randint(1, posts) for _ in range(options['comments'])
+                )
+            ),
+        )
+        db.executemany(
+            'INSERT OR IGNORE INTO posts_follow (user_id, author_id) '
+            'VALUES (?, ?)',
+            (
+                (
+                    rng.randint(1, options['authors']),
+                    rng.randint(1, options['authors']),
+                )
+                for _ in range(options['follows'])
+            ),
+        )
+        db.commit()
+        self.stdout.write(
+            f'Данные сгенерированы за {time.perf_counter() - started:.1f} с'
+        )
+
+    def measure(self, db, options):
+        results = {}
+        for title, sql, params in QUERIES:
+            data = Dataset(
+                options['posts'], options['authors'], options['groups'],
+                options['seed'],
+            )
+            plan = [
+                row[-1] for row in
+                db.execute('EXPLAIN QUERY PLAN ' + sql, params(data))
+            ]
+            timings = []
+            for _ in range(options['repeat']):
+                args = params(data)
+                started = time.perf_counter()
+                db.execute(sql, args).fetchall()
+                timings.append(time.perf_counter() - started)
+            results[title] = (plan, statistics.median(timings) * 1000)
+        return results
+
+    def report(self, results):
+        for title, _, _ in QUERIES:
+            self.stdout.write(f'\n{title}')
+            for stage in ('до', 'после'):
+                plan, median = results[stage][title]
+                self.stdout.write(f'  {stage}: {median:.3f} мс')
+                for step in plan:
+                    self.stdout.write(f'    {step}')
@@ -0,0 +1,98 @@
+import time
+from itertools import chain, islice
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from core import resize
+from posts import blobs
+from posts.models import Post, image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет оригиналы картинок, на которые не ссылается ни один '
+        'пост, а также миниатюры и варианты размеров удалённых картинок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько файлов удалять за один раз.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.5,
+            help='Пауза в секундах между пачками, чтобы не нагружать диск.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+        parser.add_argument(
+            '--every', type=int, default=0,
+            help='Повторять сборку раз в столько секунд (0 — один раз).',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.collect(options)
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def collect(self, options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        dead_keys, live_thumbnails = blobs.kv_orphans()
+        if not dry_run:
+            for start in range(0, len(dead_keys), batch_size):
+                default.kvstore._delete_raw(
+                    *dead_keys[start:start + batch_size])
+        upload_to = Post._meta.get_field('image').upload_to
+        resized_storage = FileSystemStorage(location=resize.cache_root())
+        candidates = chain(
+            (
+                (image_storage, name, size)
+                for name, size in blobs.orphan_files(
+                    image_storage, upload_to, blobs.referenced,
+                    options['min_age'])
+            ),
+            (
+                (default.storage, name, size)
+                for name, size in blobs.orphan_files(
+                    default.storage, thumbnail_settings.THUMBNAIL_PREFIX,
+                    live_thumbnails.intersection, options['min_age'])
+            ),
+            (
+                (resized_storage, name, size)
+                for name, size in blobs.orphan_files(
+                    resized_storage, '', blobs.referenced,
+                    options['min_age'], source=resize.source_name)
+            ),
+        )
+        files = reclaimed = 0
+        while True:
+            batch = list(islice(candidates, batch_size))
+            if not batch:
+                break
+            if files and not dry_run:
+                time.sleep(options['pause'])
+            for storage, name, size in batch:
+                if dry_run:
+                    self.stdout.write(f'{name} ({filesizeformat(size)})')
+                else:
+                    storage.delete(name)
+                files += 1
+                reclaimed += size
+        verb = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(
+            f'{verb} файлов: {files}, записей sorl: {len(dead_keys)}, '
+            f'места: {filesizeformat(reclaimed)}'
+        )
@@ -0,0 +1,118 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts import counters, shards
+from posts.models import Comment, Counter, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сохранённые счётчики постов, подписок '
+        'и комментариев и исправляет накопившиеся расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько строк обрабатывать за один запрос.',
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Повторять сверку каждые N секунд (0 — один проход).',
+        )
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='Завести счётчики всех групп и пользователей заранее.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['create_missing']:
+            created = self.create_missing(batch_size)
+            self.stdout.write(f'Создано счётчиков: {created}')
+        while True:
+            fixed = self.reconcile(batch_size)
+            self.stdout.write(f'Исправлено счётчиков: {fixed}')
+            fixed = self.reconcile_comments(batch_size)
+            self.stdout.write(f'Исправлено постов: {fixed}')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def create_missing(self, batch_size):
+        keys = [counters.POSTS]
+        keys += [
+            counters.group_key(pk)
+            for pk in Group.objects.values_list('pk', flat=True).iterator()
+        ]
+        for pk in User.objects.values_list('pk', flat=True).iterator():
+            keys += counters.user_keys(pk)
+        created = 0
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            existing = set(
+                Counter.objects.filter(key__in=batch).values_list(
+                    'key', flat=True)
+            )
+            missing = [key for key in batch if key not in existing]
+            Counter.objects.bulk_create(
+                [
+                    Counter(key=key, value=counters.queryset_for(key).count())
+                    for key in missing
+                ],
+                ignore_conflicts=True,
+            )
+            created += len(missing)
+        return created
+
+    def reconcile(self, batch_size):
+        fixed = 0
+        last_key = ''
+        while True:
+            batch = list(
+                Counter.objects.filter(key__gt=last_key)
+                .exclude(key__startswith=f'{counters.SEQUENCE}:')
+                .order_by('key')[:batch_size]
+            )
+            if not batch:
+                return fixed
+            for counter in batch:
+                actual = counters.queryset_for(counter.key).count()
+                if actual != counter.value:
+                    Counter.objects.filter(key=counter.key).update(
+                        value=actual
+                    )
+                    fixed += 1
+            last_key = batch[-1].key
+
+    def reconcile_comments(self, batch_size):
+        fixed = 0
+        for database in shards.databases():
+            fixed += self.reconcile_shard_comments(database, batch_size)
+        return fixed
+
+    def reconcile_shard_comments(self, database, batch_size):
+        fixed = 0
+        last_pk = 0
+        posts = Post.objects.using(database).select_related(None)
+        comments = Comment.objects.using(database).select_related(None)
+        while True:
+            batch = dict(
+                posts.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'comment_count')[:batch_size]
+            )
+            if not batch:
+                return fixed
+            actual = dict(
+                comments.filter(post_id__in=batch).order_by()
+                .values_list('post_id').annotate(Count('pk'))
+            )
+            for pk, stored in batch.items():
+                if actual.get(pk, 0) != stored:
+                    posts.filter(pk=pk).update(
+                        comment_count=actual.get(pk, 0)
+                    )
+                    fixed += 1
+            last_pk = max(batch)
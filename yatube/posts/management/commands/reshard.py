@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from posts import shards
+from posts.models import AuthorShard
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты авторов с комментариями, записями лент и архивом '
+        'в их шарды: из основной базы после включения DATABASE_SHARDS, '
+        'по новому хешу после добавления шардов (--rebalance) '
+        'или одного автора в заданный шард (--author, --to).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', type=int, help='id автора.')
+        parser.add_argument('--to', help='Шард для --author.')
+        parser.add_argument(
+            '--rebalance', action='store_true',
+            help='Перенести авторов, чей шард по хешу изменился.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов переносить за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, кто куда переедет.',
+        )
+
+    def handle(self, *args, **options):
+        if not shards.enabled():
+            raise CommandError('DATABASE_SHARDS пуст: задайте DB_SHARDS.')
+        target = options['to']
+        if target is not None and target not in shards.aliases():
+            raise CommandError(f'Нет шарда {target}.')
+        if target is not None and options['author'] is None:
+            raise CommandError('--to задаётся вместе с --author.')
+        if options['author'] is not None:
+            author_id = options['author']
+            moves = [(author_id, target or shards.home(author_id))]
+        else:
+            moves = list(self.plan(options['rebalance']))
+        if options['dry_run']:
+            for author_id, target in moves:
+                self.stdout.write(f'{author_id} -> {target}')
+            self.stdout.write(f'Будет перенесено авторов: {len(moves)}')
+            return
+        posts = 0
+        for author_id, target in moves:
+            posts += shards.move_author(
+                author_id, target, options['batch_size'])
+        self.stdout.write(
+            f'Перенесено авторов: {len(moves)}, постов: {posts}')
+
+    def plan(self, rebalance):
+        """Пары (автор, шард) для авторов не на своём месте."""
+        located = defaultdict(set)
+        for database in (DEFAULT_DB_ALIAS, *shards.aliases()):
+            for model, _ in shards.FAMILIES:
+                author_ids = model._base_manager.using(database).order_by(
+                ).values_list('author_id', flat=True).distinct()
+                for author_id in author_ids.iterator():
+                    located[author_id].add(database)
+        if rebalance:
+            # Закреплённые авторы без постов тоже получают новый шард.
+            for author_id, shard in AuthorShard.objects.values_list(
+                    'author_id', 'shard').iterator():
+                located[author_id].add(shard)
+        for author_id, databases in sorted(located.items()):
+            target = (
+                shards.home(author_id) if rebalance
+                else shards.for_author(author_id)
+            )
+            if databases != {target}:
+                yield author_id, target
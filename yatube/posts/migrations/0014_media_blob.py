@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:53
+
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_media_blobs(apps, schema_editor):
+    MediaBlob = apps.get_model('posts', 'MediaBlob')
+    Post = apps.get_model('posts', 'Post')
+    refs = Post.objects.exclude(image='').order_by().values(
+        'image').annotate(refs=Count('pk')).values_list('image', 'refs')
+    MediaBlob.objects.bulk_create(
+        (MediaBlob(name=name, refs=count) for name, count in refs.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл',
+                'verbose_name_plural': 'Файлы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_media_blobs, migrations.RunPython.noop),
+    ]
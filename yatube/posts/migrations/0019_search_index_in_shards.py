@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from posts import search
+
+
+def install(apps, schema_editor):
+    # В основной базе индекс уже создан 0016: install() его не трогает.
+    search.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_archive'),
+    ]
+
+    operations = [
+        # Подсказка model_name пускает операцию в шарды постов
+        # (posts.shards.ShardRouter.allow_migrate), где 0016 пропускается.
+        migrations.RunPython(
+            install, migrations.RunPython.noop,
+            hints={'model_name': 'post'},
+        ),
+    ]
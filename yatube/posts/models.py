@@ -1,9 +1,102 @@
+import zlib
+
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.query import ModelIterable
+
+from core.storage import ContentAddressedStorage
 
 User = get_user_model()
 STR_LENGHT = 15
 
+image_storage = ContentAddressedStorage()
+
+
+class ShardQuerySet(models.QuerySet):
+    """Выборка модели, которая при DATABASE_SHARDS живёт в шардах
+    (posts.shards).
+
+    Запись без базы и без подсказки instance ушла бы в основную базу,
+    где таких строк нет, поэтому она запрещена, а create() отдаёт
+    выбор шарда роутеру по самой записи. JOIN с таблицами основной
+    базы в шарде невозможен: select_related оставляет связи внутри
+    шарда, остальные объекты подгружаются отдельным запросом.
+    """
+
+    @property
+    def db(self):
+        if self._for_write and self._db is None and not self._hints:
+            from .shards import enabled
+            if enabled():
+                raise ValueError(
+                    f'{self.model.__name__} хранится в шардах: выберите '
+                    f'базу через using() или связанный менеджер.'
+                )
+        return super().db
+
+    def create(self, **kwargs):
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            local = self._shard_local()
+            if local is not self:
+                from .shards import attach_related
+                self._result_cache = list(local._iterable_class(local))
+                attach_related(self._result_cache)
+        super()._fetch_all()
+
+    def iterator(self, chunk_size=2000):
+        local = self._shard_local()
+        if local is not self:
+            return local.iterator(chunk_size)
+        return super().iterator(chunk_size)
+
+    def _shard_local(self):
+        """Копия запроса в шард без JOIN с основной базой или сам
+        запрос, если менять нечего."""
+        related = self.query.select_related
+        if not related or self._iterable_class is not ModelIterable:
+            return self
+        from .shards import SHARDED_MODELS, aliases
+        if self.db not in aliases():
+            return self
+        names = () if related is True else related
+        local = {
+            name: {} for name in names
+            if issubclass(
+                self.model._meta.get_field(name).related_model,
+                SHARDED_MODELS)
+        }
+        clone = self._chain()
+        clone.query.select_related = local or False
+        return clone
+
+
+ShardManager = models.Manager.from_queryset(ShardQuerySet)
+
+
+class PostQuerySet(ShardQuerySet):
+    def with_related(self):
+        """Автор и группа поста приходят тем же запросом."""
+        return self.select_related('author', 'group')
+
+
+class PostManager(models.Manager.from_queryset(PostQuerySet)):
+    """Любая выборка постов, в том числе author.posts и group.posts,
+    сразу подтягивает автора и группу, чтобы шаблоны ленты не делали
+    отдельный запрос на каждый пост."""
+
+    def get_queryset(self):
+        return super().get_queryset().with_related()
+
+
+class CommentManager(ShardManager):
+    def get_queryset(self):
+        return super().get_queryset().select_related('author')
+
 
 class Post(models.Model):
     text = models.TextField(
@@ -21,6 +114,7 @@ class Post(models.Model):
         related_name='posts',
         verbose_name='Автор',
         help_text="Автор поста",
+        db_index=False,
     )
 
     group = models.ForeignKey(
@@ -30,22 +124,89 @@ class Post(models.Model):
         on_delete=models.SET_NULL,
         related_name='posts',
         help_text="Выбрать группу",
-        verbose_name='Группа'
+        verbose_name='Группа',
+        db_index=False,
     )
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True
     )
+    # Заполняются при сохранении картинки (posts.signals), чтобы
+    # рендер не открывал файл ради его размеров. width_field и
+    # height_field не подходят: для строк без размеров ImageField
+    # открывает файл при каждой загрузке модели.
+    image_width = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Ширина картинки',
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Высота картинки',
+    )
+    image_size = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Размер картинки, байт',
+    )
+    image_format = models.CharField(
+        max_length=10,
+        blank=True,
+        editable=False,
+        verbose_name='Формат картинки',
+    )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Комментариев',
+    )
+
+    objects = PostManager()
+
+    # Пост, прочитанный из архива (posts.archive), только для чтения.
+    archived = False
+
+    # Поля, которые меняются только через F() в posts.signals.
+    counter_fields = ('comment_count',)
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
+        # Индексы повторяют порядок ленты (-pub_date, -id) из
+        # posts.paginators и заменяют одиночные индексы author и group.
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:STR_LENGHT]
 
+    def save(self, *args, **kwargs):
+        # Обычное сохранение не перезаписывает счётчики устаревшими
+        # значениями, прочитанными вместе с постом.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
 
 class Group(models.Model):
     title = models.CharField(
@@ -79,22 +240,31 @@ class Comment(models.Model):
         related_name='comments',
         verbose_name='Пост',
         help_text='Пост, к которому относится комментарий',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='comments',
-        verbose_name='Автор комментария'
+        verbose_name='Автор комментария',
     )
     created = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Комментарий создан',
     )
 
+    objects = CommentManager()
+
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:STR_LENGHT]
@@ -105,7 +275,8 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='follower',
-        verbose_name='Подписчик')
+        verbose_name='Подписчик',
+        db_index=False)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -115,6 +286,8 @@ class Follow(models.Model):
     class Meta:
         verbose_name_plural = 'Подписки'
         verbose_name = 'Подписка'
+        # Поиск по (user, author) идёт по индексу unique_following,
+        # выборка подписчиков автора — по индексу внешнего ключа author.
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
@@ -124,3 +297,243 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user} подписался на {self.author}'
+
+
+class MediaBlob(models.Model):
+    """Файл в хранилище по содержимому и число постов, которые на него
+    ссылаются. Когда ссылок не остаётся, файл удаляется (posts.blobs)."""
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name='Имя файла',
+    )
+    refs = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ссылок',
+    )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
+
+
+class Counter(models.Model):
+    """Поддерживаемый счётчик строк, чтобы не считать COUNT(*)
+    на каждый запрос. Ключи описаны в posts.counters."""
+    key = models.CharField(
+        max_length=64,
+        primary_key=True,
+        verbose_name='Ключ',
+    )
+    value = models.BigIntegerField(
+        default=0,
+        verbose_name='Значение',
+    )
+
+    class Meta:
+        verbose_name = 'Счётчик'
+        verbose_name_plural = 'Счётчики'
+
+    def __str__(self):
+        return f'{self.key}={self.value}'
+
+
+class TimelineEntry(models.Model):
+    """Строка материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (рассылка подписчикам),
+    при подписке и чистится при отписке, см. posts.timeline.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+        db_index=False,
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации поста',
+    )
+
+    objects = ShardManager()
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class AuthorShard(models.Model):
+    """Шард, в котором лежат посты автора с комментариями и записями
+    лент (posts.shards). Переносит автора команда reshard."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    shard = models.CharField(
+        max_length=64,
+        verbose_name='Шард',
+    )
+
+    class Meta:
+        verbose_name = 'Шард автора'
+        verbose_name_plural = 'Шарды авторов'
+
+    def __str__(self):
+        return f'{self.author_id}: {self.shard}'
+
+
+class CompressedText:
+    """Текст хранится в compressed_text сжатым zlib и читается как
+    обычное поле text."""
+
+    @property
+    def text(self):
+        return zlib.decompress(self.compressed_text).decode()
+
+    @text.setter
+    def text(self, value):
+        self.compressed_text = zlib.compress(value.encode(), 9)
+
+    def __str__(self):
+        return self.text[:STR_LENGHT]
+
+
+class ArchivedPost(CompressedText, models.Model):
+    """Старый пост, перенесённый из posts_post (posts.archive).
+
+    Только для чтения: id и поля совпадают с исходным постом, а из
+    индексов оставлен один — для профиля автора.
+    """
+    id = models.IntegerField(
+        primary_key=True,
+        verbose_name='ID поста',
+    )
+    compressed_text = models.BinaryField(
+        verbose_name='Сжатый текст поста',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+        db_index=False,
+    )
+    group = models.ForeignKey(
+        Group,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Группа',
+        db_index=False,
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        storage=image_storage,
+        blank=True
+    )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        verbose_name='Ширина картинки',
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        verbose_name='Высота картинки',
+    )
+    image_size = models.PositiveIntegerField(
+        null=True,
+        verbose_name='Размер картинки, байт',
+    )
+    image_format = models.CharField(
+        max_length=10,
+        blank=True,
+        verbose_name='Формат картинки',
+    )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Комментариев',
+    )
+
+    objects = PostManager()
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Пост в архиве'
+        verbose_name_plural = 'Посты в архиве'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='archived_post_author_idx'
+            ),
+        ]
+
+
+class ArchivedComment(CompressedText, models.Model):
+    """Комментарий к посту из архива."""
+    id = models.IntegerField(
+        primary_key=True,
+        verbose_name='ID комментария',
+    )
+    compressed_text = models.BinaryField(
+        verbose_name='Сжатый комментарий',
+    )
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор комментария',
+        db_index=False,
+    )
+    created = models.DateTimeField(
+        verbose_name='Комментарий создан',
+    )
+
+    objects = CommentManager()
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Комментарий в архиве'
+        verbose_name_plural = 'Комментарии в архиве'
@@ -0,0 +1,277 @@
+import base64
+import binascii
+from datetime import datetime, timedelta
+
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import counters, shards
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# До такого размера таблицы оценка не нужна: COUNT(*) и так быстрый.
+ESTIMATE_THRESHOLD = 10_000
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, date, pk):
+    """Упаковывает позицию (дата, id) в непрозрачный токен для URL."""
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    delta = date - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 10 ** 6
+    micros += delta.microseconds
+    raw = f'{direction}:{micros}:{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (направление, дата, id) или None для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, micros, pk = raw.decode().split(':')
+        date = EPOCH + timedelta(microseconds=int(micros))
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, OverflowError):
+        return None
+    if direction not in (NEXT, PREVIOUS):
+        return None
+    return direction, date, pk
+
+
+class CursorLinksMixin:
+    """Курсоры соседних страниц, построенные по крайним записям."""
+
+    def _edge_cursor(self, index, direction):
+        if not len(self):
+            return None
+        obj = self[index]
+        paginator = self.paginator
+        return encode_cursor(
+            direction,
+            getattr(obj, paginator.date_field),
+            getattr(obj, paginator.pk_field),
+        )
+
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return self._edge_cursor(-1, NEXT)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return self._edge_cursor(0, PREVIOUS)
+
+
+class OffsetPage(CursorLinksMixin, Page):
+    """Страница по номеру (?page=N) с курсорами для ссылок на соседей."""
+
+
+class CursorPage(CursorLinksMixin, Page):
+    """Страница, выбранная по ключу (дата, id), а не по смещению.
+
+    Номера страницы у неё нет, поэтому навигация идёт только
+    по курсорам соседних страниц. Записи выбираются лениво,
+    при первом обращении к object_list.
+    """
+
+    def __init__(self, paginator, direction, position):
+        self.paginator = paginator
+        self.number = None
+        self.direction = direction
+        self.position = position
+        self._object_list = None
+        self._has_next = False
+        self._has_previous = False
+
+    def __repr__(self):
+        return '<Cursor page %s>' % (
+            encode_cursor(self.direction, *self.position)
+            if self.position else 'first'
+        )
+
+    @property
+    def object_list(self):
+        self._fetch()
+        return self._object_list
+
+    @object_list.setter
+    def object_list(self, value):
+        self._object_list = value
+
+    def _fetch(self):
+        if self._object_list is not None:
+            return
+        paginator = self.paginator
+        per_page = paginator.per_page
+        if self.direction == PREVIOUS:
+            rows = list(paginator.after(self.position)[:per_page + 1])
+            self._has_previous = len(rows) > per_page
+            self._has_next = True
+            rows = rows[:per_page]
+            rows.reverse()
+        else:
+            rows = list(paginator.before(self.position)[:per_page + 1])
+            self._has_next = len(rows) > per_page
+            self._has_previous = self.position is not None
+            rows = rows[:per_page]
+        self._object_list = rows
+
+    def has_next(self):
+        self._fetch()
+        return self._has_next
+
+    def has_previous(self):
+        self._fetch()
+        return self._has_previous
+
+    def next_page_number(self):
+        return None
+
+    def previous_page_number(self):
+        return None
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор ленты с переходом по курсорам.
+
+    Страница с параметром ``cursor`` выбирается диапазоном по индексу
+    (дата, id) и стоит одинаково на любой глубине. Старые ссылки
+    ``?page=N`` продолжают работать через обычное смещение, но ссылки
+    «вперёд/назад» у любой страницы строятся по курсорам.
+    """
+
+    date_field = 'pub_date'
+    pk_field = 'pk'
+
+    def __init__(self, object_list, per_page, **kwargs):
+        object_list = object_list.order_by(
+            '-' + self.date_field, '-' + self.pk_field
+        )
+        super().__init__(object_list, per_page, **kwargs)
+
+    def before(self, position):
+        """Записи старше позиции, от новых к старым.
+
+        Условие на дату вынесено отдельно, чтобы база начинала
+        просмотр индекса (-pub_date, -id) сразу с позиции курсора.
+        """
+        if position is None:
+            return self.object_list
+        date, pk = position
+        return self.object_list.filter(
+            Q(**{self.date_field + '__lte': date}),
+            Q(**{self.date_field + '__lt': date})
+            | Q(**{self.pk_field + '__lt': pk}),
+        )
+
+    def after(self, position):
+        """Записи новее позиции, от старых к новым."""
+        date, pk = position
+        return self.object_list.filter(
+            Q(**{self.date_field + '__gte': date}),
+            Q(**{self.date_field + '__gt': date})
+            | Q(**{self.pk_field + '__gt': pk}),
+        ).reverse()
+
+    def cursor_page(self, token):
+        cursor = decode_cursor(token) if token else None
+        if cursor is None:
+            return CursorPage(self, NEXT, None)
+        direction, date, pk = cursor
+        return CursorPage(self, direction, (date, pk))
+
+    def get_page(self, number=None, cursor=None):
+        if cursor is not None:
+            return self.cursor_page(cursor)
+        return super().get_page(number)
+
+    def _get_page(self, *args, **kwargs):
+        return OffsetPage(*args, **kwargs)
+
+
+class CounterPaginator(CursorPaginator):
+    """Пагинатор, который берёт общее число записей из счётчика
+    posts.counters (или из total — числа или функции, которая
+    вызывается, только когда число понадобится) вместо SELECT COUNT(*)
+    по ленте."""
+
+    def __init__(self, object_list, per_page, counter_key=None, total=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.counter_key = counter_key
+        self.total = total
+
+    @cached_property
+    def count(self):
+        if callable(self.total):
+            return self.total()
+        if self.total is not None:
+            return self.total
+        if self.counter_key is None:
+            return super().count
+        return counters.get(self.counter_key)
+
+
+def estimated_count(queryset):
+    """Примерное число строк в таблице модели без полного просмотра.
+
+    PostgreSQL берёт оценку планировщика из pg_class, SQLite —
+    наибольший rowid (поиск по B-дереву; удалённые строки дают
+    оценку сверху). Небольшие таблицы и другие базы считаются точно.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [connection.ops.quote_name(table)],
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        else:
+            return queryset.count()
+        row = cursor.fetchone()
+    estimate = row[0] if row and row[0] else 0
+    if estimate < ESTIMATE_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class AdminPaginator(Paginator):
+    """Пагинатор списков админки без COUNT(*) по всей таблице.
+
+    Для выборки без фильтров число строк берётся из счётчика
+    posts.counters (counter_key) или оценкой estimated_count();
+    отфильтрованная выборка и выборка из одного шарда считаются
+    как обычно: счётчик общий, а номера строк в шардах сквозные.
+    """
+    counter_key = None
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.where or queryset.db in shards.aliases():
+            return super().count
+        if self.counter_key is not None:
+            return counters.get(self.counter_key)
+        return estimated_count(queryset)
+
+
+class PostAdminPaginator(AdminPaginator):
+    counter_key = counters.POSTS
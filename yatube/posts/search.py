@@ -0,0 +1,196 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+В SQLite текст индексирует таблица FTS5 рядом с таблицей модели
+(posts_post_fts для posts_post) с внешним содержимым: сам текст
+в индексе не дублируется. Триггеры базы держат индекс в актуальном
+состоянии при любом изменении строк, в том числе через
+QuerySet.update() и bulk_create(), минуя сигналы. В PostgreSQL
+поиск идёт по GIN-индексу на to_tsvector().
+
+Запрос пользователя не передаётся в синтаксис FTS как есть: из него
+берутся слова, последнее ищется как префикс.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, Func, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Comment, Post
+
+MODELS = (Post, Comment)
+# Словарь PostgreSQL для стемминга.
+PG_CONFIG = 'russian'
+SNIPPET_WORDS = 16
+# Границы подсветки во фрагменте: управляющие символы не встречаются
+# в тексте, и фрагмент можно экранировать до вставки <mark>.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+WORD_RE = re.compile(r'\w+')
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def _sqlite_statements(model):
+    table = model._meta.db_table
+    fts = fts_table(model)
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(text, "
+        f"content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} '
+        f'BEGIN INSERT INTO {fts} (rowid, text) VALUES (new.id, new.text); '
+        f'END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} '
+        f"BEGIN INSERT INTO {fts} ({fts}, rowid, text) "
+        f"VALUES ('delete', old.id, old.text); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update '
+        f'AFTER UPDATE OF text ON {table} '
+        f"BEGIN INSERT INTO {fts} ({fts}, rowid, text) "
+        f"VALUES ('delete', old.id, old.text); "
+        f'INSERT INTO {fts} (rowid, text) VALUES (new.id, new.text); END',
+    )
+
+
+def install(schema_connection):
+    """Создаёт индексы, которых нет; возвращает число созданных.
+
+    Безопасно вызывать повторно. Миграции SQLite, пересоздающие
+    таблицу модели, удаляют её триггеры: тогда они создаются заново,
+    а индекс перестраивается по текущему содержимому таблицы.
+    """
+    created = 0
+    with schema_connection.cursor() as cursor:
+        if schema_connection.vendor == 'sqlite':
+            for model in MODELS:
+                fts = fts_table(model)
+                cursor.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE type = "
+                    "'trigger' AND name LIKE %s",
+                    [f'{fts}_%'],
+                )
+                if cursor.fetchone()[0] == 3:
+                    continue
+                for statement in _sqlite_statements(model):
+                    cursor.execute(statement)
+                cursor.execute(
+                    f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+                created += 1
+        elif schema_connection.vendor == 'postgresql':
+            for model in MODELS:
+                table = model._meta.db_table
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_text_search '
+                    f'ON {table} USING GIN '
+                    f"(to_tsvector('{PG_CONFIG}'::regconfig, "
+                    f"COALESCE(text, '')))"
+                )
+                created += 1
+    return created
+
+
+def uninstall(schema_connection):
+    with schema_connection.cursor() as cursor:
+        for model in MODELS:
+            if schema_connection.vendor == 'sqlite':
+                cursor.execute(f'DROP TABLE IF EXISTS {fts_table(model)}')
+                for suffix in ('insert', 'delete', 'update'):
+                    cursor.execute(
+                        f'DROP TRIGGER IF EXISTS {fts_table(model)}_{suffix}')
+            elif schema_connection.vendor == 'postgresql':
+                cursor.execute(
+                    'DROP INDEX IF EXISTS '
+                    f'{model._meta.db_table}_text_search')
+
+
+def words(query):
+    return WORD_RE.findall(query or '')
+
+
+def _fts_query(found):
+    # Слова в кавычках — только слова, без операторов FTS5.
+    return ' '.join(f'"{word}"' for word in found) + '*'
+
+
+def _pg_query(found):
+    return ' & '.join(found) + ':*'
+
+
+def _pg_vector():
+    # Выражение совпадает с выражением GIN-индекса из install().
+    from django.contrib.postgres.search import SearchVectorField
+    return Func(
+        Value(PG_CONFIG), Func(F('text'), Value(''), function='COALESCE'),
+        function='to_tsvector', output_field=SearchVectorField(),
+    )
+
+
+def _pg_search_query(found):
+    from django.contrib.postgres.search import SearchQuery
+    return SearchQuery(_pg_query(found), config=PG_CONFIG, search_type='raw')
+
+
+def matching(queryset, query):
+    """Записи queryset, в тексте которых есть все слова запроса."""
+    found = words(query)
+    if not found:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        return queryset.annotate(search_vector=_pg_vector()).filter(
+            search_vector=_pg_search_query(found))
+    fts = fts_table(queryset.model)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s',
+        [_fts_query(found)],
+    ))
+
+
+def ranked(queryset, query):
+    """Найденные записи по убыванию релевантности.
+
+    У каждой записи есть snippet — фрагмент текста вокруг найденных
+    слов с границами подсветки, который строит сам индекс.
+    """
+    found = words(query)
+    if not found:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchRank
+        search_query = _pg_search_query(found)
+        options = (
+            f'StartSel={MARK_START}, StopSel={MARK_END}, '
+            f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}'
+        )
+        return matching(queryset, query).annotate(
+            rank=SearchRank(_pg_vector(), search_query),
+            snippet=Func(
+                Value(PG_CONFIG), F('text'), search_query, Value(options),
+                function='ts_headline', output_field=TextField(),
+            ),
+        ).order_by('-rank', '-pk')
+    fts = fts_table(queryset.model)
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[fts],
+        where=[f'{fts}.rowid = {table}.id', f'{fts} MATCH %s'],
+        params=[_fts_query(found)],
+        select={
+            'snippet': f"snippet({fts}, 0, %s, %s, '…', %s)",
+            'rank': f'{fts}.rank',
+        },
+        select_params=[MARK_START, MARK_END, SNIPPET_WORDS],
+    ).order_by('rank', '-pk')
+
+
+def highlight(snippet):
+    """HTML фрагмента: текст экранирован, найденные слова в <mark>."""
+    return mark_safe(
+        escape(snippet or '')
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
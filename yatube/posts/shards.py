@@ -0,0 +1,434 @@
+"""Шардирование постов по автору.
+
+Посты автора вместе с комментариями к ним и записями лент подписок
+лежат в одной базе из DATABASE_SHARDS. Какой именно, записано в
+AuthorShard; новый автор получает шард рендезвус-хешированием, так
+что после добавления шарда переезжает лишь около 1/N авторов.
+Архив старых постов (posts.archive) лежит в том же шарде.
+Пользователи, группы, подписки и счётчики остаются в основной базе.
+
+Запросы к одному автору идут в его шард, ленты (главная, группа,
+подписки, поиск) собираются из всех шардов: в каждом берётся
+столько строк, сколько нужно странице, и списки сливаются по ключу
+сортировки (scatter-gather). JOIN с таблицами основной базы в шарде
+невозможен, поэтому авторы и группы подгружаются отдельно, одним
+запросом на страницу.
+
+Идентификаторы постов и комментариев общие для всех шардов: их
+выдаёт последовательность в основной базе, и при переносе автора
+они не меняются. Пока DATABASE_SHARDS пуст, модуль ничего не меняет
+и все таблицы живут в основной базе.
+"""
+import hashlib
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F, Max
+from django.http import Http404
+from django.shortcuts import get_object_or_404 as _get_object_or_404
+
+from . import counters
+from .models import (ArchivedComment, ArchivedPost, AuthorShard, Comment,
+                     Counter, Post, TimelineEntry, User)
+
+SHARDED_MODELS = (
+    Post, Comment, TimelineEntry, ArchivedPost, ArchivedComment)
+# Посты и строки, которые переезжают вместе с ними.
+FAMILIES = (
+    (Post, (Comment, TimelineEntry)),
+    (ArchivedPost, (ArchivedComment,)),
+)
+CACHE_PREFIX = 'shard:author:'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def aliases():
+    return getattr(settings, 'DATABASE_SHARDS', [])
+
+
+def enabled():
+    return bool(aliases())
+
+
+def is_sharded(model):
+    return enabled() and issubclass(model, SHARDED_MODELS)
+
+
+def home(author_id, shards=None):
+    """Шард автора по рендезвус-хешу: у каждого шарда свой вес."""
+    def weight(alias):
+        return hashlib.blake2b(
+            f'{alias}:{author_id}'.encode(), digest_size=8).digest()
+    return max(shards or aliases(), key=weight)
+
+
+def for_author(author_id):
+    """Шард, из которого читаются посты автора."""
+    key = f'{CACHE_PREFIX}{author_id}'
+    alias = cache.get(key)
+    # Запись кеша могла остаться от другого набора шардов.
+    if alias not in aliases():
+        alias = AuthorShard.objects.filter(author_id=author_id).values_list(
+            'shard', flat=True).first() or home(author_id)
+        cache.set(key, alias, CACHE_TIMEOUT)
+    return alias
+
+
+def assign(author_id, alias=None):
+    """Закрепляет автора за шардом и возвращает его.
+
+    Без alias автор остаётся в своём шарде, а новый получает шард
+    по хешу.
+    """
+    if alias is None:
+        alias = AuthorShard.objects.get_or_create(
+            author_id=author_id, defaults={'shard': home(author_id)},
+        )[0].shard
+    else:
+        AuthorShard.objects.update_or_create(
+            author_id=author_id, defaults={'shard': alias})
+    cache.set(f'{CACHE_PREFIX}{author_id}', alias, CACHE_TIMEOUT)
+    return alias
+
+
+def author_db(author_id):
+    """База постов автора или None, если шардов нет и базу
+    выбирают роутеры."""
+    return for_author(author_id) if enabled() else None
+
+
+def next_id(model):
+    """Следующий общий идентификатор модели."""
+    key = counters.sequence_key(model._meta.db_table)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not Counter.objects.filter(key=key).update(value=F('value') + 1):
+            start = max(
+                model._base_manager.using(alias).aggregate(
+                    top=Max('pk'))['top'] or 0
+                for alias in (DEFAULT_DB_ALIAS, *aliases())
+            )
+            try:
+                with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                    Counter.objects.create(key=key, value=start + 1)
+            except IntegrityError:
+                Counter.objects.filter(key=key).update(
+                    value=F('value') + 1)
+        return Counter.objects.values_list('value', flat=True).get(key=key)
+
+
+def databases():
+    """Базы с постами; None — базу выбирают роутеры."""
+    return aliases() or [None]
+
+
+def each(queryset, author_id=None):
+    """Копии запроса для каждого шарда (или шарда автора).
+
+    Без шардов возвращает сам запрос: базу выбирают роутеры.
+    """
+    if not enabled():
+        return [queryset]
+    shards = aliases() if author_id is None else [for_author(author_id)]
+    return [queryset.using(alias).select_related(None) for alias in shards]
+
+
+def scatter(queryset, author_id=None):
+    """Запрос ко всем шардам, который ведёт себя как один QuerySet
+    в пагинаторах и шаблонах."""
+    if not enabled():
+        return queryset
+    return Scatter(each(queryset, author_id))
+
+
+def first(queryset, **kwargs):
+    """Первая подходящая запись из любого шарда или None."""
+    for shard_queryset in each(queryset.filter(**kwargs)):
+        obj = shard_queryset.first()
+        if obj is not None:
+            attach_related([obj])
+            return obj
+    return None
+
+
+def get_object_or_404(queryset, **kwargs):
+    if not enabled():
+        return _get_object_or_404(queryset, **kwargs)
+    obj = first(queryset, **kwargs)
+    if obj is None:
+        raise Http404(
+            f'{queryset.model._meta.object_name} не найден.')
+    return obj
+
+
+def attach_related(objects):
+    """Подставляет связанные объекты из основной базы (авторов,
+    группы) одним запросом на каждую связь."""
+    if not objects or not enabled():
+        return
+    by_model = {}
+    for obj in objects:
+        by_model.setdefault(type(obj), []).append(obj)
+    for model, group in by_model.items():
+        for field in model._meta.concrete_fields:
+            if not field.is_relation or field.remote_field.model is None:
+                continue
+            related = field.remote_field.model
+            if issubclass(related, SHARDED_MODELS):
+                continue
+            ids = {getattr(obj, field.attname) for obj in group} - {None}
+            found = related._default_manager.in_bulk(ids)
+            for obj in group:
+                value = found.get(getattr(obj, field.attname))
+                if value is not None:
+                    field.set_cached_value(obj, value)
+
+
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _ordering(queryset):
+    """Поля сортировки запроса: [(имя, по убыванию), ...]."""
+    query = queryset.query
+    fields = query.order_by or (
+        queryset.model._meta.ordering if query.default_ordering else ())
+    ordering = []
+    for field in fields:
+        if not isinstance(field, str) or '__' in field:
+            raise ValueError(f'Нельзя слить шарды по {field!r}.')
+        descending = field.startswith('-')
+        if not query.standard_ordering:
+            descending = not descending
+        ordering.append((field.lstrip('-'), descending))
+    return ordering
+
+
+class Scatter:
+    """Один и тот же запрос к нескольким шардам.
+
+    Поддерживает то, что нужно пагинаторам: filter(), order_by(),
+    reverse(), count() и срезы. Срез [a:b] берёт из каждого шарда
+    первые b строк и сливает их k-путевым слиянием (heapq.merge)
+    по полям сортировки, поэтому глубокие страницы по номеру
+    дороже, чем по курсору.
+
+    Запросы могут быть и к разным моделям с общими полями сортировки
+    (посты и архив, posts.archive); convert приводит строки к одному
+    виду.
+    """
+
+    ordered = True
+
+    def __init__(self, querysets, convert=None):
+        self.querysets = querysets
+        self.model = querysets[0].model
+        self.convert = convert
+        self._result_cache = None
+
+    def __repr__(self):
+        return f'<Scatter {self.model.__name__} x{len(self.querysets)}>'
+
+    def _chain(self, method, *args, **kwargs):
+        return Scatter([
+            getattr(queryset, method)(*args, **kwargs)
+            for queryset in self.querysets
+        ], self.convert)
+
+    def all(self):
+        return self._chain('all')
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._chain('order_by', *fields)
+
+    def reverse(self):
+        return self._chain('reverse')
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def _sort_key(self):
+        ordering = _ordering(self.querysets[0])
+
+        def key(obj):
+            return tuple(
+                _Descending(getattr(obj, name)) if descending
+                else getattr(obj, name)
+                for name, descending in ordering
+            )
+        return key
+
+    def _merge(self, stop=None):
+        sources = [
+            queryset if stop is None else queryset[:stop]
+            for queryset in self.querysets
+        ]
+        rows = list(islice(
+            heapq.merge(*sources, key=self._sort_key()), stop))
+        attach_related(rows)
+        if self.convert is not None:
+            rows = [self.convert(row) for row in rows]
+        return rows
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            if k.step is not None or (k.start or 0) < 0 or (
+                    k.stop is not None and k.stop < 0):
+                raise ValueError('Поддерживаются только срезы без шага.')
+            if self._result_cache is not None:
+                return self._result_cache[k]
+            return self._merge(k.stop)[k.start or 0:]
+        return self[k:k + 1][0]
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = self._merge()
+        return self._result_cache
+
+    def __iter__(self):
+        return iter(self._fetch_all())
+
+    def __len__(self):
+        return len(self._fetch_all())
+
+    def __bool__(self):
+        return bool(self._fetch_all())
+
+
+def _owner_db(instance, create):
+    """Шард новой записи: по автору поста или по посту комментария."""
+    if isinstance(instance, (Comment, ArchivedComment)):
+        field = type(instance).post.field
+        post = field.get_cached_value(instance, None)
+        if post is not None and not post._state.adding:
+            return post._state.db
+        post = first(field.related_model._base_manager.all(),
+                     pk=instance.post_id)
+        return post._state.db if post is not None else None
+    if instance.author_id is None:
+        return None
+    if create:
+        return assign(instance.author_id)
+    return for_author(instance.author_id)
+
+
+class ShardRouter:
+    """Направляет запросы к постам, комментариям и лентам в шарды.
+
+    Работает по подсказке instance, которую Django передаёт при
+    сохранении и в связанных менеджерах (author.posts, post.comments).
+    Чтения без подсказки остаются на следующем роутере: их база
+    выбирается явно через each() и scatter(). Запись без подсказки
+    и без базы запрещает ShardQuerySet (posts.models), а create()
+    передаёт роутеру саму запись.
+    """
+
+    def _db(self, model, instance, create):
+        if instance is None or not is_sharded(model):
+            return None
+        if isinstance(instance, SHARDED_MODELS):
+            if not instance._state.adding:
+                return instance._state.db
+            return _owner_db(instance, create)
+        if model is Post and isinstance(instance, User):
+            return assign(instance.pk) if create else for_author(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints.get('instance'), create=False)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints.get('instance'), create=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        sharded = [is_sharded(type(obj)) for obj in (obj1, obj2)]
+        if not any(sharded):
+            return None
+        if all(sharded):
+            # Базу новой записи выберет db_for_write при сохранении.
+            return (
+                obj1._state.db == obj2._state.db
+                or obj1._state.adding or obj2._state.adding
+            )
+        # Пользователи и группы из основной базы связываются
+        # с записями любого шарда.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in aliases():
+            return None
+        return app_label == 'posts' and model_name in {
+            model._meta.model_name for model in SHARDED_MODELS
+        }
+
+
+def move_author(author_id, target, batch_size=500):
+    """Переносит посты автора с комментариями и записями лент,
+    а также его архив, в шард target и возвращает число
+    перенесённых постов.
+
+    Сначала автор закрепляется за target, чтобы новые записи шли
+    туда, потом строки копируются пачками: вставка в target, затем
+    удаление из источника. Повторный запуск после сбоя безопасен:
+    уже скопированные строки пропускаются.
+    """
+    assign(author_id, target)
+    moved = 0
+    for source in (DEFAULT_DB_ALIAS, *aliases()):
+        if source == target:
+            continue
+        for model, children in FAMILIES:
+            while True:
+                ids = list(
+                    model._base_manager.using(source).filter(
+                        author_id=author_id).order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                _copy_posts(model, children, ids, source, target)
+                moved += len(ids)
+    return moved
+
+
+def _copy_posts(model, children, ids, source, target):
+    lookups = ((model, {'pk__in': ids}), *(
+        (child, {'post_id__in': ids}) for child in children))
+    rows = [
+        (model, list(model._base_manager.using(source).filter(**lookup)))
+        for model, lookup in lookups
+    ]
+    for model, objects in rows:
+        if model is TimelineEntry:
+            # Записи лент получают номера в новой базе.
+            for entry in objects:
+                entry.pk = None
+    with transaction.atomic(using=target):
+        for model, objects in rows:
+            model._base_manager.using(target).bulk_create(
+                objects, ignore_conflicts=True)
+    with transaction.atomic(using=source):
+        for model, lookup in reversed(lookups):
+            # Без сигналов: для счётчиков и файлов пост не удалялся.
+            queryset = model._base_manager.using(source).filter(**lookup)
+            queryset._raw_delete(source)
@@ -0,0 +1,205 @@
+from django.db import connections
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import blobs, caching, counters, images, search, shards, timeline
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     Post, TimelineEntry, User)
+
+NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=Post)
+def remember_saved(sender, instance, using, **kwargs):
+    instance._saved_group_id, instance._saved_image = None, ''
+    if instance.pk is not None:
+        saved = Post.objects.using(using).filter(pk=instance.pk).values_list(
+            'group_id', 'image'
+        ).first()
+        if saved is not None:
+            instance._saved_group_id, instance._saved_image = saved
+    if instance.image.name != instance._saved_image:
+        images.fill_metadata(instance)
+    instance._retained_image = blobs.retain_upload(instance.image)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def assign_shared_id(sender, instance, raw, **kwargs):
+    # Номера из одной последовательности не совпадают между шардами.
+    if instance.pk is None and not raw and shards.enabled():
+        instance.pk = shards.next_id(sender)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    old_group_id = getattr(instance, '_saved_group_id', None)
+    caching.bump(*caching.post_scopes(instance, [old_group_id]))
+    old_image = getattr(instance, '_saved_image', '')
+    retained = getattr(instance, '_retained_image', '')
+    if instance.image.name != old_image:
+        if retained != instance.image.name:
+            blobs.retain(instance.image.name)
+            blobs.release(retained)
+        blobs.release(old_image)
+    elif retained:
+        # Ту же картинку загрузили заново: ссылка на неё уже была.
+        blobs.release(retained)
+    if created:
+        counters.incr(counters.post_keys(instance))
+        timeline.fan_out(instance)
+        return
+    caching.bump(caching.post_scope(instance.pk))
+    if old_group_id != instance.group_id:
+        if old_group_id is not None:
+            counters.incr([counters.group_key(old_group_id)], -1)
+        if instance.group_id is not None:
+            counters.incr([counters.group_key(instance.group_id)])
+
+
+@receiver(pre_delete, sender=Post)
+def remember_readers(sender, instance, using, **kwargs):
+    # Каскад удалит записи лент: запоминаем, из чьих лент уходит пост.
+    instance._reader_ids = list(
+        TimelineEntry.objects.using(using).filter(
+            post_id=instance.pk).values_list('user_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    blobs.release(instance.image.name)
+    counters.incr(counters.post_keys(instance), -1)
+    counters.incr(
+        [
+            counters.feed_key(user_id)
+            for user_id in getattr(instance, '_reader_ids', ())
+        ],
+        -1,
+    )
+    caching.bump(*caching.post_scopes(instance))
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def archived_post_deleted(sender, instance, **kwargs):
+    blobs.release(instance.image.name)
+    counters.incr([counters.author_key(instance.author_id)], -1)
+    caching.bump(caching.author_scope(instance.author_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow(sender, instance, created, **kwargs):
+    if created:
+        counters.incr([counters.followers_key(instance.author_id)])
+        counters.incr([counters.following_key(instance.user_id)])
+        caching.bump(
+            caching.follows_scope(instance.author_id),
+            caching.follows_scope(instance.user_id),
+        )
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow(sender, instance, **kwargs):
+    counters.incr([counters.followers_key(instance.author_id)], -1)
+    counters.incr([counters.following_key(instance.user_id)], -1)
+    caching.bump(
+        caching.follows_scope(instance.author_id),
+        caching.follows_scope(instance.user_id),
+    )
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, using, **kwargs):
+    if created:
+        Post.objects.using(using).filter(pk=instance.post_id).update(
+            comment_count=F('comment_count') + 1
+        )
+        caching.bump(caching.comments_scope(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, using, **kwargs):
+    posts = Post.objects.using(using)
+    posts.filter(pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1
+    )
+    caching.bump(caching.comments_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        caching.bump(caching.group_info_scope(instance.pk), caching.GLOBAL)
+
+
+@receiver(pre_delete, sender=Group)
+def ungroup_sharded_posts(sender, instance, **kwargs):
+    # SET_NULL выполняет Django и только в базе группы.
+    if shards.enabled():
+        for model in (Post, ArchivedPost):
+            for posts in shards.each(
+                    model.objects.filter(group_id=instance.pk)):
+                posts.update(group=None)
+
+
+@receiver(post_delete, sender=Group)
+def drop_group_counters(sender, instance, **kwargs):
+    counters.drop([counters.group_key(instance.pk)])
+    caching.bump(caching.group_info_scope(instance.pk), caching.GLOBAL)
+
+
+@receiver(pre_save, sender=User)
+def remember_name(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login, имя не сверяем.
+    instance._saved_name = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(NAME_FIELDS) & set(
+            update_fields):
+        return
+    instance._saved_name = User.objects.filter(
+        pk=instance.pk
+    ).values_list(*NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    old_name = getattr(instance, '_saved_name', None)
+    name = tuple(getattr(instance, field) for field in NAME_FIELDS)
+    if old_name is not None and old_name != name:
+        caching.bump(caching.user_scope(instance.pk), caching.GLOBAL)
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_rows(sender, instance, **kwargs):
+    # Каскад Django не выходит за пределы базы пользователя.
+    if not shards.enabled():
+        return
+    for model, field in (
+        (Post, 'author_id'),
+        (Comment, 'author_id'),
+        (TimelineEntry, 'user_id'),
+        (ArchivedPost, 'author_id'),
+        (ArchivedComment, 'author_id'),
+    ):
+        for queryset in shards.each(model.objects.filter(
+                **{field: instance.pk})):
+            queryset.delete()
+
+
+@receiver(post_delete, sender=User)
+def drop_user_counters(sender, instance, **kwargs):
+    counters.drop(counters.user_keys(instance.pk))
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    # Миграции SQLite, пересоздающие таблицу, теряют её триггеры.
+    connection = connections[using]
+    if (sender.name == 'posts' and search.fts_table(Post)
+            in connection.introspection.table_names()):
+        search.install(connection)
@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import caching, thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_fragments(posts, show_link=False, author_hide=False):
+    """HTML постов страницы, собранный из кеша фрагментов."""
+    return [
+        mark_safe(fragment) for fragment in caching.render_fragments(
+            posts,
+            'posts/post_info.html',
+            prepare=thumbnails.prefetch,
+            show_link=show_link,
+            author_hide=author_hide,
+        )
+    ]
@@ -0,0 +1,11 @@
+from django import template
+
+from posts import search
+
+register = template.Library()
+
+
+@register.filter
+def highlight(snippet):
+    """Фрагмент из поискового индекса с найденными словами в <mark>."""
+    return search.highlight(snippet)
@@ -0,0 +1,11 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post):
+    """<img> с вариантами картинки поста или заглушка, пока их нет."""
+    return {'post': post, 'image': thumbnails.responsive_image(post)}
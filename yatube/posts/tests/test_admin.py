@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import counters, paginators
+from ..models import Comment, Follow, Group, Post, User
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'group-{i}')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'user-{User.objects.count()}')
+            post = Post.objects.create(
+                author=author, text=f'Пост {i}', group=self.groups[i % 3])
+            Comment.objects.create(post=post, author=author, text='Текст')
+            Follow.objects.create(user=author, author=self.admin)
+
+    def changelist_queries(self, name):
+        url = reverse(f'admin:posts_{name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_query_count_does_not_grow_with_rows(self):
+        """Число запросов списка не зависит от числа строк."""
+        self.add_rows(2)
+        for name in ('post', 'comment', 'follow'):
+            self.changelist_queries(name)
+            before = len(self.changelist_queries(name))
+            self.add_rows(5)
+            with self.subTest(name=name):
+                self.assertEqual(len(self.changelist_queries(name)), before)
+
+    def test_post_changelist_counts_from_counter(self):
+        self.add_rows(2)
+        counters.get(counters.POSTS)
+        queries = self.changelist_queries('post')
+        self.assertFalse([
+            sql for sql in queries
+            if 'COUNT(' in sql and 'posts_post' in sql
+        ])
+
+    def test_estimated_count_for_big_tables(self):
+        self.add_rows(3)
+        Comment.objects.filter(
+            pk__in=Comment.objects.order_by('pk')[:2]).delete()
+        with mock.patch.object(paginators, 'ESTIMATE_THRESHOLD', 0):
+            estimate = paginators.estimated_count(Comment.objects.all())
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(estimate, Comment.objects.latest('pk').pk)
@@ -0,0 +1,159 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import archive, counters
+from ..models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                      Post, TimelineEntry, User)
+from .test_shards import ShardedTestCase
+
+
+def make_old(post, days):
+    Post._base_manager.using(post._state.db).filter(pk=post.pk).update(
+        pub_date=timezone.now() - timedelta(days=days))
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    def setUp(self):
+        cache.clear()
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.old = Post.objects.create(
+            author=self.author, text='Старый пост ' * 20, group=self.group)
+        self.comment = Comment.objects.create(
+            post=self.old, author=self.reader, text='Старый комментарий')
+        make_old(self.old, 400)
+        self.new = Post.objects.create(author=self.author, text='Новый пост')
+        self.keys = [
+            counters.POSTS,
+            counters.author_key(self.author.pk),
+            counters.group_key(self.group.pk),
+            counters.feed_key(self.reader.pk),
+        ]
+        self.before = counters.get_many(self.keys)
+
+    def archive(self, **options):
+        out = StringIO()
+        call_command('archive_posts', stdout=out, **options)
+        return out.getvalue()
+
+    def test_moves_old_posts_with_comments(self):
+        self.assertIn(
+            'Будет перенесено в архив постов: 1',
+            self.archive(dry_run=True),
+        )
+        self.assertIn('Перенесено в архив постов: 1', self.archive())
+        self.assertEqual(list(Post.objects.all()), [self.new])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(TimelineEntry.objects.filter(post=self.old).exists())
+        row = ArchivedPost.objects.get()
+        self.assertEqual(
+            (row.pk, row.text, row.group),
+            (self.old.pk, self.old.text, self.group),
+        )
+        self.assertLess(len(row.compressed_text), len(self.old.text))
+        self.assertEqual(
+            ArchivedComment.objects.get().text, self.comment.text)
+        after = counters.get_many(self.keys)
+        self.assertEqual(
+            [self.before[key] - after[key] for key in self.keys],
+            [1, 0, 1, 1],
+        )
+        self.assertIn('Перенесено в архив постов: 0', self.archive())
+
+    def test_feed_counters_follow_deleted_entries(self):
+        """Ленты без записи об ушедшем посте не уменьшаются."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=other, author=self.author)
+        TimelineEntry.objects.filter(user=other, post=self.old).delete()
+        key = counters.feed_key(other.pk)
+        before = counters.get(key)
+        self.archive()
+        self.assertEqual(counters.get(key), before)
+        self.assertEqual(
+            self.before[self.keys[-1]] - counters.get(self.keys[-1]), 1)
+
+    def test_detail_and_profile_read_archive(self):
+        self.archive(days=30)
+        self.client.force_login(self.author)
+        response = self.client.get(
+            reverse('posts_app:post_detail', args=[self.old.pk]))
+        self.assertTrue(response.context['post'].archived)
+        self.assertContains(response, 'Старый комментарий')
+        self.assertContains(response, 'Пост в архиве')
+        self.assertNotContains(
+            response, reverse('posts_app:post_edit', args=[self.old.pk]))
+        response = self.client.get(
+            reverse('posts_app:profile', args=[self.author]))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [self.new.pk, self.old.pk],
+        )
+        self.assertEqual(response.context['posts_count'], 2)
+        response = self.client.get(reverse('posts_app:main'))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [self.new.pk],
+        )
+
+    def test_archived_post_is_read_only(self):
+        self.archive()
+        self.client.force_login(self.author)
+        response = self.client.get(
+            reverse('posts_app:post_edit', args=[self.old.pk]))
+        self.assertEqual(response.status_code, 404)
+        with self.assertRaises(ArchivedPost.DoesNotExist):
+            ArchivedPost.objects.get(pk=self.new.pk)
+
+    def test_deleting_archived_post_updates_author_counter(self):
+        self.archive()
+        ArchivedPost.objects.get().delete()
+        self.assertFalse(ArchivedComment.objects.exists())
+        self.assertEqual(
+            counters.get(counters.author_key(self.author.pk)), 1)
+
+
+class ShardedArchiveTests(ShardedTestCase):
+    def test_archive_stays_in_author_shard(self):
+        old, new = self.publish(
+            self.first, 2, timezone.now() - timedelta(days=400))
+        Post.objects.using('shard_a').filter(pk=new.pk).update(
+            pub_date=timezone.now())
+        old.comments.create(author=self.reader, text='Комментарий')
+        self.assertEqual(archive.archive_older(archive.cutoff(), 'shard_a'), 1)
+        self.assertEqual(
+            ArchivedComment._base_manager.using('shard_a').get().text,
+            'Комментарий',
+        )
+        self.assertEqual(
+            self.page(reverse('posts_app:profile', args=[self.first])),
+            [new.pk, old.pk],
+        )
+        response = self.client.get(
+            reverse('posts_app:post_detail', args=[old.pk]))
+        self.assertContains(response, self.reader.username)
+
+        call_command(
+            'reshard', author=self.first.pk, to='shard_b', stdout=StringIO())
+        self.assertEqual(
+            ArchivedPost._base_manager.using('shard_b').get().pk, old.pk)
+        self.assertEqual(
+            ArchivedComment._base_manager.using('shard_b').count(), 1)
+        self.assertFalse(
+            ArchivedPost._base_manager.using('shard_a').exists())
+        self.assertEqual(
+            archive.get_post_or_404(old.pk)._state.db, 'shard_b')
+
+        User.objects.get(pk=self.first.pk).delete()
+        self.assertFalse(
+            ArchivedPost._base_manager.using('shard_b').exists())
@@ -0,0 +1,80 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+
+from core.storage import ContentAddressedStorage
+
+from .. import blobs
+from ..models import MediaBlob, Post, User, image_storage
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaBlobTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='TestUser')
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, content=b'GIF89a-picture'):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост',
+            image=SimpleUploadedFile('small.gif', content, 'image/gif'),
+        )
+
+    def test_shared_file_lives_until_last_reference(self):
+        """Одинаковые картинки хранятся одним файлом со счётчиком ссылок."""
+        first = self.create_post()
+        second = self.create_post()
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 2)
+        first.delete()
+        self.assertTrue(image_storage.exists(name))
+        second.delete()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(image_storage.exists(name))
+
+    def test_replaced_image_is_released(self):
+        post = self.create_post()
+        old_name = post.image.name
+        post.image = SimpleUploadedFile('new.gif', b'GIF89a-new', 'image/gif')
+        post.save()
+        self.assertFalse(image_storage.exists(old_name))
+        self.assertEqual(MediaBlob.objects.get(name=post.image.name).refs, 1)
+
+    def test_same_image_uploaded_again_keeps_one_reference(self):
+        post = self.create_post()
+        post.image = SimpleUploadedFile('again.gif', b'GIF89a-picture')
+        post.save()
+        self.assertEqual(MediaBlob.objects.get(name=post.image.name).refs, 1)
+
+    def test_upload_is_referenced_before_file_is_reused(self):
+        """Ссылка на файл появляется до того, как хранилище его отдаст."""
+        name = self.create_post().image.name
+        save, refs = ContentAddressedStorage.save, []
+
+        def spy(storage, *args, **kwargs):
+            refs.append(MediaBlob.objects.get(name=name).refs)
+            return save(storage, *args, **kwargs)
+
+        with mock.patch.object(ContentAddressedStorage, 'save', spy):
+            self.create_post()
+        self.assertEqual(refs, [2])
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 2)
+
+    def test_purge_keeps_file_referenced_again(self):
+        """Отложенный purge не стирает файл, на который снова сослались."""
+        name = self.create_post().image.name
+        MediaBlob.objects.filter(name=name).update(refs=0)
+        self.create_post()
+        blobs.purge(name)
+        self.assertTrue(image_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 1)
@@ -0,0 +1,184 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from core import db_routers
+from core.db_routers import ReplicaRouter
+
+from .. import caching
+from ..models import Comment, Follow, Group, Post, User
+
+
+class PostFragmentCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='TestUser', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.url = reverse('posts_app:main')
+
+    def get_fresh_page(self):
+        # Сбрасываем кеш страницы, чтобы она собралась из фрагментов.
+        caching.bump(caching.INDEX)
+        return self.guest_client.get(self.url)
+
+    def test_fragment_is_reused_until_post_is_edited(self):
+        """Фрагмент поста живёт до правки поста."""
+        self.get_fresh_page()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        self.assertContains(self.get_fresh_page(), 'Тестовый пост')
+        self.post.text = 'Отредактированный пост'
+        self.post.save()
+        self.assertContains(self.get_fresh_page(), 'Отредактированный пост')
+
+    def test_author_and_group_changes_invalidate_fragments(self):
+        """Смена имени автора и адреса группы видна сразу."""
+        self.guest_client.get(self.url)
+        self.user.first_name = 'Фёдор'
+        self.user.save()
+        self.assertContains(self.guest_client.get(self.url), 'Фёдор')
+        self.group.slug = 'new-slug'
+        self.group.save()
+        self.assertContains(self.guest_client.get(self.url), 'new-slug')
+
+    def test_page_fetches_fragments_in_one_call(self):
+        """Фрагменты всех постов страницы читаются одним get_many."""
+        posts = [self.post] + [
+            Post.objects.create(author=self.user, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        caching.render_fragments(posts, 'posts/post_info.html')
+        calls = []
+        get_many = cache.get_many
+        cache.get_many = lambda keys: calls.append(keys) or get_many(keys)
+        try:
+            fragments = caching.render_fragments(
+                posts, 'posts/post_info.html')
+        finally:
+            del cache.get_many
+        self.assertEqual(len(fragments), 4)
+        # Один вызов за версиями и один за фрагментами.
+        self.assertEqual(len(calls), 2)
+
+
+class SharedPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author_user = User.objects.create_user(username='TestUserAuthor')
+        cls.reader = User.objects.create_user(username='TestUserReader')
+        cls.post = Post.objects.create(
+            author=cls.author_user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.profile_url = reverse(
+            'posts_app:profile',
+            kwargs={'username': self.author_user.username}
+        )
+        self.detail_url = reverse(
+            'posts_app:post_detail', kwargs={'post_id': self.post.pk})
+
+    def test_anonymous_hit_skips_view(self):
+        """Аноним получает готовую страницу без запросов к базе."""
+        first = self.guest_client.get(self.profile_url)
+        with self.assertNumQueries(0):
+            second = self.guest_client.get(self.profile_url)
+        self.assertEqual(first.content, second.content)
+        self.assertIsNone(second.context)
+
+    def test_personal_parts_are_rendered_per_user(self):
+        """Шапка и кнопка подписки свои у каждого пользователя."""
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        self.guest_client.get(self.profile_url)
+        response = self.reader_client.get(self.profile_url)
+        self.assertContains(response, 'Пользователь:&nbsp;TestUserReader')
+        self.assertContains(response, 'Отписаться')
+        self.assertNotContains(response, '<!--hole:')
+        response = self.guest_client.get(self.profile_url)
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, 'TestUserReader')
+
+    def test_post_detail_comment_form_only_for_user(self):
+        """Форма комментария с CSRF-токеном не попадает в общую копию."""
+        self.reader_client.get(self.detail_url)
+        self.assertNotContains(
+            self.guest_client.get(self.detail_url), 'csrfmiddlewaretoken')
+        self.assertContains(
+            self.reader_client.get(self.detail_url), 'csrfmiddlewaretoken')
+
+    def test_content_signals_invalidate_pages(self):
+        """Комментарий и подписка сразу видны на закешированных страницах."""
+        self.guest_client.get(self.detail_url)
+        self.guest_client.get(self.profile_url)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Новый комментарий')
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        self.assertContains(
+            self.guest_client.get(self.detail_url), 'Новый комментарий')
+        self.assertContains(
+            self.guest_client.get(self.profile_url), 'Подписчиков: 1')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class SharedPageReplicaTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def render(self, scope=caching.INDEX, during=None):
+        reads = []
+
+        @caching.shared_page
+        def view(request):
+            caching.depends_on(request, scope)
+            reads.append(ReplicaRouter().db_for_read(Post))
+            if during is not None:
+                during()
+            return HttpResponse('Страница')
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        view(request)
+        view(request)
+        return reads
+
+    def test_miss_is_rendered_on_replica(self):
+        """Промах читает с реплики, устоявшаяся копия кешируется."""
+        self.assertEqual(self.render(), ['replica'])
+
+    def test_fresh_versions_are_not_cached_from_replica(self):
+        """Отстающая реплика не попадает в общий кеш под новой версией."""
+        caching.bump(caching.INDEX)
+        self.assertEqual(self.render(), ['replica', 'replica'])
+
+    def test_version_bumped_during_render_is_not_cached(self):
+        self.assertEqual(
+            self.render(during=lambda: caching.bump(caching.INDEX)),
+            ['replica', 'replica'],
+        )
+
+    def test_sticky_user_page_is_cached_from_primary(self):
+        caching.bump(caching.INDEX)
+        token = db_routers.start(pinned=True)
+        try:
+            self.assertEqual(self.render(), ['default'])
+        finally:
+            db_routers.finish(token)
+        self.assertEqual(ReplicaRouter().db_for_read(Post), 'replica')
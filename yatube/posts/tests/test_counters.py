@@ -0,0 +1,160 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+
+from .. import counters
+from ..models import Comment, Counter, Follow, Group, Post, User
+from ..paginators import CounterPaginator
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author_user = User.objects.create_user(username='TestUserAuthor')
+        cls.follower_user = User.objects.create_user(
+            username='TestUserFollower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.create(
+            author=cls.author_user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+        Follow.objects.create(user=cls.follower_user, author=cls.author_user)
+
+    def keys(self):
+        return (
+            counters.POSTS,
+            counters.group_key(self.group.pk),
+            counters.author_key(self.author_user.pk),
+            counters.feed_key(self.follower_user.pk),
+        )
+
+    def values(self):
+        return [counters.get(key) for key in self.keys()]
+
+    def test_counters_follow_post_writes(self):
+        """Счётчики меняются при создании и удалении поста."""
+        self.assertEqual(self.values(), [1, 1, 1, 1])
+        post = Post.objects.create(
+            author=self.author_user,
+            text='Ещё пост',
+            group=self.group,
+        )
+        self.assertEqual(self.values(), [2, 2, 2, 2])
+        post.delete()
+        self.assertEqual(self.values(), [1, 1, 1, 1])
+
+    def test_group_change_moves_count(self):
+        """Смена группы переносит пост между счётчиками групп."""
+        post = Post.objects.get()
+        self.values()
+        other_key = counters.group_key(self.other_group.pk)
+        self.assertEqual(counters.get(other_key), 0)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(counters.get(other_key), 1)
+        self.assertEqual(counters.get(counters.group_key(self.group.pk)), 0)
+
+    def test_follow_and_unfollow_change_feed(self):
+        """Подписка и отписка меняют размер ленты подписчика."""
+        key = counters.feed_key(self.follower_user.pk)
+        self.assertEqual(counters.get(key), 1)
+        Follow.objects.filter(user=self.follower_user).delete()
+        self.assertEqual(counters.get(key), 0)
+        Follow.objects.create(user=self.follower_user, author=self.author_user)
+        self.assertEqual(counters.get(key), 1)
+
+    def test_paginator_count_without_count_query(self):
+        """Пагинатор берёт число записей из счётчика, без COUNT ленты."""
+        counters.get(counters.POSTS)
+        paginator = CounterPaginator(
+            Post.objects.all(), 10, counter_key=counters.POSTS
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 1)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('posts_post', queries[0]['sql'])
+
+    def test_reconcile_fixes_drift(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        self.values()
+        drifted = Counter.objects.update(value=100)
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=2, stdout=out)
+        self.assertIn(str(drifted), out.getvalue())
+        self.assertEqual(self.values(), [1, 1, 1, 1])
+
+    def test_comment_count(self):
+        """Число комментариев хранится в посте и не затирается правкой."""
+        post = Post.objects.get()
+        stale = Post.objects.get(pk=post.pk)
+        comment = Comment.objects.create(
+            post=post, author=self.follower_user, text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        stale.text = 'Исправленный пост'
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+
+    def test_follow_counters(self):
+        """Подписчики и подписки считаются при подписке и отписке."""
+        followers = counters.followers_key(self.author_user.pk)
+        following = counters.following_key(self.follower_user.pk)
+        self.assertEqual(counters.get(followers), 1)
+        self.assertEqual(counters.get(following), 1)
+        Follow.objects.all().delete()
+        self.assertEqual(counters.get(followers), 0)
+        self.assertEqual(counters.get(following), 0)
+
+    def test_profile_reads_counters(self):
+        """Профиль показывает счётчики без COUNT по постам и подпискам."""
+        url = reverse(
+            'posts_app:profile',
+            kwargs={'username': self.author_user.username}
+        )
+        self.client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['posts_count'], 1)
+        self.assertEqual(response.context['followers_count'], 1)
+        self.assertEqual(response.context['following_count'], 0)
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+
+    def test_reconcile_rebuilds_comment_count(self):
+        """Команда пересчитывает число комментариев пачками."""
+        post = Post.objects.get()
+        Comment.objects.create(
+            post=post, author=self.follower_user, text='Комментарий')
+        Post.objects.update(comment_count=7)
+        call_command(
+            'reconcile_counters', '--create-missing', batch_size=1,
+            stdout=StringIO(),
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertTrue(
+            Counter.objects.filter(
+                key=counters.following_key(self.author_user.pk)
+            ).exists()
+        )
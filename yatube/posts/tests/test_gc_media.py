@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from core import resize
+
+from .. import blobs
+from ..models import Post, User, image_storage
+from .test_thumbnails import make_image
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+DAY = 24 * 60 * 60
+
+
+def age(storage, name, seconds=DAY):
+    moment = time.time() - seconds
+    os.utime(storage.path(name), (moment, moment))
+
+
+def old_file(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    moment = time.time() - DAY
+    os.utime(path, (moment, moment))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GarbageCollectionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image(color='red'))
+        age(image_storage, self.post.image.name)
+        self.orphan = image_storage.save(
+            'posts/orphan.jpg', make_image(color='blue'))
+        age(image_storage, self.orphan)
+        self.fresh = image_storage.save(
+            'posts/fresh.jpg', make_image(color='green'))
+        default.kvstore.set(ImageFile(self.orphan, image_storage))
+        self.stale_thumbnail = default.storage.save(
+            'cache/ab/cd/stale.jpg', ContentFile(b'thumbnail'))
+        age(default.storage, self.stale_thumbnail)
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', *args, pause=0, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        out = self.gc('--dry-run')
+        self.assertIn(self.orphan, out)
+        self.assertIn(self.stale_thumbnail, out)
+        self.assertIn('Будет удалено файлов: 2', out)
+        self.assertTrue(image_storage.exists(self.orphan))
+        self.assertIsNotNone(
+            default.kvstore.get(ImageFile(self.orphan, image_storage)))
+
+    def test_orphans_deleted(self):
+        """Удаляются только старые файлы без ссылок и их записи sorl."""
+        out = self.gc('--batch-size', '1')
+        self.assertIn('Удалено файлов: 2, записей sorl: 1', out)
+        self.assertFalse(image_storage.exists(self.orphan))
+        self.assertFalse(default.storage.exists(self.stale_thumbnail))
+        self.assertIsNone(
+            default.kvstore.get(ImageFile(self.orphan, image_storage)))
+        self.assertTrue(image_storage.exists(self.post.image.name))
+        self.assertTrue(image_storage.exists(self.fresh))
+
+    def test_reupload_refreshes_old_file(self):
+        """Повторная загрузка старого файла защищает его от сборки."""
+        image_storage.save('posts/again.jpg', make_image(color='blue'))
+        self.gc()
+        self.assertTrue(image_storage.exists(self.orphan))
+
+    def test_resized_variants_of_deleted_originals(self):
+        """Варианты размеров и их блокировки живут, пока жив оригинал."""
+        live, dead = (
+            resize.cache_path('80x40', name)
+            for name in (self.post.image.name, self.orphan)
+        )
+        for path in (live, live + '.lock', dead, dead + '.lock'):
+            old_file(path)
+        with mock.patch.object(blobs, 'CHUNK_SIZE', 1):
+            out = self.gc()
+        self.assertIn('Удалено файлов: 4', out)
+        self.assertTrue(os.path.exists(live))
+        self.assertTrue(os.path.exists(live + '.lock'))
+        self.assertFalse(os.path.exists(dead))
+        self.assertFalse(os.path.exists(dead + '.lock'))
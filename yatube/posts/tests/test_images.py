@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import archive, images, thumbnails
+from ..models import ArchivedPost, Post, User
+from .test_thumbnails import make_image
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageMetadataTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_metadata_saved_with_image(self):
+        """Размеры, объём и формат картинки сохраняются вместе с постом."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image(size=(300, 200)))
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+        self.assertEqual(post.image_format, 'JPEG')
+        self.assertEqual(post.image_size, post.image.size)
+        post.image = ''
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_format, '')
+
+    def test_read_metadata_closes_file_it_opened(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image(size=(300, 200)))
+        post = Post.objects.get(pk=post.pk)
+        metadata = images.read_metadata(post.image)
+        self.assertEqual(metadata['image_width'], 300)
+        self.assertTrue(post.image.closed)
+
+    def test_backfill_command(self):
+        """Команда заполняет и горячие посты, и посты в архиве."""
+        post, old = [
+            Post.objects.create(
+                author=self.user, text='Пост',
+                image=make_image(f'{index}.jpg', size=(300, 200)))
+            for index in range(2)
+        ]
+        archive.archive([old.pk])
+        empty = dict(
+            image_width=None, image_height=None, image_size=None,
+            image_format='')
+        Post.objects.update(**empty)
+        ArchivedPost.objects.update(**empty)
+        out = StringIO()
+        call_command('backfill_image_metadata', batch_size=1, stdout=out)
+        self.assertIn('Заполнено постов: 2', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+        old = ArchivedPost.objects.get(pk=old.pk)
+        self.assertEqual((old.image_width, old.image_height), (300, 200))
+
+    def test_narrow_original_skips_wide_variant(self):
+        """Вариант без upscale шире оригинала не строится и не ждётся."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image(size=(300, 200)))
+        geometries = [geometry for geometry, _ in thumbnails.variants(post)]
+        self.assertNotIn('1920x678', geometries)
+        self.assertIn('960x339', geometries)
@@ -0,0 +1,32 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+
+class BenchmarkIndexesTests(SimpleTestCase):
+    # Схема берётся у соединения default, сами данные живут
+    # в отдельном временном файле.
+    databases = {'default'}
+
+    def test_feed_queries_use_composite_indexes(self):
+        """После миграции ленты читаются по составным индексам."""
+        out = StringIO()
+        call_command(
+            'benchmark_indexes',
+            posts=300, authors=20, groups=5, comments=300, follows=100,
+            repeat=1, stdout=out,
+        )
+        blocks = out.getvalue().split('\n\n')[1:]
+        after = [block.split('  после:')[1] for block in blocks]
+        for index in (
+            'post_date_idx',
+            'post_author_date_idx',
+            'post_group_date_idx',
+            'comment_post_created_idx',
+        ):
+            with self.subTest(index=index):
+                self.assertIn(index, ''.join(after))
+        for plan in after:
+            with self.subTest(plan=plan):
+                self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,125 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Group, Post, User
+from ..paginators import (
+    NEXT,
+    CursorPaginator,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.count_posts = 25
+        cls.per_page = 10
+        cls.author_user = User.objects.create_user(username='TestUserAuthor')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create([
+            Post(
+                author=cls.author_user,
+                text=f'Тестовый пост {i}',
+                group=cls.group,
+            )
+            for i in range(cls.count_posts)
+        ])
+        cls.expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_round_trip(self):
+        """Курсор кодируется и декодируется без потерь."""
+        post = Post.objects.first()
+        token = encode_cursor(NEXT, post.pub_date, post.pk)
+        self.assertEqual(
+            decode_cursor(token), (NEXT, post.pub_date, post.pk)
+        )
+
+    def test_broken_cursor_is_first_page(self):
+        """Битый курсор открывает первую страницу."""
+        self.assertIsNone(decode_cursor('не-курсор'))
+        paginator = CursorPaginator(Post.objects.all(), self.per_page)
+        page = paginator.get_page(cursor='не-курсор')
+        self.assertEqual(
+            [post.pk for post in page], self.expected[:self.per_page]
+        )
+        self.assertFalse(page.has_previous())
+
+    def test_walk_forward_and_back(self):
+        """Курсоры проходят ленту вперёд и назад без пропусков."""
+        paginator = CursorPaginator(Post.objects.all(), self.per_page)
+        page = paginator.get_page(cursor='')
+        pages = [[post.pk for post in page]]
+        while page.has_next():
+            page = paginator.get_page(cursor=page.next_cursor)
+            pages.append([post.pk for post in page])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual(len(pages[-1]), self.count_posts % self.per_page)
+        page = paginator.get_page(cursor=page.previous_cursor)
+        self.assertEqual([post.pk for post in page], pages[-2])
+
+    def test_offset_page_links_use_cursors(self):
+        """Страница ?page=N продолжается курсором со следующей страницы."""
+        paginator = CursorPaginator(Post.objects.all(), self.per_page)
+        page = paginator.get_page(2)
+        next_page = paginator.get_page(cursor=page.next_cursor)
+        self.assertEqual(
+            [post.pk for post in next_page],
+            self.expected[2 * self.per_page:3 * self.per_page],
+        )
+        previous_page = paginator.get_page(cursor=page.previous_cursor)
+        self.assertEqual(
+            [post.pk for post in previous_page],
+            self.expected[:self.per_page],
+        )
+
+    def test_cursor_page_has_no_offset(self):
+        """Глубокая страница по курсору выбирается без OFFSET."""
+        last = Post.objects.get(pk=self.expected[-5])
+        url = reverse('posts_app:main') + '?cursor=' + encode_cursor(
+            NEXT, last.pub_date, last.pk
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['page_obj']), 4)
+        for query in queries.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_feeds_render_cursor_links(self):
+        """Ленты ссылаются на следующую страницу курсором."""
+        urls = (
+            reverse('posts_app:main'),
+            reverse('posts_app:group_list', kwargs={'slug': self.group.slug}),
+            reverse(
+                'posts_app:profile',
+                kwargs={'username': self.author_user.username}
+            ),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                page_obj = response.context['page_obj']
+                self.assertContains(
+                    response, f'?cursor={page_obj.next_cursor}'
+                )
+                response = self.client.get(
+                    url + f'?cursor={page_obj.next_cursor}'
+                )
+                self.assertEqual(
+                    [post.pk for post in response.context['page_obj']],
+                    self.expected[self.per_page:2 * self.per_page],
+                )
@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+
+class ListingQueriesTests(TestCase):
+    """Число запросов страницы не зависит от числа постов на ней."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='TestUserReader')
+        cls.author_user = User.objects.create_user(
+            username='TestUserAuthor', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author_user)
+        cls.post = Post.objects.create(
+            author=cls.author_user, text='Тестовый пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def add_posts(self, start, count):
+        for i in range(start, start + count):
+            author = User.objects.create_user(username=f'TestUser{i}')
+            Follow.objects.create(user=self.reader, author=author)
+            group = Group.objects.create(
+                title=f'Группа {i}',
+                slug=f'slug-{i}',
+                description='Тестовое описание',
+            )
+            Post.objects.create(author=author, text=f'Пост {i}', group=group)
+            Post.objects.create(
+                author=self.author_user, text=f'Пост {i}', group=self.group)
+            Comment.objects.create(
+                post=self.post, author=author, text=f'Комментарий {i}')
+
+    def count_queries(self, url):
+        # Первый запрос заводит счётчики ленты, его не считаем.
+        self.reader_client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page(self):
+        """Страницы лент и поста делают фиксированное число запросов."""
+        urls = (
+            reverse('posts_app:main'),
+            reverse('posts_app:group_list', kwargs={'slug': self.group.slug}),
+            reverse(
+                'posts_app:profile',
+                kwargs={'username': self.author_user.username}
+            ),
+            reverse('posts_app:follow_main'),
+            reverse('posts_app:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        self.add_posts(0, 1)
+        before = {url: self.count_queries(url) for url in urls}
+        self.add_posts(1, 8)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), before[url])
@@ -0,0 +1,72 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import search
+from ..models import Comment, Post, User
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Котики <b>спят</b> весь день. Котики!')
+        cls.dogs = Post.objects.create(
+            author=cls.user, text='Собаки гуляют, а котик смотрит в окно.')
+        Comment.objects.create(
+            post=cls.dogs, author=cls.user, text='Хороший пёс')
+
+    def test_ranked_with_highlighted_snippet(self):
+        """Результаты ранжированы, фрагменты экранированы и подсвечены."""
+        response = self.client.get(reverse('posts_app:search'), {'q': 'кот'})
+        posts = list(response.context['page_obj'])
+        self.assertEqual(posts, [self.cats, self.dogs])
+        self.assertContains(response, '<mark>Котики</mark>')
+        self.assertContains(response, '&lt;b&gt;спят&lt;/b&gt;')
+
+    def test_all_words_required(self):
+        found = search.ranked(Post.objects.all(), 'собаки котик')
+        self.assertEqual(list(found), [self.dogs])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for query in ('AND "(', 'NEAR(кот', '*', ''):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    list(search.ranked(Post.objects.all(), query)), [])
+
+    def test_index_follows_queryset_updates_and_deletes(self):
+        """Триггеры обновляют индекс и без сигналов модели."""
+        Post.objects.filter(pk=self.cats.pk).update(text='Черепахи')
+        matching = search.matching(Post.objects.all(), 'черепахи')
+        self.assertEqual(list(matching), [self.cats])
+        self.assertEqual(
+            list(search.matching(Post.objects.all(), 'спят')), [])
+        Post.objects.filter(pk=self.cats.pk).delete()
+        self.assertFalse(
+            search.matching(Post.objects.all(), 'черепахи').exists())
+
+    def test_comments_indexed(self):
+        self.assertEqual(
+            search.matching(Comment.objects.all(), 'пёс').count(), 1)
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собаки'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.dogs])
+
+    def test_lost_triggers_restored_after_migrate(self):
+        """Если миграция пересоздала таблицу, индекс восстанавливается."""
+        with connection.cursor() as cursor:
+            for suffix in ('insert', 'delete', 'update'):
+                cursor.execute(f'DROP TRIGGER posts_post_fts_{suffix}')
+        Post.objects.filter(pk=self.dogs.pk).update(text='Попугаи')
+        call_command('migrate', 'posts', verbosity=0)
+        self.assertEqual(
+            list(search.matching(Post.objects.all(), 'попугаи')),
+            [self.dogs])
@@ -0,0 +1,291 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import counters, shards
+from ..models import AuthorShard, Comment, Follow, Group, Post, User
+
+SHARDS = ['shard_a', 'shard_b']
+
+
+class ShardedTestCase(TestCase):
+    """Два шарда в памяти рядом с тестовой основной базой."""
+    databases = {DEFAULT_DB_ALIAS, *SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_settings = override_settings(DATABASE_SHARDS=SHARDS)
+        cls.shard_settings.enable()
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                'ENGINE': 'core.backends.sqlite_shard',
+                'NAME': f'file:memorydb_{alias}?mode=memory&cache=shared',
+            }
+            call_command('migrate', database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            # close() не закрывает базу в памяти, иначе она пропала бы.
+            connections[alias].connection.close()
+            delattr(connections._connections, alias)
+            del connections.databases[alias]
+        cls.shard_settings.disable()
+
+    @classmethod
+    def setUpTestData(cls):
+        # Авторы в разных шардах.
+        cls.authors = {}
+        number = 0
+        while len(cls.authors) < len(SHARDS):
+            number += 1
+            user = User.objects.create_user(username=f'author-{number}')
+            cls.authors.setdefault(shards.home(user.pk), user)
+        cls.first, cls.second = (cls.authors[alias] for alias in SHARDS)
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    def setUp(self):
+        cache.clear()
+
+    def publish(self, author, count, start, group=None):
+        """Посты автора с датами start, start + 2 минуты, ..."""
+        posts = []
+        for number in range(count):
+            post = author.posts.create(text=f'Пост {number}', group=group)
+            Post.objects.using(post._state.db).filter(pk=post.pk).update(
+                pub_date=start + timedelta(minutes=2 * number))
+            posts.append(post)
+        return posts
+
+    def page(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [post.pk for post in response.context['page_obj']]
+
+
+class ShardRoutingTests(ShardedTestCase):
+    def test_rows_live_in_author_shard(self):
+        post_a = self.first.posts.create(text='Пост')
+        post_b = self.second.posts.create(text='Пост')
+        comment = Comment(post=post_a, author=self.second, text='Ответ')
+        comment.save()
+        self.assertEqual(post_a._state.db, 'shard_a')
+        self.assertEqual(post_b._state.db, 'shard_b')
+        self.assertEqual(comment._state.db, 'shard_a')
+        self.assertNotEqual(post_a.pk, post_b.pk)
+        self.assertFalse(Post._base_manager.using(DEFAULT_DB_ALIAS).exists())
+        self.assertEqual(
+            Post._base_manager.using('shard_a').get().comment_count, 1)
+        self.assertEqual(counters.get(counters.POSTS), 2)
+
+    def test_index_merges_shards_by_date(self):
+        start = timezone.now() - timedelta(days=1)
+        first = self.publish(self.first, 6, start)
+        second = self.publish(
+            self.second, 6, start + timedelta(minutes=1), self.group)
+        expected = [
+            post.pk for pair in zip(first, second) for post in pair
+        ][::-1]
+        response = self.client.get(reverse('posts_app:main'))
+        page_obj = response.context['page_obj']
+        self.assertEqual([post.pk for post in page_obj], expected[:10])
+        cursor = page_obj.next_cursor
+        self.assertEqual(
+            self.page(reverse('posts_app:main'), cursor=cursor),
+            expected[10:],
+        )
+        self.assertEqual(
+            self.page(reverse('posts_app:main'), page=2), expected[10:])
+        self.assertEqual(
+            self.page(reverse('posts_app:group_list', args=['group'])),
+            [post.pk for post in reversed(second)],
+        )
+
+    def test_profile_and_detail_read_author_shard(self):
+        post = self.first.posts.create(text='Пост')
+        post.comments.create(author=self.reader, text='Комментарий')
+        self.assertEqual(
+            self.page(reverse('posts_app:profile', args=[self.first])),
+            [post.pk],
+        )
+        response = self.client.get(
+            reverse('posts_app:post_detail', args=[post.pk]))
+        self.assertContains(response, 'Комментарий')
+        self.assertContains(response, self.reader.username)
+
+    def test_create_comment_and_edit_through_views(self):
+        self.client.force_login(self.second)
+        self.client.post(reverse('posts_app:post_create'), {'text': 'Новый'})
+        post = Post._base_manager.using('shard_b').get()
+        self.client.post(
+            reverse('posts_app:add_comment', args=[post.pk]),
+            {'text': 'Свой комментарий'},
+        )
+        self.client.post(
+            reverse('posts_app:post_edit', args=[post.pk]),
+            {'text': 'Исправленный', 'group': self.group.pk},
+        )
+        post.refresh_from_db()
+        self.assertEqual((post.text, post.group), ('Исправленный', self.group))
+        self.assertEqual(Comment._base_manager.using('shard_b').count(), 1)
+
+    def test_follow_feed_gathers_shards(self):
+        Follow.objects.create(user=self.reader, author=self.first)
+        Follow.objects.create(user=self.reader, author=self.second)
+        start = timezone.now() - timedelta(hours=1)
+        posts = self.publish(self.first, 1, start) + self.publish(
+            self.second, 1, start + timedelta(minutes=1))
+        self.client.force_login(self.reader)
+        self.assertEqual(
+            self.page(reverse('posts_app:follow_main')),
+            [post.pk for post in reversed(posts)],
+        )
+
+    def test_search_gathers_shards(self):
+        posts = [
+            author.posts.create(text='Котики спят')
+            for author in (self.first, self.second)
+        ]
+        found = self.page(reverse('posts_app:search'), q='котики')
+        self.assertEqual(sorted(found), sorted(post.pk for post in posts))
+
+    def test_foreign_keys_only_in_default_database(self):
+        """Шарды создаются без внешних ключей, основная база их хранит."""
+        def foreign_keys(alias):
+            with connections[alias].cursor() as cursor:
+                constraints = connections[alias].introspection.get_constraints(
+                    cursor, Post._meta.db_table)
+            return {
+                constraint['foreign_key'][0]
+                for constraint in constraints.values()
+                if constraint['foreign_key']
+            }
+
+        self.assertEqual(
+            foreign_keys(DEFAULT_DB_ALIAS), {'auth_user', 'posts_group'})
+        self.assertEqual(foreign_keys('shard_a'), set())
+
+    def test_deleting_user_deletes_sharded_rows(self):
+        post = self.first.posts.create(text='Пост')
+        post.comments.create(author=self.second, text='Комментарий')
+        self.second.posts.create(text='Пост')
+        User.objects.get(pk=self.second.pk).delete()
+        self.assertEqual(Comment._base_manager.using('shard_a').count(), 0)
+        self.assertFalse(Post._base_manager.using('shard_b').exists())
+        self.assertTrue(Post._base_manager.using('shard_a').exists())
+
+    def test_manager_writes_go_to_author_shard(self):
+        """create() без базы пишет в шард автора, bulk_create() —
+        только с явной базой."""
+        post = Post.objects.create(author=self.first, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        self.assertEqual((post._state.db, comment._state.db),
+                         ('shard_a', 'shard_a'))
+        self.assertFalse(Post._base_manager.using(DEFAULT_DB_ALIAS).exists())
+        with self.assertRaises(ValueError):
+            Post.objects.bulk_create([Post(author=self.first, text='Пост')])
+        with self.assertRaises(ValueError):
+            Post.objects.filter(author=self.first).update(text='Правка')
+
+    def test_shard_queries_skip_joins_with_default_database(self):
+        post = self.first.posts.create(text='Пост', group=self.group)
+        post.comments.create(author=self.reader, text='Комментарий')
+        loaded = Post.objects.using('shard_a').get(pk=post.pk)
+        self.assertEqual(
+            (loaded.author, loaded.group), (self.first, self.group))
+        comment = Comment.objects.using('shard_a').select_related(
+            'post').get()
+        self.assertEqual(comment.author, self.reader)
+        self.assertEqual(comment.post, post)
+        self.assertEqual(
+            [post.pk for post in Post.objects.using('shard_a').iterator()],
+            [post.pk],
+        )
+
+
+class ShardAdminTests(ShardedTestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+
+    def changelist(self, model, **params):
+        response = self.client.get(
+            reverse(f'admin:posts_{model}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        changelist = response.context['cl']
+        return changelist.result_count, [
+            obj.pk for obj in changelist.result_list]
+
+    def test_lists_and_opens_rows_of_each_shard(self):
+        first = [self.first.posts.create(text=f'Пост {i}') for i in range(2)]
+        post = self.second.posts.create(text='Пост')
+        comment = post.comments.create(author=self.reader, text='Ответ')
+        self.assertEqual(
+            self.changelist('post'),
+            (2, [obj.pk for obj in reversed(first)]),
+        )
+        self.assertEqual(
+            self.changelist('post', shard='shard_b'), (1, [post.pk]))
+        self.assertEqual(
+            self.changelist('comment', shard='shard_b'), (1, [comment.pk]))
+        for model, pk in (('post', post.pk), ('comment', comment.pk)):
+            response = self.client.get(
+                reverse(f'admin:posts_{model}_change', args=[pk]))
+            self.assertEqual(response.status_code, 200)
+
+    def test_comment_edit_finds_post_in_shard(self):
+        post = self.second.posts.create(text='Пост')
+        comment = post.comments.create(author=self.reader, text='Ответ')
+        response = self.client.post(
+            reverse('admin:posts_comment_change', args=[comment.pk]),
+            {'post': post.pk, 'author': self.reader.pk, 'text': 'Правка'},
+        )
+        self.assertEqual(response.status_code, 302)
+        comment = Comment._base_manager.using('shard_b').get()
+        self.assertEqual(comment.text, 'Правка')
+
+
+class ReshardTests(ShardedTestCase):
+    def test_moves_rows_from_default_and_between_shards(self):
+        with override_settings(DATABASE_SHARDS=[]):
+            post = Post.objects.create(author=self.first, text='Старый')
+            comment = Comment.objects.create(
+                post=post, author=self.reader, text='Комментарий')
+        self.assertEqual(post._state.db, DEFAULT_DB_ALIAS)
+        out = StringIO()
+        call_command('reshard', stdout=out)
+        self.assertIn('Перенесено авторов: 1, постов: 1', out.getvalue())
+        moved = Post._base_manager.using('shard_a').get()
+        self.assertEqual(moved.pk, post.pk)
+        self.assertEqual(
+            Comment._base_manager.using('shard_a').get().pk, comment.pk)
+        self.assertFalse(Post._base_manager.using(DEFAULT_DB_ALIAS).exists())
+
+        call_command(
+            'reshard', author=self.first.pk, to='shard_b', stdout=out)
+        self.assertEqual(shards.for_author(self.first.pk), 'shard_b')
+        self.assertEqual(
+            self.page(reverse('posts_app:profile', args=[self.first])),
+            [post.pk],
+        )
+        self.assertFalse(Post._base_manager.using('shard_a').exists())
+
+        out = StringIO()
+        call_command('reshard', rebalance=True, dry_run=True, stdout=out)
+        self.assertIn(f'{self.first.pk} -> shard_a', out.getvalue())
+        call_command('reshard', rebalance=True, stdout=StringIO())
+        self.assertEqual(
+            AuthorShard.objects.get(author=self.first).shard, 'shard_a')
+        self.assertEqual(Post._base_manager.using('shard_a').count(), 1)
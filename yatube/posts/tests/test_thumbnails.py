@@ -0,0 +1,138 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from core import resize
+
+from .. import thumbnails
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name='image.jpg', size=(40, 20), color='red'):
+    buffer = BytesIO()
+    exif = Image.Exif()
+    exif[0x010f] = 'Тестовая камера'
+    Image.new('RGB', size, color).save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        """Запрос не строит миниатюру, а показывает заглушку."""
+        post = Post.objects.create(
+            author=self.user, text='Пост с картинкой', image=make_image())
+        url = reverse('posts_app:post_detail', kwargs={'post_id': post.pk})
+        response = self.client.get(url)
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertNotContains(response, 'srcset=')
+        self.assertNotContains(
+            response, resize.resized_url(post.image.name, '960x339'))
+        thumbnails.generate(post.pk, post.image.name)
+        response = self.client.get(url)
+        self.assertContains(response, 'srcset=')
+        self.assertNotContains(response, 'aspect-ratio: 960 / 339')
+
+    def commit(self):
+        """Выполняет отложенные до фиксации действия и возвращает
+        задачи, отправленные в пул миниатюр."""
+        with mock.patch.object(thumbnails, 'get_executor') as executor:
+            for _, callback in connection.run_on_commit:
+                callback()
+        jobs = [
+            call.args[1:] for call in executor.return_value.submit.mock_calls
+        ]
+        thumbnails._pending.difference_update(jobs)
+        return jobs
+
+    def test_post_create_saves_image_and_schedules_thumbnails(self):
+        """Картинка из формы сохраняется и уходит в очередь миниатюр
+        при фиксации транзакции."""
+        self.client.post(
+            reverse('posts_app:post_create'),
+            {'text': 'Новый пост', 'image': make_image('new.jpg')},
+        )
+        post = Post.objects.get(text='Новый пост')
+        self.assertTrue(post.image)
+        # Внутри теста транзакция не фиксируется: очередь пуста.
+        self.assertFalse(thumbnails._pending)
+        self.assertEqual(self.commit(), [(post.pk, post.image.name)])
+
+    def test_page_thumbnails_are_resolved_in_one_lookup(self):
+        """Миниатюры страницы читаются из хранилища sorl одним запросом."""
+        posts = [
+            Post.objects.create(
+                author=self.user, text=f'Пост {i}',
+                image=make_image(color=color))
+            for i, color in enumerate(('red', 'green', 'blue'))
+        ]
+        for post in posts[:2]:
+            thumbnails.generate(post.pk, post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            thumbnails.prefetch(posts)
+            ready = [thumbnails.responsive_image(post) for post in posts]
+        self.assertEqual(len(queries), 1)
+        self.assertIsNotNone(ready[0])
+        self.assertIsNotNone(ready[1])
+        self.assertIsNone(ready[2])
+        self.assertIn((posts[2].pk, posts[2].image.name), self.commit())
+
+    def test_variants_are_webp_without_exif(self):
+        """Варианты разной ширины в WebP без EXIF попадают в srcset."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image(size=(2000, 1000)))
+        thumbnails.generate(post.pk, post.image.name)
+        image = thumbnails.responsive_image(post)
+        self.assertEqual((image['width'], image['height']), (960, 339))
+        widths = [
+            int(item.split()[1][:-1]) for item in image['srcset'].split(', ')
+        ]
+        self.assertEqual(widths, [320, 640, 960, 1920])
+        for geometry, options in thumbnails.GEOMETRIES:
+            with self.subTest(geometry=geometry):
+                thumbnail = thumbnails.ready_thumbnail(
+                    post, geometry, **options)
+                with Image.open(thumbnail.storage.path(thumbnail.name)) as im:
+                    self.assertEqual(im.format, 'WEBP')
+                    self.assertFalse(im.getexif())
+        response = self.client.get(
+            reverse('posts_app:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'width="960"')
+
+    def test_identical_upload_reuses_thumbnails(self):
+        """Повторная загрузка той же картинки не требует новых миниатюр."""
+        first = Post.objects.create(
+            author=self.user, text='Первый', image=make_image())
+        thumbnails.generate(first.pk, first.image.name)
+        second = Post.objects.create(
+            author=self.user, text='Второй', image=make_image('copy.jpg'))
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertIsNotNone(thumbnails.responsive_image(second))
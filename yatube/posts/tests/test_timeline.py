@@ -0,0 +1,210 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import counters, timeline
+from ..models import Counter, Follow, Post, TimelineEntry, User
+
+
+@override_settings(TIMELINE_MAX_ENTRIES=3, TIMELINE_FANOUT_LIMIT=2)
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='TestUserReader')
+        cls.author_user = User.objects.create_user(username='TestUserAuthor')
+        cls.star_user = User.objects.create_user(username='TestUserStar')
+        cls.fan_user = User.objects.create_user(username='TestUserFan')
+
+    def setUp(self):
+        cache.clear()
+
+    def entries(self, user):
+        return list(
+            TimelineEntry.objects.filter(user=user).values_list(
+                'post_id', flat=True)
+        )
+
+    def feed(self, user):
+        return [post.pk for post in timeline.follow_feed(user.pk)]
+
+    def test_post_is_fanned_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков автора."""
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        post = Post.objects.create(author=self.author_user, text='Пост')
+        self.assertEqual(self.entries(self.reader), [post.pk])
+        self.assertEqual(self.entries(self.fan_user), [])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка добавляет последние посты автора, отписка убирает."""
+        posts = [
+            Post.objects.create(author=self.author_user, text=f'Пост {i}')
+            for i in range(5)
+        ]
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        self.assertEqual(
+            self.entries(self.reader), [post.pk for post in posts[:-4:-1]]
+        )
+        self.assertEqual(
+            counters.get(counters.feed_key(self.reader.pk)), 3
+        )
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.entries(self.reader), [])
+        self.assertEqual(
+            counters.get(counters.feed_key(self.reader.pk)), 0
+        )
+
+    def test_timeline_is_capped(self):
+        """В ленте хранится не больше TIMELINE_MAX_ENTRIES записей."""
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        posts = [
+            Post.objects.create(author=self.author_user, text=f'Пост {i}')
+            for i in range(5)
+        ]
+        self.assertEqual(
+            self.entries(self.reader), [post.pk for post in posts[:-4:-1]]
+        )
+
+    def test_popular_author_is_merged_on_read(self):
+        """Посты популярного автора не рассылаются, а подмешиваются."""
+        Follow.objects.create(user=self.reader, author=self.star_user)
+        Follow.objects.create(user=self.fan_user, author=self.star_user)
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        star_post = Post.objects.create(author=self.star_user, text='Звезда')
+        post = Post.objects.create(author=self.author_user, text='Пост')
+        self.assertEqual(self.entries(self.reader), [post.pk])
+        self.assertEqual(self.feed(self.reader), [post.pk, star_post.pk])
+        self.assertEqual(self.feed(self.fan_user), [star_post.pk])
+
+    def test_follow_index_reads_timeline(self):
+        """Страница подписок показывает посты из ленты."""
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        post = Post.objects.create(author=self.author_user, text='Пост')
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('posts_app:follow_main'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=50)
+    def test_follow_index_pages_are_per_user(self):
+        """Страницы подписок по курсору не берутся из чужого кеша."""
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        posts = [
+            Post.objects.create(author=self.author_user, text=f'Пост {i}')
+            for i in range(12)
+        ]
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('posts_app:follow_main'))
+        self.assertContains(response, 'Пост 11')
+        response = self.client.get(
+            reverse('posts_app:follow_main'),
+            {'cursor': response.context['page_obj'].next_cursor},
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), posts[1::-1])
+        self.assertNotContains(response, 'Пост 11')
+        self.client.force_login(self.fan_user)
+        response = self.client.get(reverse('posts_app:follow_main'))
+        self.assertNotContains(response, 'Пост 11')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=100)
+    def test_fan_out_cost_does_not_grow_with_followers(self):
+        """Рассылка пишет ленты и счётчики пачками, а не по подписчику."""
+        readers = [
+            User.objects.create_user(username=f'TestUserMany{i}')
+            for i in range(30)
+        ]
+        queries = []
+        for followers in (readers[:1], readers):
+            Follow.objects.all().delete()
+            for reader in followers:
+                Follow.objects.create(user=reader, author=self.author_user)
+            counters.get_many(
+                [counters.feed_key(reader.pk) for reader in followers])
+            with CaptureQueriesContext(connection) as captured:
+                Post.objects.create(author=self.author_user, text='Пост')
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+        # Первый пост пришёл при подписке, второй — рассылкой.
+        self.assertEqual(
+            counters.get(counters.feed_key(readers[-1].pk)), 2)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=100)
+    def test_full_timelines_are_trimmed_in_one_delete(self):
+        """Лишние записи удаляются одним запросом у лент сверх лимита."""
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        Follow.objects.create(user=self.fan_user, author=self.author_user)
+        for i in range(3):
+            Post.objects.create(author=self.author_user, text=f'Пост {i}')
+        Follow.objects.create(user=self.reader, author=self.star_user)
+        Post.objects.create(author=self.star_user, text='Звезда')
+        users = [self.reader.pk, self.fan_user.pk]
+        TimelineEntry.objects.filter(user=self.fan_user).first().delete()
+        self.assertEqual(timeline.trim_many(users), {})
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(
+                timeline.trim_many(users, 'default'), {})
+        self.assertEqual(len(captured), 1)
+        post = Post.objects.create(author=self.author_user, text='Новый')
+        self.assertEqual(self.entries(self.reader)[0], post.pk)
+        self.assertEqual(len(self.entries(self.reader)), 3)
+        self.assertEqual(len(self.entries(self.fan_user)), 3)
+        self.assertEqual(
+            counters.get(counters.feed_key(self.reader.pk)), 3)
+
+    def test_celebrity_posts_are_counted_on_read(self):
+        """Пост популярного автора не трогает счётчики лент подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.star_user)
+        Follow.objects.create(user=self.fan_user, author=self.star_user)
+        key = counters.feed_key(self.reader.pk)
+        counters.get(key)
+        Post.objects.create(author=self.star_user, text='Звезда')
+        self.assertEqual(Counter.objects.get(key=key).value, 0)
+        self.assertEqual(timeline.follow_feed(self.reader.pk).total(), 1)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('posts_app:follow_main'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+
+    @override_settings(TIMELINE_MAX_ENTRIES=50)
+    def test_feed_size_is_counted_only_for_numbered_pages(self):
+        """Посты популярных авторов пересчитываются только для ?page=N."""
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        for i in range(12):
+            Post.objects.create(author=self.author_user, text=f'Пост {i}')
+        self.client.force_login(self.reader)
+        url = reverse('posts_app:follow_main')
+        with mock.patch.object(
+                timeline.FollowFeed, 'extra_count', return_value=0) as extra:
+            response = self.client.get(url)
+            self.client.get(
+                url, {'cursor': response.context['page_obj'].next_cursor})
+            self.assertIsNone(response.context['page_obj'].number)
+            extra.assert_not_called()
+            response = self.client.get(url, {'page': 1})
+            self.assertEqual(response.context['page_obj'].number, 1)
+            extra.assert_called_once_with()
+
+    @override_settings(TIMELINE_MAX_ENTRIES=50)
+    def test_feed_page_is_a_range_scan_of_the_timeline(self):
+        """Страница ленты читает записи по индексу с LIMIT и курсором."""
+        Follow.objects.create(user=self.reader, author=self.author_user)
+        posts = [
+            Post.objects.create(author=self.author_user, text=f'Пост {i}')
+            for i in range(5)
+        ]
+        feed = timeline.follow_feed(self.reader.pk).filter(
+            pub_date__lte=posts[3].pub_date)
+        entries = feed._entries().values_list('post_id')[:3]
+        sql, params = entries.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('timeline_user_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertEqual(
+            [post.pk for post in feed[:3]],
+            [post.pk for post in posts[3::-1][:3]],
+        )
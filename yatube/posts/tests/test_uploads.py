@@ -0,0 +1,113 @@
+import hashlib
+import shutil
+import tempfile
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import (Client, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from .. import uploads
+from ..models import Post, User
+from . import workers
+from .test_thumbnails import make_image
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        return self.client.post(
+            reverse('posts_app:post_create'),
+            {'text': 'Пост с картинкой', 'image': image},
+        )
+
+    def test_hash_computed_while_streaming(self):
+        """Имя файла — SHA-256, посчитанный обработчиком загрузки."""
+        image = make_image(size=(300, 200))
+        digest = hashlib.sha256(image.read()).hexdigest()
+        image.seek(0)
+        response = self.create(image)
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        post = Post.objects.get()
+        self.assertIn(digest, post.image.name)
+        self.assertEqual(post.image_format, 'JPEG')
+
+    @override_settings(POST_IMAGE_MAX_BYTES=100)
+    def test_too_large_rejected(self):
+        response = self.create(make_image())
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 100 байт.')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        """Лимит на пиксели проверяется по заголовку."""
+        response = self.create(make_image(size=(40, 20)))
+        self.assertFormError(
+            response, 'form', 'image', 'В картинке больше 100 пикселей.')
+        self.assertFalse(Post.objects.exists())
+
+    def test_broken_images_rejected(self):
+        """Не картинка и обрезанная картинка не проходят проверку."""
+        content = make_image(size=(300, 200)).read()
+        broken = {
+            'not_image.jpg': b'not an image',
+            'truncated.jpg': content[:len(content) // 2],
+        }
+        for name, data in broken.items():
+            with self.subTest(name=name):
+                response = self.create(
+                    SimpleUploadedFile(name, data, 'image/jpeg'))
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertTrue(response.context['form'].errors['image'])
+        self.assertFalse(Post.objects.exists())
+
+    def test_csrf_still_checked(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(
+            reverse('posts_app:post_create'),
+            {'text': 'Пост', 'image': make_image()},
+        )
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.exists())
+
+
+@override_settings(IMAGE_VALIDATION_WORKERS=1, IMAGE_VALIDATION_TIMEOUT=3)
+class ValidationPoolTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(uploads, '_executor', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.stop_pool)
+
+    def stop_pool(self):
+        if uploads._executor is not None:
+            uploads._reset_executor(uploads._executor, terminate=True)
+
+    def test_slow_decode_does_not_starve_next_upload(self):
+        """Зависшее декодирование не занимает пул для следующих загрузок."""
+        upload = make_image()
+        with mock.patch.object(uploads, 'decode_image', workers.slow_decode):
+            with self.assertRaises(TimeoutError):
+                uploads.validate_in_pool(upload)
+        self.assertEqual(uploads.validate_in_pool(upload), 'JPEG')
@@ -118,5 +118,7 @@ class PostURLTests(TestCase):
         ]
         for item in templates_url_names:
             with self.subTest(address=item['url']):
+                # Повторный запрос отдал бы общий кеш страницы без рендера.
+                cache.clear()
                 response = self.authorized_client_author.get(item['url'])
                 self.assertTemplateUsed(response, item['template'])
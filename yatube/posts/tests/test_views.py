@@ -57,6 +57,7 @@ class PostTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.auth_client = Client()
         self.auth_client.force_login(self.auth_user)
@@ -206,14 +207,42 @@ class PostTests(TestCase):
         )
         content_add = self.auth_client.get(
             reverse('posts_app:main')).content
+        Post.objects.filter(pk=post.pk).update(text='Изменено без сигналов')
+        content_cached = self.auth_client.get(
+            reverse('posts_app:main')).content
+        self.assertEqual(content_add, content_cached)
         post.delete()
         content_delete = self.auth_client.get(
             reverse('posts_app:main')).content
-        self.assertEqual(content_add, content_delete)
+        self.assertNotEqual(content_add, content_delete)
+
+    def test_feed_cache_is_page_aware(self):
+        """Каждая страница ленты кешируется под своим ключом, а новый
+        пост сразу появляется в группе и профиле."""
         cache.clear()
-        content_cache_clear = self.auth_client.get(
-            reverse('posts_app:main')).content
-        self.assertNotEqual(content_add, content_cache_clear)
+        Post.objects.bulk_create([
+            Post(text=f'Пост {i}', author=self.author_user)
+            for i in range(12)
+        ])
+        main = reverse('posts_app:main')
+        first = self.guest_client.get(main).content
+        second = self.guest_client.get(main + '?page=2').content
+        self.assertNotEqual(first, second)
+        urls = (
+            reverse('posts_app:group_list', kwargs={'slug': self.group.slug}),
+            reverse(
+                'posts_app:profile',
+                kwargs={'username': self.author_user.username}
+            ),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        post = Post.objects.create(
+            text='Свежий пост', author=self.author_user, group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, post.text)
 
     def test_follow_on_user(self):
         """Проверка подписки на пользователя."""
@@ -0,0 +1,10 @@
+"""Подмены для процессов пула в тестах.
+
+Модуль импортируется в дочернем процессе, где Django не настроен,
+поэтому не тянет за собой модели.
+"""
+import time
+
+
+def slow_decode(source, limit):
+    time.sleep(60)
@@ -0,0 +1,242 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Раньше миниатюру делал первый зритель поста: {% thumbnail %} в шаблоне
+декодировал и масштабировал оригинал прямо в запросе. Теперь после
+сохранения картинки через PostForm миниатюры известных размеров
+строятся в пуле потоков вне запроса, а шаблон только спрашивает
+хранилище sorl, готова ли миниатюра, и до тех пор показывает заглушку.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import db_routers
+
+from . import caching, shards
+from .models import Post, image_storage
+
+logger = logging.getLogger(__name__)
+
+# Варианты картинки поста для srcset: одна обрезка 960x339 в разной
+# ширине, в WebP и без EXIF (sorl пересохраняет картинку без него,
+# предварительно повернув по ориентации). Самый широкий вариант
+# не растягивает маленькие оригиналы.
+VARIANT_OPTIONS = {'crop': 'center', 'format': 'WEBP', 'quality': 80}
+GEOMETRIES = (
+    ('320x113', {**VARIANT_OPTIONS, 'upscale': True}),
+    ('640x226', {**VARIANT_OPTIONS, 'upscale': True}),
+    ('960x339', {**VARIANT_OPTIONS, 'upscale': True}),
+    ('1920x678', {**VARIANT_OPTIONS, 'upscale': False}),
+)
+# Вариант для src у браузеров без srcset.
+DEFAULT_GEOMETRY = '960x339'
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """Хранилище sorl в кеше и базе, умеющее читать записи пачкой."""
+
+    def get_many(self, image_files):
+        """Записи для списка файлов: одно чтение кеша и не больше одного
+        запроса к базе на промахи. Отсутствующие дают None."""
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(
+                KVStoreModel.objects.filter(key__in=missing)
+                .values_list('key', 'value')
+            )
+            loaded = {
+                key: found.get(key, cached_db_kvstore.EMPTY_VALUE)
+                for key in missing
+            }
+            self.cache.set_many(
+                loaded, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(loaded)
+        return [
+            None if values[key] == cached_db_kvstore.EMPTY_VALUE
+            else deserialize_image_file(values[key])
+            for key in keys
+        ]
+
+
+class ReadyThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который умеет только искать готовую миниатюру."""
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра из хранилища sorl или None, без генерации."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры, который построил бы get_thumbnail()."""
+        source = ImageFile(file_)
+        # Те же умолчания, что в ThumbnailBackend.get_thumbnail():
+        # от них зависит имя файла миниатюры.
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+backend = ReadyThumbnailBackend()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def schedule(post):
+    """Ставит миниатюры поста в очередь после фиксации транзакции.
+
+    Задача попадает в _pending только при фиксации: после отката
+    в очереди не остаётся задачи, которая никогда не выполнится
+    и не пускала бы в очередь следующие.
+    """
+    if not post.image:
+        return
+    job = (post.pk, post.image.name)
+    transaction.on_commit(lambda: _submit(job))
+
+
+def _submit(job):
+    with _executor_lock:
+        if job in _pending:
+            return
+        _pending.add(job)
+    get_executor().submit(_run, *job)
+
+
+def generate(post_id, image_name):
+    """Строит миниатюры всех размеров и сбрасывает кеш страниц поста."""
+    post = shards.first(Post.objects.all(), pk=post_id)
+    if post is None:
+        return
+    source = ImageFile(image_name, image_storage)
+    for geometry, options in variants(post):
+        default.backend.get_thumbnail(source, geometry, **options)
+    # Страницы и фрагменты с заглушкой рендерятся заново.
+    caching.bump(caching.post_scope(post.pk), *caching.post_scopes(post))
+
+
+def variants(post):
+    """Размеры, нужные картинке поста: варианты без upscale шире
+    оригинала (ширина известна из post.image_width) не строятся."""
+    return [
+        (geometry, options) for geometry, options in GEOMETRIES
+        if options.get('upscale') or post.image_width is None
+        or int(geometry.split('x')[0]) <= post.image_width
+    ]
+
+
+def _run(post_id, image_name):
+    try:
+        # Пост только что записан: реплика может его ещё не знать.
+        with db_routers.use_primary():
+            generate(post_id, image_name)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', image_name)
+    finally:
+        with _executor_lock:
+            _pending.discard((post_id, image_name))
+        # Соединения с базой у каждого потока свои.
+        connections.close_all()
+
+
+def _variant(geometry, options):
+    return geometry, tuple(sorted(options.items()))
+
+
+def prefetch(posts):
+    """Готовые миниатюры всех размеров для постов одним чтением
+    хранилища sorl; недостающие ставятся в очередь.
+
+    Результат запоминается в постах, и ready_thumbnail() для них уже
+    не обращается к хранилищу.
+    """
+    wanted = [
+        (post, _variant(geometry, options),
+         backend.thumbnail_file(post.image, geometry, **options))
+        for post in posts if post.image
+        for geometry, options in variants(post)
+    ]
+    if not wanted:
+        return
+    found = default.kvstore.get_many([file_ for _, _, file_ in wanted])
+    for (post, variant, _), thumbnail in zip(wanted, found):
+        if not hasattr(post, '_ready_thumbnails'):
+            post._ready_thumbnails = {}
+        post._ready_thumbnails[variant] = thumbnail
+        if thumbnail is None:
+            schedule(post)
+
+
+def ready_thumbnail(post, geometry, **options):
+    """Готовая миниатюра картинки поста; если её нет — в очередь."""
+    if not post.image:
+        return None
+    prefetched = getattr(post, '_ready_thumbnails', {})
+    variant = _variant(geometry, options)
+    if variant in prefetched:
+        return prefetched[variant]
+    thumbnail = backend.get_ready_thumbnail(post.image, geometry, **options)
+    if thumbnail is None:
+        schedule(post)
+    return thumbnail
+
+
+def responsive_image(post):
+    """Готовые варианты картинки поста для <img srcset>.
+
+    Возвращает src и размеры основного варианта и строку srcset
+    с настоящей шириной каждого файла, либо None, если ни один
+    вариант ещё не построен.
+    """
+    ready = {}
+    for geometry, options in variants(post):
+        thumbnail = ready_thumbnail(post, geometry, **options)
+        if thumbnail is not None:
+            ready[geometry] = thumbnail
+    if not ready:
+        return None
+    main = ready.get(DEFAULT_GEOMETRY) or list(ready.values())[-1]
+    widths = {}
+    for thumbnail in ready.values():
+        widths.setdefault(thumbnail.width, thumbnail.url)
+    return {
+        'src': main.url,
+        'width': main.width,
+        'height': main.height,
+        'srcset': ', '.join(
+            f'{url} {width}w' for width, url in sorted(widths.items())
+        ),
+    }
@@ -0,0 +1,318 @@
+"""Материализованная лента подписок.
+
+Новый пост раскладывается в ленты подписчиков автора при сохранении,
+поэтому страница ленты — один проход по индексу (user, -pub_date,
+-post) и выборка постов страницы по id. В ленте хранятся только
+последние TIMELINE_MAX_ENTRIES записей.
+
+Посты авторов, у которых не меньше TIMELINE_FANOUT_LIMIT подписчиков,
+не рассылаются, а подмешиваются к ленте при чтении. Счётчик ленты
+(posts.counters) хранит только число записей, посты таких авторов
+досчитываются при чтении (FollowFeed.total).
+"""
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Count, Q
+
+from . import counters, shards
+from .models import Follow, Post, TimelineEntry
+
+BATCH_SIZE = 500
+
+# Лишние записи лент удаляются одним запросом: номер записи в ленте
+# считается оконной функцией (SQLite 3.25+, PostgreSQL).
+TRIM_SQL = (
+    'DELETE FROM {table} WHERE id IN ('
+    'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+    'PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+    ') AS position FROM {table} WHERE user_id IN ({users})) ranked '
+    'WHERE position > %s)'
+)
+
+
+def max_entries():
+    return getattr(settings, 'TIMELINE_MAX_ENTRIES', 500)
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 1000)
+
+
+def is_celebrity(author_id):
+    followers = counters.get(counters.followers_key(author_id))
+    return followers >= fanout_limit()
+
+
+def trim_many(user_ids, using=None):
+    """Обрезает ленты до лимита и возвращает {пользователь: удалено}.
+
+    Ленты сверх лимита находит один запрос с GROUP BY, лишние записи
+    удаляет один DELETE только по этим лентам. В шардах лимит
+    действует в каждом шарде отдельно: первые записи общей ленты
+    всё равно остаются.
+    """
+    using = using or router.db_for_write(TimelineEntry)
+    limit = max_entries()
+    over = dict(
+        TimelineEntry.objects.using(using).filter(user_id__in=user_ids)
+        .order_by().values('user_id').annotate(entries=Count('pk'))
+        .filter(entries__gt=limit).values_list('user_id', 'entries')
+    )
+    if not over:
+        return {}
+    connection = connections[using]
+    sql = TRIM_SQL.format(
+        table=connection.ops.quote_name(TimelineEntry._meta.db_table),
+        users=', '.join(['%s'] * len(over)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*over, limit])
+    return {user_id: entries - limit for user_id, entries in over.items()}
+
+
+def trim(user_id, using=None):
+    """Удаляет записи ленты сверх лимита и возвращает их число."""
+    return trim_many([user_id], using).get(user_id, 0)
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    user_ids = list(
+        Follow.objects.filter(author_id=post.author_id).values_list(
+            'user_id', flat=True)
+    )
+    if not user_ids:
+        return
+    # Записи лежат в базе поста.
+    TimelineEntry.objects.using(post._state.db).bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post=post,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in user_ids
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trimmed = trim_many(user_ids, post._state.db)
+    # Обычно это один UPDATE: полные ленты не меняют размер.
+    keys_by_delta = defaultdict(list)
+    for user_id in user_ids:
+        delta = 1 - trimmed.get(user_id, 0)
+        keys_by_delta[delta].append(counters.feed_key(user_id))
+    for delta, keys in keys_by_delta.items():
+        counters.incr(keys, delta)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if is_celebrity(author_id):
+        return
+    using = shards.author_db(author_id)
+    recent = Post.objects.using(using).filter(author_id=author_id).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pk', 'pub_date')[:max_entries()]
+    entries = TimelineEntry.objects.using(using).bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in recent
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    counters.incr(
+        [counters.feed_key(user_id)], len(entries) - trim(user_id, using)
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    deleted, _ = TimelineEntry.objects.using(
+        shards.author_db(author_id)
+    ).filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+    counters.incr([counters.feed_key(user_id)], -deleted)
+
+
+def follow_feed(user_id):
+    """Посты ленты подписок: материализованные записи
+    и подмешанные при чтении посты популярных авторов."""
+    author_ids = list(
+        Follow.objects.filter(user_id=user_id).values_list(
+            'author_id', flat=True)
+    )
+    followers = counters.get_many(
+        [counters.followers_key(author_id) for author_id in author_ids]
+    )
+    celebrities = [
+        author_id for author_id in author_ids
+        if followers[counters.followers_key(author_id)] >= fanout_limit()
+    ]
+    return FollowFeed(user_id, celebrities)
+
+
+def _entry_lookups(q):
+    """Условие на посты (pub_date, pk) в виде условия на записи ленты."""
+    children = []
+    for child in q.children:
+        if isinstance(child, Q):
+            children.append(_entry_lookups(child))
+            continue
+        lookup, value = child
+        field, _, rest = lookup.partition('__')
+        if field in ('pk', 'id'):
+            lookup = 'post_id' + ('__' + rest if rest else '')
+        elif field != 'pub_date':
+            raise ValueError(f'Лента подписок не фильтруется по {lookup}.')
+        children.append((lookup, value))
+    return Q._new_instance(children, q.connector, q.negated)
+
+
+class FollowFeed:
+    """Лента подписок, которая ведёт себя как QuerySet в пагинаторах.
+
+    Поддерживает сортировку (-pub_date, -pk) и обратную, filter()
+    по pub_date и pk, count() и срезы. Срез [a:b] берёт первые b
+    записей ленты по индексу (условия курсора переходят на поля
+    записи) и первые b постов популярных авторов, сливает их и
+    загружает посты страницы по id.
+    """
+
+    ordered = True
+    model = Post
+
+    def __init__(self, user_id, celebrities, conditions=(), descending=True):
+        self.user_id = user_id
+        self.celebrities = celebrities
+        self.conditions = conditions
+        self.descending = descending
+        self._result_cache = None
+
+    def __repr__(self):
+        return f'<FollowFeed {self.user_id}>'
+
+    def _clone(self, **kwargs):
+        values = {
+            'conditions': self.conditions,
+            'descending': self.descending,
+            **kwargs,
+        }
+        return FollowFeed(self.user_id, self.celebrities, **values)
+
+    def all(self):
+        return self._clone()
+
+    def filter(self, *args, **kwargs):
+        return self._clone(
+            conditions=(*self.conditions, Q(*args, **kwargs)))
+
+    def order_by(self, *fields):
+        if fields in (('-pub_date', '-pk'), ('-pub_date', '-id')):
+            return self._clone(descending=True)
+        if fields in (('pub_date', 'pk'), ('pub_date', 'id')):
+            return self._clone(descending=False)
+        raise ValueError(f'Лента подписок не сортируется по {fields}.')
+
+    def reverse(self):
+        return self._clone(descending=not self.descending)
+
+    def _ordering(self, date, pk):
+        sign = '-' if self.descending else ''
+        return sign + date, sign + pk
+
+    def _entries(self):
+        return TimelineEntry.objects.filter(
+            *map(_entry_lookups, self.conditions), user_id=self.user_id,
+        ).order_by(*self._ordering('pub_date', 'post_id'))
+
+    def _celebrity_posts(self):
+        return Post.objects.filter(
+            *self.conditions, author_id__in=self.celebrities,
+        ).order_by(*self._ordering('pub_date', 'pk'))
+
+    def extra_count(self):
+        """Посты популярных авторов, которых нет в записях ленты."""
+        if not self.celebrities:
+            return 0
+        return shards.scatter(self._celebrity_posts().exclude(
+            pk__in=TimelineEntry.objects.filter(
+                user_id=self.user_id, author_id__in=self.celebrities,
+            ).values('post_id')
+        )).count()
+
+    def total(self):
+        """Размер всей ленты: счётчик записей и посты популярных авторов."""
+        return (
+            counters.get(counters.feed_key(self.user_id))
+            + self.extra_count()
+        )
+
+    def count(self):
+        return shards.scatter(self._entries()).count() + self.extra_count()
+
+    def exists(self):
+        return bool(self[:1])
+
+    def _fetch(self, stop=None):
+        sources = [
+            queryset.values_list('pub_date', 'post_id')
+            for queryset in shards.each(self._entries())
+        ]
+        if self.celebrities:
+            sources += [
+                queryset.values_list('pub_date', 'pk')
+                for queryset in shards.each(self._celebrity_posts())
+            ]
+        if stop is not None:
+            sources = [queryset[:stop] for queryset in sources]
+        ids, seen = [], set()
+        for _, post_id in heapq.merge(*sources, reverse=self.descending):
+            # Пост популярного автора мог попасть и в записи ленты.
+            if post_id not in seen:
+                seen.add(post_id)
+                ids.append(post_id)
+            if len(ids) == stop:
+                break
+        if not ids:
+            return []
+        found = {}
+        for queryset in shards.each(Post.objects.filter(pk__in=ids)):
+            found.update((post.pk, post) for post in queryset)
+        posts = [found[pk] for pk in ids if pk in found]
+        shards.attach_related(posts)
+        return posts
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            if k.step is not None or (k.start or 0) < 0 or (
+                    k.stop is not None and k.stop < 0):
+                raise ValueError('Поддерживаются только срезы без шага.')
+            if self._result_cache is not None:
+                return self._result_cache[k]
+            return self._fetch(k.stop)[k.start or 0:]
+        return self[k:k + 1][0]
+
+    def __iter__(self):
+        if self._result_cache is None:
+            self._result_cache = self._fetch()
+        return iter(self._result_cache)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __bool__(self):
+        return bool(len(self))
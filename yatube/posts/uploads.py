@@ -0,0 +1,247 @@
+"""Приём картинок постов.
+
+ImageField из Django декодирует загруженный файл прямо в потоке
+запроса, а загрузки до 2,5 МБ держит целиком в памяти. Здесь файл
+картинки пишется во временный файл по мере прихода, по пути
+считается его SHA-256 (его берёт core.storage вместо повторного
+чтения), а лимиты на объём и на число пикселей из заголовка
+проверяются до полного декодирования. Само декодирование идёт
+в небольшом пуле процессов с таймаутом: битая или враждебная
+картинка занимает процесс пула, а не воркер с запросом, а по
+таймауту пул пересоздаётся вместе с зависшим процессом.
+"""
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import wraps
+from io import BytesIO
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+MAX_BYTES = 10 * 1024 * 1024
+MAX_PIXELS = 40_000_000
+WORKERS = 2
+TIMEOUT = 10
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def max_bytes():
+    return getattr(settings, 'POST_IMAGE_MAX_BYTES', MAX_BYTES)
+
+
+def max_pixels():
+    return getattr(settings, 'POST_IMAGE_MAX_PIXELS', MAX_PIXELS)
+
+
+class RejectedUpload(SimpleUploadedFile):
+    """Пустой файл вместо отвергнутой при приёме загрузки.
+
+    Поле формы превращает upload_error в ошибку валидации, и
+    пользователь видит причину, а не «файл не выбран».
+    """
+
+    def __init__(self, name, content_type, error, params=None):
+        super().__init__(name, b'', content_type)
+        self.upload_error = error
+        self.upload_error_params = params or {}
+
+
+class PostImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, считая хеш и объём."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.received = 0
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error:
+            return None
+        self.received += len(raw_data)
+        if self.received > max_bytes():
+            # Остаток тела запроса дочитывается, но не сохраняется.
+            self.error = 'too_large'
+            return None
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.error:
+            self.error = self._check_header()
+        if self.error:
+            self.file.close()
+            return RejectedUpload(
+                self.file_name, self.content_type, self.error,
+                {'max_bytes': max_bytes(), 'max_pixels': max_pixels()},
+            )
+        upload = super().file_complete(file_size)
+        upload.content_hash = self.hasher.hexdigest()
+        return upload
+
+    def _check_header(self):
+        self.file.seek(0)
+        try:
+            # Pillow читает только заголовок: размеры известны
+            # без декодирования пикселей.
+            with Image.open(self.file) as image:
+                width, height = image.size
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return 'invalid_image'
+        if width * height > max_pixels():
+            return 'too_many_pixels'
+        return None
+
+
+def image_upload(view):
+    """Включает для вьюхи PostImageUploadHandler.
+
+    Обработчики загрузки нельзя менять после чтения request.POST,
+    а CsrfViewMiddleware читает его раньше вьюхи. Поэтому проверка
+    CSRF переносится внутрь: сначала обработчик, потом csrf_protect.
+    """
+    protected = csrf_protect(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [PostImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
+
+
+def decode_image(source, limit):
+    """Полностью декодирует картинку и возвращает её формат.
+
+    Выполняется в процессе пула: source — путь к файлу или байты.
+    """
+    Image.MAX_IMAGE_PIXELS = limit
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    with Image.open(source) as image:
+        if image.width * image.height > limit:
+            raise ValueError('Слишком много пикселей')
+        image.verify()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    with Image.open(source) as image:
+        # load() находит обрезанные файлы, которые verify() пропускает.
+        image.load()
+        return image.format
+
+
+def get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'IMAGE_VALIDATION_WORKERS', WORKERS)
+            # spawn, а не fork: форк процесса с потоками (пул миниатюр,
+            # соединения с базой) может унаследовать занятые блокировки.
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            # Очередь пула не растёт бесконечно: ждут не больше
+            # двух картинок на процесс.
+            _slots = threading.BoundedSemaphore(workers * 2)
+    return _executor, _slots
+
+
+def _reset_executor(broken, terminate=False):
+    """Следующая загрузка получит новый пул.
+
+    С terminate=True процессы старого пула убиваются: отменить уже
+    идущее декодирование нельзя, и зависший процесс держал бы место
+    в пуле. Остальные проверки в этом пуле получат BrokenProcessPool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    if terminate:
+        # У ProcessPoolExecutor нет публичного способа убить процессы.
+        for process in list((broken._processes or {}).values()):
+            process.terminate()
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def validate_in_pool(upload):
+    """Формат картинки, декодированной в пуле процессов.
+
+    Бросает ValueError, если картинка не декодируется, и
+    TimeoutError, если пул занят или декодирование слишком долгое.
+    """
+    if hasattr(upload, 'temporary_file_path'):
+        source = upload.temporary_file_path()
+    else:
+        upload.seek(0)
+        source = upload.read()
+    timeout = getattr(settings, 'IMAGE_VALIDATION_TIMEOUT', TIMEOUT)
+    executor, slots = get_executor()
+    if not slots.acquire(timeout=timeout):
+        raise TimeoutError('Пул проверки картинок занят')
+    try:
+        future = executor.submit(decode_image, source, max_pixels())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Декодирование уже идёт: процесс освободит только kill.
+                _reset_executor(executor, terminate=True)
+            raise TimeoutError('Картинка декодируется слишком долго')
+        except BrokenProcessPool:
+            # Процесс пула убит (например, по памяти): следующая
+            # загрузка получит новый пул.
+            _reset_executor(executor)
+            raise ValueError('Процесс проверки картинки упал')
+        except Exception as exc:
+            raise ValueError(str(exc)) from exc
+    finally:
+        slots.release()
+
+
+class PostImageField(forms.ImageField):
+    """ImageField, который декодирует картинку в пуле процессов."""
+    default_error_messages = {
+        'too_large': 'Файл больше %(max_bytes)s байт.',
+        'too_many_pixels': 'В картинке больше %(max_pixels)s пикселей.',
+        'busy': 'Не удалось проверить картинку, попробуйте ещё раз.',
+    }
+
+    def to_python(self, data):
+        error = getattr(data, 'upload_error', None)
+        if error:
+            raise ValidationError(
+                self.error_messages[error],
+                code=error,
+                params=data.upload_error_params,
+            )
+        upload = forms.FileField.to_python(self, data)
+        if upload is None:
+            return None
+        try:
+            image_format = validate_in_pool(upload)
+        except TimeoutError as exc:
+            raise ValidationError(
+                self.error_messages['busy'], code='busy') from exc
+        except ValueError as exc:
+            raise ValidationError(
+                self.error_messages['invalid_image'],
+                code='invalid_image',
+            ) from exc
+        upload.content_type = Image.MIME.get(image_format)
+        upload.seek(0)
+        return upload
@@ -2,68 +2,114 @@ from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
 
+from . import (archive, caching, counters, search, shards, thumbnails,
+               timeline, uploads)
 from .forms import PostForm, CommentForm
 from .models import Post, Group, User, Follow
+from .paginators import CounterPaginator
 
 POSTS_PER_PAGE = 10
 
 
-def get_paginator(items_list, request, page_param='page'):
-    paginator = Paginator(items_list, POSTS_PER_PAGE)
-    page_number = request.GET.get(page_param)
-    return paginator.get_page(page_number)
+def get_paginator(items_list, request, counter_key=None, page_param='page',
+                  cursor_param='cursor', total=None, numbered=True):
+    paginator = CounterPaginator(
+        items_list, POSTS_PER_PAGE, counter_key=counter_key, total=total
+    )
+    number = request.GET.get(page_param)
+    cursor = request.GET.get(cursor_param)
+    if not numbered and number is None and cursor is None:
+        # Первая страница по курсору: без номеров страниц число
+        # записей не считается.
+        cursor = ''
+    return paginator.get_page(number, cursor=cursor)
 
 
+@caching.shared_page
 def index(request):
-    page_obj = get_paginator(Post.objects.all(), request)
+    caching.depends_on(request, caching.INDEX)
+    page_obj = get_paginator(
+        shards.scatter(Post.objects.all()), request, counters.POSTS
+    )
     context = {
         'page_obj': page_obj,
-        'index': True
+        'index': True,
+        **caching.feed_context(caching.INDEX),
     }
     return render(request, 'posts/index.html', context)
 
 
+@caching.shared_page
 def group_list(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    page_obj = get_paginator(group.posts.all(), request)
+    caching.depends_on(
+        request,
+        caching.group_scope(group.pk),
+        caching.group_info_scope(group.pk),
+    )
+    page_obj = get_paginator(
+        shards.scatter(group.posts.all()),
+        request,
+        counters.group_key(group.pk),
+    )
 
     context = {
         'group': group,
         'page_obj': page_obj,
+        **caching.feed_context(caching.group_scope(group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@caching.shared_page
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    page_obj = get_paginator(author.posts.all(), request)
-    following = request.user.is_authenticated and Follow.objects.filter(
-            author=author,
-            user=request.user
-        ).exists()
+    caching.depends_on(
+        request,
+        caching.author_scope(author.pk),
+        caching.user_scope(author.pk),
+        caching.follows_scope(author.pk),
+    )
+    page_obj = get_paginator(
+        archive.with_archive(author.posts.all(), author.pk),
+        request,
+        counters.author_key(author.pk),
+    )
+    stats = counters.get_many(counters.user_keys(author.pk))
     context = {
         'page_obj': page_obj,
         "author": author,
-        "following": following
+        'posts_count': stats[counters.author_key(author.pk)],
+        'followers_count': stats[counters.followers_key(author.pk)],
+        'following_count': stats[counters.following_key(author.pk)],
+        **caching.feed_context(caching.author_scope(author.pk)),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@caching.shared_page
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
-    form = CommentForm()
+    post = archive.get_post_or_404(post_id)
+    caching.depends_on(
+        request,
+        caching.comments_scope(post.pk),
+        caching.author_scope(post.author_id),
+        *caching.fragment_scopes(post),
+    )
+    comments = archive.comments(post)
     context = {
         "post": post,
         'comments': comments,
-        'form': form,
+        'author_posts_count': counters.get(
+            counters.author_key(post.author_id)
+        ),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = shards.get_object_or_404(Post.objects.all(), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -74,9 +120,10 @@ def add_comment(request, post_id):
 
 
 @login_required
+@uploads.image_upload
 def post_edit(request, post_id):
     is_edit = True
-    post = get_object_or_404(Post, pk=post_id)
+    post = shards.get_object_or_404(Post.objects.all(), pk=post_id)
     if post.author != request.user:
         return redirect("posts_app:post_detail", post_id=post_id)
     form = PostForm(
@@ -85,7 +132,9 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect("posts_app:post_detail", post_id=post_id)
     context = {
         "form": form,
@@ -95,12 +144,14 @@ def post_edit(request, post_id):
 
 
 @login_required
+@uploads.image_upload
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect('posts_app:profile', request.user)
     context = {"form": form}
     return render(request, 'posts/post_create.html', context)
@@ -108,8 +159,11 @@ def post_create(request):
 
 @login_required
 def follow_index(request):
-    page_obj = get_paginator(Post.objects.filter(
-        author__following__user=request.user), request)
+    feed = timeline.follow_feed(request.user.pk)
+    # Размер ленты досчитывается по постам популярных авторов, поэтому
+    # он нужен только для ?page=N.
+    page_obj = get_paginator(
+        feed, request, total=feed.total, numbered=False)
     context = {
         'page_obj': page_obj,
         'follow': True
@@ -133,3 +187,15 @@ def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts_app:profile', author.username)
+
+
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    posts = shards.scatter(search.ranked(Post.objects.all(), query))
+    page_obj = Paginator(posts, POSTS_PER_PAGE).get_page(
+        request.GET.get('page'))
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+    }
+    return render(request, 'posts/search.html', context)
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,10 +82,17 @@ TEMPLATES = [
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100_000,
+        },
     }
 }
 
+# Тесты работают со своим временным файлом кеша (core.testing).
+TEST_RUNNER = 'core.testing.TestRunner'
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
@@ -95,8 +103,56 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение переживает запрос: прагмы из SQLITE_PRAGMAS
+        # выполняются при его открытии, а не на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
     }
 }
+# Прагмы для каждого нового соединения SQLite (core.sqlite).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    # Отрицательное значение — размер в КиБ, а не в страницах.
+    'cache_size': -16000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+
+# Реплики только для чтения (core.db_routers). Для проверки на своей
+# машине DB_REPLICAS=2 заводит копии db.replica1.sqlite3 и
+# db.replica2.sqlite3, которые обновляет команда sync_replicas.
+DATABASE_REPLICAS = []
+for number in range(1, int(os.getenv('DB_REPLICAS', '0')) + 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db.{alias}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+        # sync_replicas подменяет файл, долгое соединение читало бы
+        # старую копию.
+        'CONN_MAX_AGE': 0,
+    }
+    DATABASE_REPLICAS.append(alias)
+# Шарды постов по авторам (posts.shards). DB_SHARDS=2 заводит
+# db.shard1.sqlite3 и db.shard2.sqlite3; схему в них (без внешних
+# ключей, core.backends.sqlite_shard) создаёт migrate --database shardN,
+# данные переносит команда reshard.
+DATABASE_SHARDS = []
+for number in range(1, int(os.getenv('DB_SHARDS', '0')) + 1):
+    alias = f'shard{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'core.backends.sqlite_shard',
+        'NAME': os.path.join(BASE_DIR, f'db.{alias}.sqlite3'),
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+    }
+    DATABASE_SHARDS.append(alias)
+DATABASE_ROUTERS = [
+    'posts.shards.ShardRouter',
+    'core.db_routers.ReplicaRouter',
+]
+# Сколько секунд после записи пользователь читает из основной базы.
+REPLICA_STICKY_SECONDS = 10
 
 
 # Password validation
@@ -149,3 +205,10 @@ STATIC_URL = '/static/'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# 'x-accel-redirect' (nginx) или 'x-sendfile': медиа отдаёт прокси.
+# Для nginx MEDIA_ACCEL_PREFIX — internal location, смотрящий
+# в MEDIA_ROOT.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+THUMBNAIL_KVSTORE = 'posts.thumbnails.KVStore'